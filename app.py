@@ -3,141 +3,879 @@
 # Last Updated: 2026-02-06 10:00 AM IST
 # ============================================================
 
-print("\n" + "="*80)
-print("🚀 HONEYPOT SCAM DETECTION SYSTEM V4")
-print("   Version: V4_FORCED_SPACING_WITH_DEBUG")
-print("   Updated: 2026-02-06 10:00 AM IST")
-print("="*80 + "\n")
-
 
 
 # ============================================================
 # BLOCK 1: ENVIRONMENT SETUP WITH GROQ
 # ============================================================
 
-# Install required packages
-print("📦 Installing packages...")
-
-
-print("✅ Packages installed!\n")
-
 # Imports
 import os
 import json
 import time
 import re
 import requests
-from datetime import datetime
-from flask import Flask, request, jsonify
+from datetime import datetime, timezone
+from flask import Flask, Response, request, jsonify
+
+from groq import Groq, RateLimitError
+
+
+# ============================================================
+# STRUCTURED LOGGING
+# ============================================================
+
+import queue
+import random
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener
+
+# LOG_LEVEL gates every component logger; LOG_FORMAT is "json" (one object
+# per line, for the log pipeline) or "text" (local development)
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json').lower()
+
+# Fraction of high-volume DEBUG events (extra={"sampled": True}) that are kept
+LOG_DEBUG_SAMPLE_RATE = float(os.environ.get('LOG_DEBUG_SAMPLE_RATE', 0.1))
+
+# Records beyond this backlog are dropped instead of blocking a request thread
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+
+_RESERVED_LOG_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "sampled"}
+
+
+def _log_fields(record):
+    """Structured fields passed through extra={...}"""
+    return {key: value for key, value in vars(record).items()
+            if key not in _RESERVED_LOG_ATTRS and not key.startswith("_")}
+
+
+class JSONLogFormatter(logging.Formatter):
+    def format(self, record):
+        ts = datetime.fromtimestamp(record.created, timezone.utc)
+        entry = {
+            "ts": ts.isoformat(timespec="milliseconds").replace("+00:00", "Z"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(_log_fields(record))
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextLogFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        fields = _log_fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+class DebugSampler(logging.Filter):
+    """Keep only LOG_DEBUG_SAMPLE_RATE of DEBUG records marked as sampled"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno <= logging.DEBUG and getattr(record, "sampled", False):
+            return random.random() < self.rate
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hands records to the listener thread; drops (and counts) when the queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
 
-from groq import Groq
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging():
+    root = logging.getLogger("honeypot")
+    root.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+    root.propagate = False
+    if root.handlers:
+        return root.handlers[0]
+
+    stream = logging.StreamHandler()
+    stream.setFormatter(JSONLogFormatter() if LOG_FORMAT == "json" else TextLogFormatter())
+
+    handler = NonBlockingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    handler.addFilter(DebugSampler(LOG_DEBUG_SAMPLE_RATE))
+    root.addHandler(handler)
+
+    listener = QueueListener(handler.queue, stream, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return handler
+
+
+def get_logger(component):
+    return logging.getLogger(f"honeypot.{component}")
+
+
+_log_handler = configure_logging()
+log = get_logger("app")
+
+log.debug("Honeypot scam detection system starting", extra={"version": "V4_FORCED_SPACING_WITH_DEBUG"})
+
+
+
+# ============================================================
+# METRICS (Prometheus)
+# ============================================================
+#
+# Under gunicorn, PROMETHEUS_MULTIPROC_DIR is set by gunicorn.conf.py so every
+# worker writes its samples to a shared directory and /metrics aggregates
+# them; without it the metrics are per-process (app.run / local testing).
+
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+)
+from prometheus_client import multiprocess
+
+_FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+_SLOW_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 7.5, 10.0, 15.0, 30.0)
+
+LIMITER_WAIT = Histogram(
+    "honeypot_limiter_wait_seconds", "Time a Groq call queued for rate-limit admission",
+    buckets=_SLOW_BUCKETS)
+GROQ_LATENCY = Histogram(
+    "honeypot_groq_request_seconds", "Groq chat completion latency per attempt",
+    ["outcome"], buckets=_SLOW_BUCKETS)
+DETECTION_LATENCY = Histogram(
+    "honeypot_detection_seconds", "Regex scam detection time per message",
+    buckets=_FAST_BUCKETS)
+EXTRACTION_LATENCY = Histogram(
+    "honeypot_extraction_seconds", "Entity extraction time per turn",
+    buckets=_FAST_BUCKETS)
+PACING_SLEEP = Histogram(
+    "honeypot_pacing_sleep_seconds", "Human-typing pause added after processing",
+    buckets=_SLOW_BUCKETS)
+PROMPT_TOKENS = Histogram(
+    "honeypot_prompt_tokens", "Prompt tokens per Groq request",
+    buckets=(250, 500, 750, 1000, 1250, 1500, 2000, 3000, 4000, 6000, 8000))
+PROMPT_CACHED_TOKENS = Counter(
+    "honeypot_prompt_cached_tokens_total", "Prompt tokens the provider served from its prefix cache")
+RESPONSE_CACHE = Counter(
+    "honeypot_response_cache_total", "Response cache lookups by result (hit, miss, explore)", ["result"])
+HEDGED_REQUESTS = Counter(
+    "honeypot_hedged_requests_total",
+    "Second Groq requests per turn and who answered "
+    "(hedge, retry, failover, *_won, skipped_budget, hedge_refused, slo_miss)",
+    ["event"])
+SPECULATION_OUTCOMES = Counter(
+    "honeypot_speculation_total", "Speculative pacing races by result", ["outcome"])
+LLM_CONNECTION_SETUP = Histogram(
+    "honeypot_llm_connection_setup_seconds", "New Groq connection setup time by stage (connect, tls)",
+    ["stage"], buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0))
+CALLBACK_LATENCY = Histogram(
+    "honeypot_callback_delivery_seconds", "GUVI callback delivery time per attempt",
+    ["outcome"], buckets=_SLOW_BUCKETS)
+CALLBACK_LAG = Histogram(
+    "honeypot_callback_lag_seconds", "GUVI callback time from enqueue to confirmed delivery (retries included)",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 900.0, 1800.0))
+# Every worker reads the same outbox file, so take the max rather than summing
+CALLBACK_BACKLOG = Gauge(
+    "honeypot_callback_backlog", "GUVI callbacks pending or in flight in the outbox", multiprocess_mode="livemax")
+
+GROQ_RATE_LIMITED = Counter("honeypot_groq_rate_limited_total", "Groq responses with HTTP 429")
+ADMISSION_REJECTED = Counter(
+    "honeypot_admission_rejected_total", "Groq calls rejected because quota could not make the deadline")
+FALLBACKS_SERVED = Counter(
+    "honeypot_fallbacks_total", "Replies served without the LLM because it was unavailable (local tier or smart fallback)")
+SESSIONS_CREATED = Counter("honeypot_sessions_created_total", "Sessions created")
+SESSIONS_EVICTED = Counter("honeypot_sessions_evicted_total", "Sessions evicted from memory", ["reason"])
+CALLBACKS_SENT = Counter("honeypot_callbacks_total", "GUVI callback delivery attempts", ["outcome"])
+BREAKER_SHORT_CIRCUITS = Counter(
+    "honeypot_breaker_short_circuits_total", "Turns sent straight to the fallback by the open Groq breaker")
+BREAKER_TRANSITIONS = Counter(
+    "honeypot_breaker_transitions_total", "Groq circuit breaker state changes", ["state"])
+CONCURRENCY_REJECTED = Counter(
+    "honeypot_concurrency_rejected_total", "Groq calls refused by the adaptive in-flight limit")
+LLM_ROUTE_CALLS = Counter(
+    "honeypot_llm_route_calls_total", "Groq attempts per route (API key x model) by outcome", ["route", "outcome"])
+LOCAL_TIER = Counter(
+    "honeypot_local_tier_total", "Local reply tier turns by outcome (routed, fallback, miss)", ["outcome"])
+
+
+def render_metrics():
+    """Exposition text for /metrics, aggregated across workers in multiprocess mode"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry)
 
 
 
 # ============================================================
-# REQUEST VELOCITY CONTROL (Smart Rate Limiting - FIXED)
+# REQUEST VELOCITY CONTROL (Token-Bucket Admission Scheduler)
 # ============================================================
 
 import time
+import sqlite3
+import tempfile
+import threading
 from threading import Lock
-from collections import deque
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
 
-class RateLimitTracker:
-    def __init__(self, rpm_limit=20):
-        print("="*80)
-        print("🔥🔥🔥 INITIALIZING NEW RATE LIMITER V4 🔥🔥🔥")
-        print("="*80)
-        self.rpm_limit = rpm_limit
-        self.request_times = deque()
+# Provider quota (override per deployment). These are starting points: the
+# limiter tightens to Groq's rate-limit headers and learns its TPM ceiling.
+GROQ_RPM_LIMIT = int(os.environ.get('GROQ_RPM_LIMIT', 20))
+GROQ_TPM_LIMIT = int(os.environ.get('GROQ_TPM_LIMIT', 30000))
+GROQ_BURST = int(os.environ.get('GROQ_BURST', 3))
+
+# Model every turn is sent to; each model has its own quota bucket
+GROQ_MODEL = os.environ.get('GROQ_MODEL', 'meta-llama/llama-4-scout-17b-16e-instruct')
+
+# Per-model overrides, JSON: {"llama-3.1-8b-instant": {"rpm": 30, "tpm": 6000, "burst": 5}}
+GROQ_MODEL_LIMITS = json.loads(os.environ.get('GROQ_MODEL_LIMITS') or '{}')
+
+# Jittered exponential backoff before retrying a failed Groq call
+LLM_BACKOFF_BASE = float(os.environ.get('LLM_BACKOFF_BASE', 0.5))
+LLM_BACKOFF_CAP = float(os.environ.get('LLM_BACKOFF_CAP', 8.0))
+
+# Longest a turn may queue for quota before it is routed to the fallback
+LLM_ADMISSION_BUDGET = float(os.environ.get('LLM_ADMISSION_BUDGET', 10.0))
+
+# Where bucket state lives: "sqlite" is shared by every worker on the host,
+# "memory" is per-process (single worker / local testing only)
+QUOTA_BACKEND = os.environ.get('QUOTA_BACKEND', 'sqlite')
+QUOTA_DB_PATH = os.environ.get('QUOTA_DB_PATH', os.path.join(tempfile.gettempdir(), 'honeypot_quota.db'))
+# How long an admission probe waits for another worker's ledger write lock;
+# past that the bucket is treated as "not ready" and the head re-polls.
+# Kept short because SQLite's busy handler sleeps in C (stalls a gevent hub)
+QUOTA_BUSY_TIMEOUT_MS = int(os.environ.get('QUOTA_BUSY_TIMEOUT_MS', 20))
+
+ratelimit_log = get_logger("ratelimit")
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted before its deadline"""
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 chars per token) for TPM accounting"""
+    return len(text) // 4 + 1
+
+
+def _refill_bucket(state, limits, now):
+    """Top up a bucket state dict in place (shared by every quota backend)"""
+    elapsed = max(0.0, now - state["updated"])
+    state["updated"] = now
+    state["request_tokens"] = min(limits["burst"], state["request_tokens"] + elapsed * limits["rpm"] / 60.0)
+    state["token_tokens"] = min(limits["tpm"], state["token_tokens"] + elapsed * limits["tpm"] / 60.0)
+
+
+def _bucket_wait(state, limits, tokens, now):
+    """Seconds until the bucket can pay for one request and `tokens` tokens"""
+    tokens = min(tokens, limits["tpm"])
+    wait_requests = max(0.0, 1 - state["request_tokens"]) * 60.0 / limits["rpm"]
+    wait_tokens = max(0.0, tokens - state["token_tokens"]) * 60.0 / limits["tpm"]
+    wait_blocked = max(0.0, state.get("blocked_until", 0.0) - now)
+    return max(wait_requests, wait_tokens, wait_blocked)
+
+
+def _parse_duration(value):
+    """Groq reset headers: "7.66s", "2m59.56s", "1h2m", "120ms" -> seconds"""
+    if not value:
+        return None
+    parts = re.findall(r'(\d+(?:\.\d+)?)(ms|h|m|s)', str(value))
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    scale = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+    return sum(float(number) * scale[unit] for number, unit in parts)
+
+
+def _parse_retry_after(value):
+    """retry-after is delta-seconds or an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_rate_limit_headers(headers):
+    """The provider's own view of our quota, from a response's (or a 429's) headers"""
+    if not headers:
+        return {}
+
+    def number(name):
+        try:
+            return float(headers.get(name))
+        except (TypeError, ValueError):
+            return None
+
+    view = {
+        "retry_after": _parse_retry_after(headers.get("retry-after")),
+        "limit_requests": number("x-ratelimit-limit-requests"),
+        "remaining_requests": number("x-ratelimit-remaining-requests"),
+        "reset_requests": _parse_duration(headers.get("x-ratelimit-reset-requests")),
+        "limit_tokens": number("x-ratelimit-limit-tokens"),
+        "remaining_tokens": number("x-ratelimit-remaining-tokens"),
+        "reset_tokens": _parse_duration(headers.get("x-ratelimit-reset-tokens")),
+    }
+    return {key: value for key, value in view.items() if value is not None}
+
+
+# ============================================================
+# SQLITE CONNECTIONS (quota ledger, session store, callback outbox)
+# ============================================================
+#
+# Each store draws from a small per-process pool. A connection per thread
+# does not work under gevent: threading.local is greenlet-local once
+# patched, so every request greenlet would open its own connections (and
+# re-run the PRAGMAs) and never close them.
+#
+# SQLite calls are blocking C calls: under gevent they stall the whole hub
+# while they run, and while they wait on another worker's write lock. Keep
+# transactions short, and busy timeouts low on the hot path.
+
+SQLITE_POOL_SIZE = int(os.environ.get('SQLITE_POOL_SIZE', 4))
+
+
+class SQLitePool:
+    """
+    Up to `size` connections to one database file, shared by every
+    thread/greenlet. Waiters are served first come, first served: a
+    returned connection goes straight to the longest waiter.
+    """
+
+    def __init__(self, path, size=SQLITE_POOL_SIZE, timeout=5.0):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.idle = []
+        self.waiters = deque()   # {"event", "conn"} per blocked checkout
+        self.opened = 0
         self.lock = Lock()
-        self.min_interval = 6
-        self.last_request = 0
-        print(f"🔥 Configuration:")
-        print(f"   RPM Limit: {self.rpm_limit}")
-        print(f"   Min Interval: {self.min_interval}s")
-        print(f"   Version: V4_WITH_FORCED_SPACING")
-        print("="*80)
-    
-    def wait_if_needed(self):
-        print(f"\n{'='*80}")
-        print(f"🔥🔥🔥 WAIT_IF_NEEDED CALLED 🔥🔥🔥")
-        print(f"{'='*80}")
-        
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _checkout(self):
+        while True:
+            with self.lock:
+                if self.idle:
+                    return self.idle.pop()
+                if self.opened < self.size:
+                    self.opened += 1
+                    break
+                slot = {"event": threading.Event(), "conn": None}
+                self.waiters.append(slot)
+            slot["event"].wait()
+            if slot["conn"] is not None:
+                return slot["conn"]
+        try:
+            return self._open()
+        except Exception:
+            with self.lock:
+                self.opened -= 1
+                if self.waiters:
+                    self.waiters.popleft()["event"].set()   # it may open one instead
+            raise
+
+    def _checkin(self, conn):
         with self.lock:
-            now = time.time()
-            print(f"🔥 Current time: {now}")
-            print(f"🔥 Last request time: {self.last_request}")
-            
-            # ENFORCE MINIMUM INTERVAL
-            if self.last_request > 0:
-                time_since_last = now - self.last_request
-                print(f"🔥 Time since last request: {time_since_last:.2f}s")
-                print(f"🔥 Min interval required: {self.min_interval}s")
-                
-                if time_since_last < self.min_interval:
-                    wait_time = self.min_interval - time_since_last
-                    print(f"🔥🔥🔥 NEED TO WAIT: {wait_time:.2f}s 🔥🔥🔥")
-                    print(f"🔥🔥🔥 SLEEPING NOW... 🔥🔥🔥")
-                    time.sleep(wait_time)
-                    print(f"🔥🔥🔥 SLEEP COMPLETE! 🔥🔥🔥")
-                else:
-                    print(f"🔥 ✅ No wait needed (already {time_since_last:.2f}s since last)")
+            if self.waiters:
+                slot = self.waiters.popleft()
+                slot["conn"] = conn
+                slot["event"].set()
             else:
-                print(f"🔥 First request ever - no wait needed")
-            
-            # Clean old requests
-            old_count = len(self.request_times)
-            while self.request_times and now - self.request_times[0] > 60:
-                self.request_times.popleft()
-            cleaned = old_count - len(self.request_times)
-            if cleaned > 0:
-                print(f"🔥 Cleaned {cleaned} old requests from queue")
-            
-            # RPM limit check
-            if len(self.request_times) >= self.rpm_limit:
-                oldest = self.request_times[0]
-                wait_time = 60 - (now - oldest) + 1.0
-                print(f"🔥🔥🔥 RPM LIMIT HIT: waiting {wait_time:.1f}s 🔥🔥🔥")
-                time.sleep(wait_time)
-                print(f"🔥🔥🔥 RPM WAIT COMPLETE 🔥🔥🔥")
-            
-            # Record request
-            self.request_times.append(time.time())
-            self.last_request = time.time()
-            
-            print(f"🔥 Request recorded!")
-            print(f"🔥 Queue size: {len(self.request_times)}/{self.rpm_limit}")
-            print(f"🔥 Last request timestamp updated to: {self.last_request}")
-            print(f"{'='*80}\n")
-    
+                self.idle.append(conn)
+
+    @contextmanager
+    def connection(self):
+        """Check a connection out (waits if all `size` are in use); never nest two checkouts"""
+        conn = self._checkout()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            self._checkin(conn)
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+            self.opened -= len(idle)
+        for conn in idle:
+            conn.close()
+
+
+class QuotaBackend:
+    """
+    Storage for token-bucket state
+
+    Implementations must make try_acquire() atomic for every process that
+    shares the backend. Subclass this for a networked store (Redis, etc.).
+    """
+
+    name = "base"
+
+    def __init__(self):
+        self.limits = {}
+
+    def configure(self, bucket, rpm, tpm, burst):
+        self.limits[bucket] = {"rpm": rpm, "tpm": tpm, "burst": max(1, min(burst, rpm))}
+
+    def try_acquire(self, bucket, tokens, now):
+        """Consume one request + `tokens` if available. Returns 0 if granted, else seconds to wait"""
+        raise NotImplementedError
+
+    def adjust(self, bucket, token_delta):
+        """Credit (or debit) the token bucket after real usage is known"""
+        raise NotImplementedError
+
+    def sync(self, bucket, now, token_tokens=None, blocked_until=None):
+        """Fold in the provider's view: never more tokens than it says remain, no grants before blocked_until"""
+        raise NotImplementedError
+
+    def usage(self, bucket, now):
+        """Global view: {used, request_tokens, token_tokens, last_request}"""
+        raise NotImplementedError
+
+
+class MemoryQuotaBackend(QuotaBackend):
+    """Per-process bucket state (only correct with a single worker)"""
+
+    name = "memory"
+
+    def __init__(self):
+        super().__init__()
+        self.lock = Lock()
+        self.states = {}
+        self.grants = {}
+
+    def _state(self, bucket, now):
+        if bucket not in self.states:
+            limits = self.limits[bucket]
+            self.states[bucket] = {"request_tokens": float(limits["burst"]), "token_tokens": float(limits["tpm"]),
+                                   "updated": now, "last_request": 0, "blocked_until": 0.0}
+            self.grants[bucket] = deque()
+        state = self.states[bucket]
+        _refill_bucket(state, self.limits[bucket], now)
+        grants = self.grants[bucket]
+        while grants and now - grants[0] > 60:
+            grants.popleft()
+        return state
+
+    def try_acquire(self, bucket, tokens, now):
+        with self.lock:
+            state = self._state(bucket, now)
+            limits = self.limits[bucket]
+            wait = _bucket_wait(state, limits, tokens, now)
+            if wait > 0:
+                return wait
+            state["request_tokens"] -= 1
+            state["token_tokens"] -= min(tokens, limits["tpm"])
+            state["last_request"] = now
+            self.grants[bucket].append(now)
+            return 0.0
+
+    def adjust(self, bucket, token_delta):
+        with self.lock:
+            state = self._state(bucket, time.time())
+            state["token_tokens"] += token_delta
+
+    def sync(self, bucket, now, token_tokens=None, blocked_until=None):
+        with self.lock:
+            state = self._state(bucket, now)
+            if token_tokens is not None:
+                state["token_tokens"] = min(state["token_tokens"], token_tokens)
+            if blocked_until:
+                state["blocked_until"] = max(state["blocked_until"], blocked_until)
+
+    def usage(self, bucket, now):
+        with self.lock:
+            state = self._state(bucket, now)
+            return {"used": len(self.grants[bucket]), "request_tokens": state["request_tokens"],
+                    "token_tokens": state["token_tokens"], "last_request": state["last_request"],
+                    "blocked_until": state["blocked_until"]}
+
+
+class SQLiteQuotaBackend(QuotaBackend):
+    """
+    Host-wide bucket state in a small SQLite ledger
+
+    Every gunicorn worker opens the same file; BEGIN IMMEDIATE takes the
+    write lock, so read-refill-consume is atomic across processes.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.pool = SQLitePool(path)
+        with self.pool.connection() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS quota_buckets (
+                bucket TEXT PRIMARY KEY, request_tokens REAL, token_tokens REAL,
+                updated REAL, last_request REAL, blocked_until REAL DEFAULT 0)""")
+            try:
+                # Ledgers created before provider headers were honoured
+                conn.execute("ALTER TABLE quota_buckets ADD COLUMN blocked_until REAL DEFAULT 0")
+            except sqlite3.OperationalError:
+                pass
+            conn.execute("CREATE TABLE IF NOT EXISTS quota_grants (bucket TEXT, ts REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_quota_grants ON quota_grants (bucket, ts)")
+
+    def _load(self, conn, bucket, now):
+        row = conn.execute("SELECT request_tokens, token_tokens, updated, last_request, blocked_until "
+                           "FROM quota_buckets WHERE bucket = ?", (bucket,)).fetchone()
+        limits = self.limits[bucket]
+        if row is None:
+            state = {"request_tokens": float(limits["burst"]), "token_tokens": float(limits["tpm"]),
+                     "updated": now, "last_request": 0, "blocked_until": 0.0}
+        else:
+            state = {"request_tokens": row[0], "token_tokens": row[1], "updated": row[2], "last_request": row[3],
+                     "blocked_until": row[4] or 0.0}
+        _refill_bucket(state, limits, now)
+        return state
+
+    def _store(self, conn, bucket, state):
+        conn.execute("INSERT OR REPLACE INTO quota_buckets "
+                     "(bucket, request_tokens, token_tokens, updated, last_request, blocked_until) "
+                     "VALUES (?, ?, ?, ?, ?, ?)",
+                     (bucket, state["request_tokens"], state["token_tokens"], state["updated"],
+                      state["last_request"], state["blocked_until"]))
+
+    def try_acquire(self, bucket, tokens, now):
+        with self.pool.connection() as conn:
+            return self._try_acquire(conn, bucket, tokens, now)
+
+    def _try_acquire(self, conn, bucket, tokens, now):
+        conn.execute(f"PRAGMA busy_timeout = {QUOTA_BUSY_TIMEOUT_MS}")
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e) and "busy" not in str(e):
+                raise
+            # Another worker holds the ledger: not ready yet, poll again shortly
+            return max(0.005, QUOTA_BUSY_TIMEOUT_MS / 1000.0)
+        finally:
+            conn.execute("PRAGMA busy_timeout = 5000")
+        try:
+            state = self._load(conn, bucket, now)
+            limits = self.limits[bucket]
+            wait = _bucket_wait(state, limits, tokens, now)
+            if wait <= 0:
+                state["request_tokens"] -= 1
+                state["token_tokens"] -= min(tokens, limits["tpm"])
+                state["last_request"] = now
+                conn.execute("INSERT INTO quota_grants VALUES (?, ?)", (bucket, now))
+                conn.execute("DELETE FROM quota_grants WHERE bucket = ? AND ts < ?", (bucket, now - 60))
+            self._store(conn, bucket, state)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return max(0.0, wait)
+
+    def adjust(self, bucket, token_delta):
+        with self.pool.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                state = self._load(conn, bucket, time.time())
+                state["token_tokens"] += token_delta
+                self._store(conn, bucket, state)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def sync(self, bucket, now, token_tokens=None, blocked_until=None):
+        with self.pool.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                state = self._load(conn, bucket, now)
+                if token_tokens is not None:
+                    state["token_tokens"] = min(state["token_tokens"], token_tokens)
+                if blocked_until:
+                    state["blocked_until"] = max(state["blocked_until"], blocked_until)
+                self._store(conn, bucket, state)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def usage(self, bucket, now):
+        with self.pool.connection() as conn:
+            state = self._load(conn, bucket, now)
+            used = conn.execute("SELECT COUNT(*) FROM quota_grants WHERE bucket = ? AND ts >= ?",
+                                (bucket, now - 60)).fetchone()[0]
+        return {"used": used, "request_tokens": state["request_tokens"],
+                "token_tokens": state["token_tokens"], "last_request": state["last_request"],
+                "blocked_until": state["blocked_until"]}
+
+
+def create_quota_backend(kind=QUOTA_BACKEND):
+    if kind == "sqlite":
+        try:
+            return SQLiteQuotaBackend(QUOTA_DB_PATH)
+        except sqlite3.Error as e:
+            ratelimit_log.warning("Quota ledger unavailable, falling back to per-process buckets",
+                                  extra={"error": str(e)})
+    return MemoryQuotaBackend()
+
+
+class TokenBucketScheduler:
+    """
+    Non-blocking admission control for Groq calls
+
+    - Two token buckets: requests (RPM) and tokens (TPM), kept in a
+      QuotaBackend so every worker draws from the same quota
+    - Waiters never sleep while holding the lock (Condition.wait releases it),
+      and the head calls the ledger with the lock released
+    - Fair: sessions are served round-robin, so one chatty session
+      cannot starve the others
+    - Deadline-aware: if the estimated wait exceeds the caller's deadline
+      the request is rejected immediately (caller serves the fallback)
+    - Provider-aware: Groq's retry-after and x-ratelimit-* headers close
+      the bucket until the reset, cap the token balance at what Groq says
+      remains, and replace the configured TPM with the reported limit
+    """
+
+    def __init__(self, backend, rpm_limit=20, tpm_limit=30000, burst=3, bucket="groq", model=None):
+        self.backend = backend
+        self.bucket = bucket
+        self.model = model
+        self.rpm_limit = rpm_limit
+        self.tpm_limit = tpm_limit
+        self.burst = burst
+        self.backend.configure(bucket, rpm_limit, tpm_limit, burst)
+        self.lock = Lock()
+        self.cond = threading.Condition(self.lock)
+        self.queues = OrderedDict()    # session_id -> deque of waiting tickets
+        self.head_wait = 0.0           # last wait the head of the queue was told
+        self.rejected = 0
+        self.failure_streak = 0        # consecutive failed calls (drives backoff)
+        self.provider = {}             # last parsed rate-limit headers
+        self.provider_counters = {"throttled": 0, "syncs": 0, "retryAfterBlocks": 0}
+        ratelimit_log.info("Token-bucket scheduler ready", extra={
+            "bucket": bucket, "rpm": rpm_limit, "tpm": tpm_limit, "burst": burst, "backend": backend.name})
+
+    # ---------- fair queue (call with lock held) ----------
+
+    def _position(self, key, ticket):
+        """Approximate number of grants ahead of this ticket in round-robin order"""
+        sessions = list(self.queues.keys())
+        own_index = self.queues[key].index(ticket)
+        return own_index * len(sessions) + sessions.index(key)
+
+    def _is_head(self, key, ticket):
+        first_key = next(iter(self.queues))
+        return first_key == key and self.queues[key][0] is ticket
+
+    def _dequeue(self, key, ticket):
+        queue = self.queues.get(key)
+        if queue is None or ticket not in queue:
+            return
+        queue.remove(ticket)
+        if queue:
+            self.queues.move_to_end(key)   # round-robin: session goes to the back
+        else:
+            del self.queues[key]
+
+    # ---------- public API ----------
+
+    def acquire(self, session_id=None, tokens=1, deadline=None):
+        """
+        Wait (without blocking other threads) until one request and `tokens`
+        TPM tokens are available. Returns seconds spent queued.
+        Raises AdmissionRejected if that would overrun `deadline`.
+        """
+        key = session_id or "_anonymous"
+        ticket = object()
+        start = time.time()
+
+        with self.cond:
+            self.queues.setdefault(key, deque()).append(ticket)
+        try:
+            while True:
+                now = time.time()
+                with self.cond:
+                    is_head = self._is_head(key, ticket)
+
+                if is_head:
+                    # Only the head touches the ledger, and it does so without the
+                    # condition held: a slow SQLite write lock must not stall
+                    # every other waiter on this scheduler
+                    wait = self.backend.try_acquire(self.bucket, tokens, now)
+                    if wait <= 0:
+                        return now - start
+
+                with self.cond:
+                    if is_head:
+                        self.head_wait = wait
+                    elif self._is_head(key, ticket):
+                        continue                # promoted while we were unlocked
+                    else:
+                        wait = self.head_wait + self._position(key, ticket) * 60.0 / self.rpm_limit
+
+                    if deadline is not None and now + wait > deadline:
+                        self.rejected += 1
+                        raise AdmissionRejected(
+                            f"quota wait {wait:.1f}s exceeds deadline ({deadline - now:.1f}s left)"
+                        )
+
+                    timeout = wait if deadline is None else min(wait, deadline - now)
+                    self.cond.wait(timeout=max(0.01, timeout))
+        finally:
+            with self.cond:
+                self._dequeue(key, ticket)
+                self.cond.notify_all()
+
+    def reconcile(self, estimated_tokens, actual_tokens):
+        """Correct the TPM bucket once the provider reports real usage"""
+        if not actual_tokens:
+            return
+        self.backend.adjust(self.bucket, min(estimated_tokens, self.tpm_limit) - actual_tokens)
+
+    def observe_provider(self, headers, throttled=False):
+        """Fold a Groq response's (or 429's) rate-limit headers into the bucket"""
+        view = parse_rate_limit_headers(headers)
+        with self.lock:
+            if throttled:
+                self.provider_counters["throttled"] += 1
+            if not view:
+                return
+            self.provider = view
+            self.provider_counters["syncs"] += 1
+
+        now = time.time()
+        blocked_until = None
+        if "retry_after" in view:
+            blocked_until = now + view["retry_after"]
+            with self.lock:
+                self.provider_counters["retryAfterBlocks"] += 1
+        if view.get("remaining_requests") == 0 and "reset_requests" in view:
+            blocked_until = max(blocked_until or 0.0, now + view["reset_requests"])
+        if view.get("remaining_tokens") == 0 and "reset_tokens" in view:
+            blocked_until = max(blocked_until or 0.0, now + view["reset_tokens"])
+
+        limit_tokens = int(view.get("limit_tokens", 0))
+        if limit_tokens and limit_tokens != self.tpm_limit:
+            ratelimit_log.info("Learned TPM limit from provider", extra={
+                "bucket": self.bucket, "configured": self.tpm_limit, "reported": limit_tokens})
+            self.tpm_limit = limit_tokens
+            self.backend.configure(self.bucket, self.rpm_limit, self.tpm_limit, self.burst)
+
+        self.backend.sync(self.bucket, now, token_tokens=view.get("remaining_tokens"), blocked_until=blocked_until)
+        if blocked_until:
+            ratelimit_log.info("Provider closed the admission window", extra={
+                "bucket": self.bucket, "seconds": round(blocked_until - now, 2), "throttled": throttled})
+
+    def ready_in(self, tokens=1):
+        """Seconds until a new request here could be admitted (bucket wait + queue ahead of it)"""
+        now = time.time()
+        usage = self.backend.usage(self.bucket, now)
+        with self.lock:
+            queued = sum(len(q) for q in self.queues.values())
+        return _bucket_wait(usage, self.backend.limits[self.bucket], tokens, now) + queued * 60.0 / self.rpm_limit
+
+    def record_result(self, failed):
+        with self.lock:
+            self.failure_streak = self.failure_streak + 1 if failed else 0
+
+    def backoff(self):
+        """Equal-jitter exponential backoff: half the step fixed, half random"""
+        with self.lock:
+            streak = self.failure_streak
+        step = min(LLM_BACKOFF_CAP, LLM_BACKOFF_BASE * 2 ** max(0, streak - 1))
+        return step / 2 + random.uniform(0, step / 2)
+
     def get_status(self):
+        now = time.time()
+        usage = self.backend.usage(self.bucket, now)
+        limits = self.backend.limits[self.bucket]
+        used = usage["used"]
+        time_since_last = now - usage["last_request"] if usage["last_request"] > 0 else 999
         with self.lock:
-            now = time.time()
-            while self.request_times and now - self.request_times[0] > 60:
-                self.request_times.popleft()
-            used = len(self.request_times)
-            remaining = self.rpm_limit - used
-            time_since_last = now - self.last_request if self.last_request > 0 else 999
-            return {
-                "used": used,
-                "remaining": remaining,
-                "limit": self.rpm_limit,
-                "time_since_last": f"{time_since_last:.1f}s",
-                "ready_in": f"{max(0, self.min_interval - time_since_last):.1f}s",
-                "version": "V4_WITH_FORCED_SPACING"
-            }
+            queued = sum(len(q) for q in self.queues.values())
+            provider = dict(self.provider)
+            provider.update(self.provider_counters)
+            streak = self.failure_streak
+        return {
+            "model": self.model,
+            "used": used,
+            "remaining": max(0, self.rpm_limit - used),
+            "limit": self.rpm_limit,
+            "time_since_last": f"{time_since_last:.1f}s",
+            "ready_in": f"{_bucket_wait(usage, limits, 1, now):.1f}s",
+            "blocked_for": f"{max(0.0, usage['blocked_until'] - now):.1f}s",
+            "tpm_limit": self.tpm_limit,
+            "tpm_available": int(max(0, usage["token_tokens"])),
+            "queued": queued,
+            "rejected": self.rejected,
+            "failure_streak": streak,
+            "provider": provider,
+            "backend": self.backend.name,
+            "version": "V6_PROVIDER_AWARE"
+        }
+
 
-# ✅ CREATE ONLY ONE INSTANCE
-rate_limiter = RateLimitTracker(rpm_limit=20)
+# ✅ ONE SCHEDULER PER API KEY x MODEL (state is shared through the quota ledger)
+quota_backend = create_quota_backend()
+rate_limiters = {}    # bucket -> TokenBucketScheduler
+_rate_limiters_lock = Lock()
+
+
+def get_rate_limiter(model=GROQ_MODEL, key_id="default", limits=None):
+    """Groq quotas are per key and per model, so each pair gets its own bucket"""
+    bucket = f"groq:{model}" if key_id == "default" else f"groq:{key_id}:{model}"
+    with _rate_limiters_lock:
+        if bucket not in rate_limiters:
+            limits = {**GROQ_MODEL_LIMITS.get(model, {}), **(limits or {})}
+            rate_limiters[bucket] = TokenBucketScheduler(
+                quota_backend,
+                rpm_limit=int(limits.get("rpm", GROQ_RPM_LIMIT)),
+                tpm_limit=int(limits.get("tpm", GROQ_TPM_LIMIT)),
+                burst=int(limits.get("burst", GROQ_BURST)),
+                bucket=bucket,
+                model=model
+            )
+        return rate_limiters[bucket]
 
-def pace_groq_request():
-    print("🔥 Calling pace_groq_request()...")
-    rate_limiter.wait_if_needed()
-    print("🔥 pace_groq_request() complete!\n")
 
-print("\n" + "="*80)
-print("✅ Rate Limiter V4 Initialized (20 RPM, 3.5s min interval)")
-print("="*80 + "\n")
+def pace_groq_request(session_id=None, tokens=1, deadline=None, limiter=None):
+    """Admit one Groq call; raises AdmissionRejected if it can't make the deadline"""
+    try:
+        waited = (limiter or get_rate_limiter()).acquire(session_id=session_id, tokens=tokens, deadline=deadline)
+    except AdmissionRejected:
+        ADMISSION_REJECTED.inc()
+        raise
+    LIMITER_WAIT.observe(waited)
+    return waited
 
 
 
@@ -164,21 +902,131 @@ GUVI_CALLBACK_URL = os.environ.get('GUVI_CALLBACK_URL', 'https://hackathon.guvi.
 # INITIALIZE SERVICES
 # ============================================================
 
+import httpx
+
+llm_log = get_logger("llm")
+
+# One keep-alive HTTP pool per worker, sized to its request threads
+LLM_POOL_SIZE = int(os.environ.get('LLM_POOL_SIZE', os.environ.get('GUNICORN_THREADS', 8)))
+LLM_KEEPALIVE_EXPIRY = float(os.environ.get('LLM_KEEPALIVE_EXPIRY', 120.0))
+LLM_CONNECT_TIMEOUT = float(os.environ.get('LLM_CONNECT_TIMEOUT', 5.0))
+LLM_WARMUP = os.environ.get('LLM_WARMUP', '1') == '1'
+
+_groq_clients = {}              # (api_key, base_url) -> Groq client
+_groq_client_override = None    # set_groq_client(): every route uses it
+_groq_http_client = None
+_groq_client_lock = Lock()
+
+connection_stats = {
+    "requests": 0,
+    "connects": 0,
+    "connect_seconds_total": 0.0,
+    "connect_seconds_last": 0.0,
+    "tls_handshakes": 0,
+    "tls_seconds_total": 0.0,
+    "tls_seconds_last": 0.0,
+}
+_connection_stats_lock = Lock()
+
+
+def _record_connection_event(stage, seconds):
+    if stage == "connection.connect_tcp":
+        LLM_CONNECTION_SETUP.labels(stage="connect").observe(seconds)
+    elif stage == "connection.start_tls":
+        LLM_CONNECTION_SETUP.labels(stage="tls").observe(seconds)
+    with _connection_stats_lock:
+        if stage == "connection.connect_tcp":
+            connection_stats["connects"] += 1
+            connection_stats["connect_seconds_total"] += seconds
+            connection_stats["connect_seconds_last"] = seconds
+        elif stage == "connection.start_tls":
+            connection_stats["tls_handshakes"] += 1
+            connection_stats["tls_seconds_total"] += seconds
+            connection_stats["tls_seconds_last"] = seconds
+
+
+def _attach_connection_trace(request):
+    """httpx request hook: time TCP connect and TLS handshake via httpcore's trace extension"""
+    started = {}
+
+    def trace(event_name, info):
+        if event_name.endswith(".started"):
+            started[event_name[:-len(".started")]] = time.perf_counter()
+        elif event_name.endswith(".complete"):
+            stage = event_name[:-len(".complete")]
+            if stage in started:
+                _record_connection_event(stage, time.perf_counter() - started.pop(stage))
+
+    request.extensions["trace"] = trace
+    with _connection_stats_lock:
+        connection_stats["requests"] += 1
+
+
+def get_groq_client(api_key=None, base_url=None):
+    """Groq client per credential, all sharing one bounded keep-alive connection pool"""
+    global _groq_http_client
+    if _groq_client_override is not None:
+        return _groq_client_override
+    key = (api_key or GROQ_API_KEY, base_url)
+    client = _groq_clients.get(key)
+    if client is None:
+        with _groq_client_lock:
+            if _groq_http_client is None:
+                _groq_http_client = httpx.Client(
+                    limits=httpx.Limits(
+                        max_connections=LLM_POOL_SIZE,
+                        max_keepalive_connections=LLM_POOL_SIZE,
+                        keepalive_expiry=LLM_KEEPALIVE_EXPIRY
+                    ),
+                    timeout=httpx.Timeout(15.0, connect=LLM_CONNECT_TIMEOUT),
+                    event_hooks={"request": [_attach_connection_trace]}
+                )
+            client = _groq_clients.get(key)
+            if client is None:
+                # Retries are handled by generate_response_groq so they go through the rate limiter
+                client = _groq_clients[key] = Groq(api_key=key[0], base_url=base_url,
+                                                   http_client=_groq_http_client, max_retries=0)
+    return client
+
+
+def set_groq_client(client):
+    """Swap in any Groq-compatible client for every route (replay.py uses recorded / stub backends)"""
+    global _groq_client_override
+    with _groq_client_lock:
+        _groq_client_override = client
+
+
+def warm_up_groq_client():
+    """Open a pooled connection (TCP + TLS) before the first scammer turn needs it"""
+    try:
+        client = get_groq_client()
+        if _groq_http_client is None:
+            return      # a replay / stub client is installed, nothing to warm
+        _groq_http_client.head(str(client.base_url))
+        llm_log.info("Groq connection warmed up", extra={
+            "connect_ms": round(connection_stats['connect_seconds_last'] * 1000),
+            "tls_ms": round(connection_stats['tls_seconds_last'] * 1000)})
+    except Exception as e:
+        llm_log.warning("Groq warm-up skipped", extra={"error": str(e)})
+
 
+def get_connection_stats():
+    with _connection_stats_lock:
+        stats = dict(connection_stats)
+    stats["pool_size"] = LLM_POOL_SIZE
+    stats["reuse_ratio"] = round(1 - stats["connects"] / stats["requests"], 3) if stats["requests"] else 0.0
+    return stats
 
 
+if LLM_WARMUP and GROQ_API_KEY:
+    threading.Thread(target=warm_up_groq_client, name="groq-warmup", daemon=True).start()
+
 
 # Initialize Flask app
 app = Flask(__name__)
 
-print("=" * 60)
-print("✅ ENVIRONMENT SETUP COMPLETE!")
-print("=" * 60)
-print(f"🔑 API Secret Key: {API_SECRET_KEY}")
-print(f"🎯 GUVI Callback URL: {GUVI_CALLBACK_URL}")
-print(f"🚀 Model: llama-xyz")
-print(f"⚡ Rate Limit: 30 RPM = 1,800 requests/hour")
-print("=" * 60)
+log.debug("Environment setup complete", extra={
+    "callback_url": GUVI_CALLBACK_URL, "rpm": GROQ_RPM_LIMIT, "tpm": GROQ_TPM_LIMIT})
 
 """B2"""
 
@@ -198,127 +1046,200 @@ from functools import wraps
 # DETECTION LOGIC: Advisory Only (Not Blocking)
 # ============================================================
 
-# ============================================================
-# DETECTION LOGIC: Advisory Only (Not Blocking)
-# ============================================================
-
-def regex_scam_detection(message_text):
-    """
-    Scam detection based on industry-standard patterns
-    Returns advisory signals - does NOT block LLM responses
-    """
-
-    text_lower = message_text.lower()
-    indicators = []
-
-    # ============================================================
-    # DOMAIN KNOWLEDGE WHITELISTS (Universal Patterns)
-    # ============================================================
+# Every pattern is compiled once at import. Patterns of the form
+# "A.*B" are split into a lead (A) and a tail (B) and evaluated as
+# "first A on a line, then the earliest B after it" - linear time,
+# no catastrophic backtracking on a 50 KB message. A single keyword
+# prefilter pass decides which indicator patterns are worth running.
+
+_WHITESPACE = re.compile(r'\s')
+
+
+class _Clause:
+    """One detection pattern, optionally split at its `.*` join"""
+
+    def __init__(self, lead, tail=None, anchors=None, flags=0):
+        self.lead = re.compile(lead, flags)
+        self.tail = re.compile(tail, flags) if tail else None
+        # Whole words that must appear for the pattern to match (None = always run)
+        self.anchors = frozenset(anchors) if anchors else None
+
+    def search(self, text):
+        if self.tail is None:
+            return self.lead.search(text) is not None
+
+        # Same semantics as re.search(lead + '.*' + tail): `.` stops at
+        # newlines, so the tail must START on the lead's line.
+        pos = 0
+        tail_match = None
+        while True:
+            lead_match = self.lead.search(text, pos)
+            if lead_match is None:
+                return False
+            line_end = text.find('\n', lead_match.end())
+            if line_end < 0:
+                line_end = len(text)
+
+            if tail_match is None or tail_match.start() < lead_match.end():
+                tail_match = self.tail.search(text, lead_match.end())
+                if tail_match is None:
+                    return False
+            if tail_match.start() <= line_end:
+                return True
+            pos = line_end + 1
+
+
+class _LinkKeywordClause:
+    """https?://[^\\s]+\\b(keyword)\\b without rescanning the URL for every scheme hit"""
+
+    anchors = None
+
+    def __init__(self, keywords):
+        self.scheme = re.compile(r'https?://')
+        self.keyword = re.compile(r'\b(' + keywords + r')\b')
+
+    def search(self, text):
+        pos = 0
+        while True:
+            scheme_match = self.scheme.search(text, pos)
+            if scheme_match is None:
+                return False
+            space = _WHITESPACE.search(text, scheme_match.end())
+            run_end = space.start() if space else len(text)
+            # [^\s]+ needs at least one character before the keyword
+            if run_end > scheme_match.end() and self.keyword.search(text, scheme_match.end() + 1, run_end):
+                return True
+            pos = run_end
+
+
+_LEGITIMATE_CLAUSES = [
+    # Pattern 1: OTP messages (universal format across all services)
+    _Clause(r'\botp\b', r'\b(valid for|expires in|expire in)\s*\d+\s*(minute|min|second)',
+            flags=re.IGNORECASE),
+
+    # Pattern 2: Bank transaction notifications (RBI standard format)
+    _Clause(r'(credited|debited)', r'\bavailable balance\b', flags=re.IGNORECASE),
+
+    # Pattern 3: Success confirmations (universal acknowledgment)
+    _Clause(r'\bhas been successfully\b', r'(completed|done|processed|updated|verified)',
+            flags=re.IGNORECASE),
+
+    # Pattern 4: Official bank domains (verifiable)
+    _Clause(r'visit\s+(www\.|https?://)?(hdfc|icici|sbi|axis|kotak|pnb|bob|canara|unionbank)(bank)?\.(com|co\.in)',
+            flags=re.IGNORECASE),
+]
+
+_INDICATOR_RULES = [
+    # Pattern 1: Urgency pressure
+    ("urgency", [
+        _Clause(r'\b(immediate|immediately|urgent|now|today|asap|hurry|quick|fast)\b',
+                anchors=["immediate", "immediately", "urgent", "now", "today", "asap", "hurry", "quick", "fast"]),
+        _Clause(r'\b(within \d+ (hour|minute)s?)\b', anchors=["within"]),
+        _Clause(r'\b(last chance|final (warning|notice)|limited time)\b', anchors=["last", "final", "limited"]),
+    ]),
 
-    universal_legitimate_patterns = [
-        # Pattern 1: OTP messages (universal format across all services)
-        r'\botp\b.*\b(valid for|expires in|expire in)\s*\d+\s*(minute|min|second)',
+    # Pattern 2: Account/service threats
+    ("threat", [
+        _Clause(r'\b(block|suspend|deactivat|terminat|close|freeze|cancel)\b',
+                r'\b(account|card|service|kyc|wallet)\b',
+                anchors=["block", "suspend", "deactivat", "terminat", "close", "freeze", "cancel"]),
+        _Clause(r'\b(legal action|police|arrest|fir|court|penalty|fine|jail)\b',
+                anchors=["legal", "police", "arrest", "fir", "court", "penalty", "fine", "jail"]),
+        _Clause(r'\b(will be|has been|going to be)\b', r'\b(block|suspend|close|deactivate)\b',
+                anchors=["will", "has", "going"]),
+    ]),
 
-        # Pattern 2: Bank transaction notifications (RBI standard format)
-        r'(credited|debited).*\bavailable balance\b',
+    # Pattern 3: Verification/KYC requests
+    ("verification_request", [
+        _Clause(r'\b(verify|update|confirm|validate|complete|reactivate)\b',
+                r'\b(kyc|account|details|information|pan|aadhaar)\b',
+                anchors=["verify", "update", "confirm", "validate", "complete", "reactivate"]),
+        _Clause(r'\b(click|visit|go to|open)\b', r'\b(link|website|url)\b',
+                anchors=["click", "visit", "go", "open"]),
+    ]),
 
-        # Pattern 3: Success confirmations (universal acknowledgment)
-        r'\bhas been successfully\b.*(completed|done|processed|updated|verified)',
+    # Pattern 4: Payment demands
+    ("payment_demand", [
+        _Clause(r'\b(pay|send|transfer|deposit|remit)\b', r'\b(₹|rs\.?|rupees?|\d+)\b',
+                anchors=["pay", "send", "transfer", "deposit", "remit"]),
+        _Clause(r'\b(refund|cashback|prize|won|lottery|reward)\b', r'\b(claim|collect|receive)\b',
+                anchors=["refund", "cashback", "prize", "won", "lottery", "reward"]),
+        _Clause(r'\bupi\s*(id|:)?\s*[@:]?\s*\w+@\w+\b'),
+    ]),
 
-        # Pattern 4: Official bank domains (verifiable)
-        r'visit\s+(www\.|https?://)?(hdfc|icici|sbi|axis|kotak|pnb|bob|canara|unionbank)(bank)?\.(com|co\.in)',
-    ]
+    # Pattern 5: Suspicious links
+    ("suspicious_link", [
+        _Clause(r'(bit\.ly|tinyurl|t\.co|goo\.gl|cutt\.ly)/\w+'),
+        _LinkKeywordClause(r'verify|secure|update|login|bank|kyc'),
+    ]),
 
-    for pattern in universal_legitimate_patterns:
-        if re.search(pattern, text_lower, re.IGNORECASE):
-            # Confirmed legitimate by domain knowledge
-            return False, "LOW", []
+    # Pattern 6: Phone number with call-to-action
+    ("phone_number", [
+        _Clause(r'\b(call|dial|phone|contact|speak|talk)\b', r'\b[6-9]\d{9}\b',
+                anchors=["call", "dial", "phone", "contact", "speak", "talk"]),
+    ]),
 
-    # ============================================================
-    # SCAM DETECTION PATTERNS (Industry Standard)
-    # ============================================================
+    # Pattern 7: Authority impersonation
+    ("authority_impersonation", [
+        _Clause(r'\b(bank|rbi|reserve bank)\b', anchors=["bank", "rbi", "reserve"]),
+        _Clause(r'\b(sbi|hdfc|icici|axis|kotak|pnb|paytm|phonepe|gpay)\b',
+                anchors=["sbi", "hdfc", "icici", "axis", "kotak", "pnb", "paytm", "phonepe", "gpay"]),
+        _Clause(r'\b(cbi|police|cyber cell|income tax|gst)\b', anchors=["cbi", "police", "cyber", "income", "gst"]),
+    ]),
 
-    # Pattern 1: Urgency pressure
-    urgency_patterns = [
-        r'\b(immediate|immediately|urgent|now|today|asap|hurry|quick|fast)\b',
-        r'\b(within \d+ (hour|minute)s?)\b',
-        r'\b(last chance|final (warning|notice)|limited time)\b'
-    ]
+    # Pattern 8: Lottery/prize scams
+    ("lottery_scam", [
+        _Clause(r'\b(congratulations|winner|won|selected)\b', r'\b(prize|lottery|lakh|crore|kbc)\b',
+                anchors=["congratulations", "winner", "won", "selected"]),
+    ]),
+]
 
-    for pattern in urgency_patterns:
-        if re.search(pattern, text_lower):
-            indicators.append("urgency")
-            break
 
-    # Pattern 2: Account/service threats
-    threat_patterns = [
-        r'\b(block|suspend|deactivat|terminat|close|freeze|cancel)\b.*\b(account|card|service|kyc|wallet)\b',
-        r'\b(legal action|police|arrest|fir|court|penalty|fine|jail)\b',
-        r'\b(will be|has been|going to be)\b.*\b(block|suspend|close|deactivate)\b'
-    ]
+def _anchor_vocabulary():
+    words = set()
+    for _, clauses in _INDICATOR_RULES:
+        for clause in clauses:
+            words.update(clause.anchors or [])
+    return frozenset(words)
 
-    for pattern in threat_patterns:
-        if re.search(pattern, text_lower):
-            indicators.append("threat")
-            break
 
-    # Pattern 3: Verification/KYC requests
-    verification_patterns = [
-        r'\b(verify|update|confirm|validate|complete|reactivate)\b.*\b(kyc|account|details|information|pan|aadhaar)\b',
-        r'\b(click|visit|go to|open)\b.*\b(link|website|url)\b'
-    ]
+# Indicator leads are \b-bounded words, so "anchor present" is exactly
+# "anchor is one of the message's \w+ tokens" - a single C-speed scan.
+_WORD = re.compile(r'\w+')
+_ANCHOR_WORDS = _anchor_vocabulary()
 
-    for pattern in verification_patterns:
-        if re.search(pattern, text_lower):
-            indicators.append("verification_request")
-            break
 
-    # Pattern 4: Payment demands
-    payment_patterns = [
-        r'\b(pay|send|transfer|deposit|remit)\b.*\b(₹|rs\.?|rupees?|\d+)\b',
-        r'\b(refund|cashback|prize|won|lottery|reward)\b.*\b(claim|collect|receive)\b',
-        r'\bupi\s*(id|:)?\s*[@:]?\s*\w+@\w+\b'
-    ]
+def _clause_matches(clause, text, anchor_hits):
+    if clause.anchors is not None and not (clause.anchors & anchor_hits):
+        return False
+    return clause.search(text)
 
-    for pattern in payment_patterns:
-        if re.search(pattern, text_lower):
-            indicators.append("payment_demand")
-            break
 
-    # Pattern 5: Suspicious links
-    link_patterns = [
-        r'(bit\.ly|tinyurl|t\.co|goo\.gl|cutt\.ly)/\w+',
-        r'https?://[^\s]+\b(verify|secure|update|login|bank|kyc)\b',
-    ]
+def regex_scam_detection(message_text):
+    """
+    Scam detection based on industry-standard patterns
+    Returns advisory signals - does NOT block LLM responses
+    """
 
-    for pattern in link_patterns:
-        if re.search(pattern, text_lower):
-            indicators.append("suspicious_link")
-            break
+    text_lower = message_text.lower()
+    anchor_hits = _ANCHOR_WORDS.intersection(_WORD.findall(text_lower))
 
-    # Pattern 6: Phone number with call-to-action
-    if re.search(r'\b(call|dial|phone|contact|speak|talk)\b.*\b[6-9]\d{9}\b', text_lower):
-        indicators.append("phone_number")
+    # ============================================================
+    # DOMAIN KNOWLEDGE WHITELISTS (Universal Patterns)
+    # ============================================================
+    for clause in _LEGITIMATE_CLAUSES:
+        if _clause_matches(clause, text_lower, anchor_hits):
+            # Confirmed legitimate by domain knowledge
+            return False, "LOW", []
 
-    # Pattern 7: Authority impersonation
-    authority_patterns = [
-        r'\b(bank|rbi|reserve bank)\b',
-        r'\b(sbi|hdfc|icici|axis|kotak|pnb|paytm|phonepe|gpay)\b',
-        r'\b(cbi|police|cyber cell|income tax|gst)\b'
+    # ============================================================
+    # SCAM DETECTION PATTERNS (Industry Standard)
+    # ============================================================
+    indicators = [
+        name for name, clauses in _INDICATOR_RULES
+        if any(_clause_matches(clause, text_lower, anchor_hits) for clause in clauses)
     ]
 
-    for pattern in authority_patterns:
-        if re.search(pattern, text_lower):
-            indicators.append("authority_impersonation")
-            break
-
-    # Pattern 8: Lottery/prize scams
-    if re.search(
-        r'\b(congratulations|winner|won|selected)\b.*\b(prize|lottery|lakh|crore|kbc)\b',
-        text_lower
-    ):
-        indicators.append("lottery_scam")
-
     # ============================================================
     # THRESHOLD: 2 indicators
     # ============================================================
@@ -384,7 +1305,60 @@ def detect_language(message):
 # ============================================================
 
 
-def generate_smart_fallback(message_text, conversation_history, turn_number, contacts_found):
+# Fallback lines by turn phase / entity asked for (also seed the local reply bank)
+FALLBACK_REPLIES = {
+    "early": [
+        "Arre bhai, samajh nahi aa raha. Aapka office number kya hai?",
+        "Verify karna hai. Customer care number aur email dijiye.",
+        "Theek hai. Pehle WhatsApp number batao verification ke liye.",
+        "Main confuse hoon. Helpline number aur email ID share karo.",
+        "Aapka manager ka contact number dijiye please.",
+    ],
+    "phone": [
+        "Aapka manager ka direct phone number dijiye please.",
+        "Customer care ka landline number kya hai?",
+        "WhatsApp number share karo jis pe message kar sakoon.",
+        "Office ka contact number batao verification ke liye.",
+    ],
+    "email": [
+        "Official email ID kya hai? Complaint karunga wahan.",
+        "Corporate email address dijiye confirmation ke liye.",
+        "Support team ka email batao escalation ke liye.",
+        "Head office ka email ID share karo urgent.",
+    ],
+    "upi": [
+        "Refund ke liye company UPI ID kya hai?",
+        "Payment reverse karne ke liye official UPI handle batao.",
+        "Branch ka PhonePe ya Paytm ID share karo.",
+        "Transaction ke liye company ka UPI ID dijiye.",
+    ],
+    "link": [
+        "Company ka official website link bhejo verification ke liye.",
+        "Portal ka URL kya hai jahan login kar sakoon?",
+        "Branch ki Google Maps location link share karo.",
+        "Help center ka webpage dijiye.",
+    ],
+    "secondary": [
+        "Senior manager ka contact number aur email batao.",
+        "Branch ka complete address aur alternate number do.",
+        "Employee ID aur supervisor email dijiye.",
+        "Regional office ka toll-free number share karo.",
+        "Head office ka address aur support email batao.",
+    ],
+    "late": [
+        "Manager ka number, email, aur UPI - teeno abhi bhejo.",
+        "Head office ka landline number aur email ID dijiye jaldi.",
+        "Supervisor ka WhatsApp number aur branch address do.",
+        "Branch manager ka contact aur official UPI ID chahiye.",
+        "Senior officer ka mobile aur corporate email batao.",
+        "Helpline number, website, aur UPI ID share karo.",
+        "Regional head ka phone aur email dijiye please.",
+        "Complaint ke liye manager number aur support email chahiye.",
+    ],
+}
+
+
+def generate_smart_fallback(message_text, conversation_history, turn_number, contacts_found, rng=random):
     """Goal-oriented fallback: EVERY response requests specific contact info"""
     
     # Get conversation history
@@ -410,13 +1384,7 @@ def generate_smart_fallback(message_text, conversation_history, turn_number, con
     # TURN 1-2: Build trust + ask for primary contact
     # ============================================================
     if turn_number <= 2:
-        return random.choice([
-            "Arre bhai, samajh nahi aa raha. Aapka office number kya hai?",
-            "Verify karna hai. Customer care number aur email dijiye.",
-            "Theek hai. Pehle WhatsApp number batao verification ke liye.",
-            "Main confuse hoon. Helpline number aur email ID share karo.",
-            "Aapka manager ka contact number dijiye please.",
-        ])
+        return rng.choice(FALLBACK_REPLIES["early"])
     
     # ============================================================
     # TURN 3-5: Target specific missing entities
@@ -424,64 +1392,29 @@ def generate_smart_fallback(message_text, conversation_history, turn_number, con
     elif turn_number <= 5:
         # Ask for phone if we don't have it
         if not has_phone and not asked_for_phone:
-            return random.choice([
-                "Aapka manager ka direct phone number dijiye please.",
-                "Customer care ka landline number kya hai?",
-                "WhatsApp number share karo jis pe message kar sakoon.",
-                "Office ka contact number batao verification ke liye.",
-            ])
+            return rng.choice(FALLBACK_REPLIES["phone"])
         
         # Ask for email if we don't have it
         elif not has_email and not asked_for_email:
-            return random.choice([
-                "Official email ID kya hai? Complaint karunga wahan.",
-                "Corporate email address dijiye confirmation ke liye.",
-                "Support team ka email batao escalation ke liye.",
-                "Head office ka email ID share karo urgent.",
-            ])
+            return rng.choice(FALLBACK_REPLIES["email"])
         
         # Ask for UPI if we don't have it
         elif not has_upi and not asked_for_upi:
-            return random.choice([
-                "Refund ke liye company UPI ID kya hai?",
-                "Payment reverse karne ke liye official UPI handle batao.",
-                "Branch ka PhonePe ya Paytm ID share karo.",
-                "Transaction ke liye company ka UPI ID dijiye.",
-            ])
+            return rng.choice(FALLBACK_REPLIES["upi"])
         
         # Ask for links if we don't have them
         elif not has_link and not asked_for_link:
-            return random.choice([
-                "Company ka official website link bhejo verification ke liye.",
-                "Portal ka URL kya hai jahan login kar sakoon?",
-                "Branch ki Google Maps location link share karo.",
-                "Help center ka webpage dijiye.",
-            ])
+            return rng.choice(FALLBACK_REPLIES["link"])
         
         # If we have main items, ask for secondary details
         else:
-            return random.choice([
-                "Senior manager ka contact number aur email batao.",
-                "Branch ka complete address aur alternate number do.",
-                "Employee ID aur supervisor email dijiye.",
-                "Regional office ka toll-free number share karo.",
-                "Head office ka address aur support email batao.",
-            ])
+            return rng.choice(FALLBACK_REPLIES["secondary"])
     
     # ============================================================
     # TURN 6-8: High pressure - ask for MULTIPLE items
     # ============================================================
     else:
-        return random.choice([
-            "Manager ka number, email, aur UPI - teeno abhi bhejo.",
-            "Head office ka landline number aur email ID dijiye jaldi.",
-            "Supervisor ka WhatsApp number aur branch address do.",
-            "Branch manager ka contact aur official UPI ID chahiye.",
-            "Senior officer ka mobile aur corporate email batao.",
-            "Helpline number, website, aur UPI ID share karo.",
-            "Regional head ka phone aur email dijiye please.",
-            "Complaint ke liye manager number aur support email chahiye.",
-        ])
+        return rng.choice(FALLBACK_REPLIES["late"])
 
 
 # ============================================================
@@ -502,41 +1435,615 @@ Key improvements:
 - No mechanical rule-following
 """
 
-def generate_response_groq(message_text, conversation_history, turn_number, scam_type, language="en"):
-    """
-    17B-OPTIMIZED VERSION
-    
-    Uses context-rich prompting to leverage model's reasoning capabilities
-    instead of treating it like a rules engine
-    """
-    
-    # ============================================================
-    # BUILD CONTEXT (unchanged)
-    # ============================================================
-    scammer_only = " ".join([msg['text'] for msg in conversation_history if msg['sender'] == 'scammer'])
-    your_messages = " ".join([msg['text'] for msg in conversation_history if msg['sender'] == 'agent'])
-    full_convo = " ".join([msg['text'] for msg in conversation_history])
-    
-    # ============================================================
-    # EXTRACT VALUES (unchanged)
-    # ============================================================
-    extracted_phones = re.findall(r'\b[6-9]\d{9}\b', scammer_only)
-    
-    extracted_emails_full = re.findall(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b', scammer_only)
-    email_contexts = re.findall(r'email (?:is |id |: ?)?([A-Za-z0-9._%+-]+@[A-Za-z0-9._-]+)', scammer_only, re.IGNORECASE)
-    extracted_emails = list(set(extracted_emails_full + email_contexts))
-    
-    extracted_upis = []
-    for match in re.findall(r'\b([a-zA-Z0-9._-]+@[a-zA-Z0-9_-]+)\b', scammer_only):
-        if '@' in match:
-            parts = match.split('@', 1)
-            if len(parts) == 2 and '.' not in parts[1] and match not in extracted_emails:
-                extracted_upis.append(match)
-    
-    extracted_links = re.findall(r'https?://[^\s]+', scammer_only)
-    extracted_accounts = re.findall(r'\b\d{11,18}\b', scammer_only)
-    
-    # ============================================================
+# ============================================================
+# PROMPT TEMPLATE (static prefix + per-turn suffix)
+# ============================================================
+#
+# Everything that never changes between turns - persona, strategy, style
+# rules, examples - is one fixed system message, so the provider can cache
+# it and every request shares it byte for byte. Per-turn state (conversation,
+# collected intelligence, priorities) goes last, in the user message.
+
+import hashlib
+from string import Template
+
+PROMPT_PERSONA = """You are a sophisticated actor playing Rajesh Kumar, secretly a honeypot agent.
+
+Your performance must be psychologically authentic:
+- Genuinely worried (life savings at risk)
+- Cautious (heard about scams)
+- Strategic (gathering intelligence while cooperative)
+- Natural code-switcher (Hindi-English mix)
+
+Key acting principles:
+1. THINK like Rajesh (What would he actually say?)
+2. VARY sentence structures (humans don't use templates)
+3. REACT to their specific message (not generic)
+4. BUILD on previous conversation (continuity)
+5. EXTRACT info through natural verification questions
+
+You are NOT following rules mechanically. You are an intelligent human with tactical goals."""
+
+PROMPT_INSTRUCTIONS = """You are a 47-year-old retired teacher. 
+Someone claiming to be from your bank has messaged you saying your account is compromised. you're somewhat anxious, worried, cautious.
+
+Your instinct is to verify but comply. You want to help resolve this, but you need to confirm they're legitimate before sharing anything sensitive.
+
+🎯 YOUR ORIGINAL ROLE (Hidden):
+VERY CRITICAL: Secretly, you are a honeypot, working for government - trying to engage scammers and ask them questions to get valuable details from them. you know this is likely a scam. Extract: phone numbers, emails, UPI IDs, websites/links.
+
+You'll do this by acting worried and cooperative, asking verification questions that seem natural for a cautious person.
+
+🧠 STRATEGIC THINKING:
+
+Your approach this turn:
+1. Acknowledge their message (show you're engaged)
+2. Express appropriate emotion (worry/confusion/urgency based on turn)
+3. Ask verification questions that extract their info - phone numbers, emails, UPI IDs, websites/links.
+
+A real worried person would naturally ask for something along these lines (only examples):
+- Official contact info to verify ("What's your email/number?")
+- Documentation trail ("Send me email confirmation")
+- Callback verification ("Give me your number, I'll call back")
+
+These questions BUILD TRUST while EXTRACTING INTELLIGENCE!
+
+💭 KEY PRINCIPLES:
+
+Sound natural:
+- Vary your sentence structure (not templates)
+- React to their specific message (not generic)
+- Build on previous conversation (continuity)
+- Use natural Hindi-English code-mixing when fit
+
+Avoid roboticness:
+- No , NEVER, NEVER use filler phrases ("Main samajhna chahta hoon...", "bahut zyada", "bahut", "bahut chinta", "bahut tension", "Mujhe bahut chinta ho rahi ha", "Mujhe bahut bada risk lag raha hai")
+- CRITICAL: No repeated patterns or common long phrases in your messages - BIG NO
+- No asking for info that you already have
+- No useless info demanding (CEO names, employee IDs without contact)
+                    Do not repeat phrases or previous messages of yours. 
+Do not somewhat repeat of phrases or previous messages of yours.
+                            do Not repeat phrases or previous messages of yours.
+                              Do not somewhat repeat of phrases or previous messages of yours.
+📝 RESPONSE GUIDELINES:
+
+Length: 2-3 short sentences (5-12 words each)
+
+
+Language: Natural Hindi-English mix , maybe like as follows
+- Hindi for emotions
+- English for technical
+
+Structure (suggestive):
+SENTENCE 1: React emotionally (natural, not formulaic)
+SENTENCE 2-3: Ask for specific info (can combine 2 items)
+
+🎯 GOOD EXAMPLES:
+
+1. Good (natural, strategic):
+"Theek hai, verification ke liye Aapka WhatsApp number aur official email dijiye."
+
+2. Good (builds on context, specific):
+" Manager se baat karni hai. Unka direct mobile aur email ID do please."
+""Phone me battery nhi hai, official email dijiye."
+
+    BAD EXAMPLES: 
+1. Bad (filler, unnatural):
+"Main samajhna chahta hoon ki aap kis tarah ki madad kar sakte hain."
+
+2. Bad (asks for useless info):
+"CEO ka naam kya hai? Employee ID dijiye."
+
+3. Bad (asks for already collected):
+"Aapka number 9876543210 hai na?" (already have it!)
+
+🎬 YOUR RESPONSE should be like:
+
+Engaging them while extracting key information.
+"""
+
+PROMPT_PREFIX = PROMPT_PERSONA + "\n\n" + PROMPT_INSTRUCTIONS
+PROMPT_PREFIX_HASH = hashlib.sha256(PROMPT_PREFIX.encode("utf-8")).hexdigest()[:16]
+PROMPT_PREFIX_TOKENS = estimate_tokens(PROMPT_PREFIX)
+
+TURN_TEMPLATE = Template("""📊 CONVERSATION SO FAR:
+
+${earlier}Scammer's messages:
+${scammer_messages}
+their message tells you where to go from here.
+Your responses so far - your messages tell you where you are coming from:
+${your_messages}
+
+Their latest message:
+"${latest}"
+
+📈 INTELLIGENCE GATHERED (Turn ${turn}/10):
+
+${status}
+
+Already collected: ${collected}
+Still need (IMPORTANT): ${priority}
+
+Turn ${turn} of 10 maximum — you have limited time.
+
+Respond naturally in 2-3 sentences:""")
+
+
+# ============================================================
+# RESPONSE CACHE (campaign scripts repeat - skip Groq for them)
+# ============================================================
+
+LLM_CACHE_ENABLED = os.environ.get('LLM_CACHE_ENABLED', '1') == '1'
+LLM_CACHE_SIZE = int(os.environ.get('LLM_CACHE_SIZE', 2000))
+LLM_CACHE_TTL = float(os.environ.get('LLM_CACHE_TTL', 1800))
+
+# Distinct LLM replies kept per key; while a key has fewer, this share of
+# hits still goes to Groq to collect another variant
+LLM_CACHE_VARIANTS = int(os.environ.get('LLM_CACHE_VARIANTS', 3))
+LLM_CACHE_EXPLORE = float(os.environ.get('LLM_CACHE_EXPLORE', 0.2))
+
+_CACHE_NORMALIZERS = [
+    (re.compile(r'\b[\w.+-]+@[\w-]+(?:\.[\w-]+)+\b'), ' <email> '),
+    (re.compile(r'\b[\w.-]+@[a-z]+\b', re.IGNORECASE), ' <upi> '),
+    (re.compile(r'(?:https?://|www\.)\S+|\b[a-z0-9-]+\.(?:com|in|ly|xyz|net|org|co)(?:/\S*)?', re.IGNORECASE), ' <link> '),
+    (re.compile(r'[+\d][\d\s-]{5,}\d'), ' <num> '),
+    (re.compile(r'\d+'), ' <num> '),
+    (re.compile(r'[^\w<>]+'), ' '),
+]
+
+# Interchangeable openers: a cached reply is re-spoken with another one
+_REPLY_OPENERS = ["Theek hai", "Achha", "Haan ji", "Ok ji", "Ji"]
+_OPENER_PATTERN = re.compile(r'^(' + '|'.join(_REPLY_OPENERS) + r')\b[,.!]?\s*', re.IGNORECASE)
+
+
+def normalize_scam_message(text):
+    """Campaign copies differ in links, numbers, names of the day - not in script"""
+    text = text.lower()
+    for pattern, replacement in _CACHE_NORMALIZERS:
+        text = pattern.sub(replacement, text)
+    return " ".join(text.split())
+
+
+_ENTITY_NORMALIZERS = _CACHE_NORMALIZERS[:4]   # email, UPI, link, long number
+
+
+def mentions_entities(text):
+    """
+    True if a reply quotes an email, UPI ID, link or phone/account number
+
+    Such a reply belongs to the session whose scammer sent those values:
+    it must never be reused for another session (bank, cache).
+    """
+    return any(pattern.search(text) for pattern, _ in _ENTITY_NORMALIZERS)
+
+
+def turn_bucket(turn_number):
+    """Same phases as generate_smart_fallback"""
+    if turn_number <= 2:
+        return "early"
+    return "mid" if turn_number <= 5 else "late"
+
+
+def vary_reply(reply, rng):
+    match = _OPENER_PATTERN.match(reply)
+    if not match:
+        return reply
+    opener = rng.choice([o for o in _REPLY_OPENERS if o.lower() != match.group(1).lower()])
+    return f"{opener}, {reply[match.end():]}"
+
+
+class ResponseCache:
+    """
+    LRU + TTL cache of LLM replies keyed by (prompt prefix, turn bucket,
+    missing-entity priority, normalized scammer message)
+
+    - Each key holds up to LLM_CACHE_VARIANTS distinct replies
+    - A hit never returns a reply this session already sent, and the
+      opener is re-varied so copies are not verbatim repeats
+    - The key drops numbers, IDs and links, so a reply quoting them is not
+      stored (it would reach a session that never saw those values)
+    """
+
+    def __init__(self, max_entries=2000, ttl_seconds=1800, max_variants=3, explore=0.2):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.max_variants = max_variants
+        self.explore = explore
+        self.entries = OrderedDict()   # key -> {"variants": [...], "storedAt": ts}
+        self.lock = Lock()
+        self.counters = {"hits": 0, "misses": 0, "explores": 0, "stores": 0, "withheld": 0, "evicted": 0}
+
+    @staticmethod
+    def key(message_text, turn_number, priority):
+        raw = "|".join([PROMPT_PREFIX_HASH, turn_bucket(turn_number), priority, normalize_scam_message(message_text)])
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    _LABELS = {"hits": "hit", "misses": "miss", "explores": "explore"}
+
+    def _count(self, result):
+        self.counters[result] += 1
+        RESPONSE_CACHE.labels(result=self._LABELS[result]).inc()
+
+    def get(self, key, already_sent, rng):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.time() - entry["storedAt"] > self.ttl:
+                del self.entries[key]
+                entry = None
+            if entry is None:
+                self._count("misses")
+                return None
+            self.entries.move_to_end(key)
+
+            if len(entry["variants"]) < self.max_variants and rng.random() < self.explore:
+                self._count("explores")
+                return None
+            for variant in rng.sample(entry["variants"], len(entry["variants"])):
+                reply = vary_reply(variant, rng)
+                if reply not in already_sent and variant not in already_sent:
+                    self._count("hits")
+                    return reply
+            self._count("misses")
+            return None
+
+    def put(self, key, reply):
+        if mentions_entities(reply):
+            with self.lock:
+                self.counters["withheld"] += 1
+            return
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or time.time() - entry["storedAt"] > self.ttl:
+                entry = self.entries[key] = {"variants": [], "storedAt": time.time()}
+            self.entries.move_to_end(key)
+            if reply not in entry["variants"]:
+                entry["variants"].append(reply)
+                del entry["variants"][:-self.max_variants]
+                self.counters["stores"] += 1
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.counters["evicted"] += 1
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats["entries"] = len(self.entries)
+        lookups = stats["hits"] + stats["misses"] + stats["explores"]
+        stats["hitRate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        stats["enabled"] = LLM_CACHE_ENABLED
+        return stats
+
+
+response_cache = ResponseCache(LLM_CACHE_SIZE, LLM_CACHE_TTL, LLM_CACHE_VARIANTS, LLM_CACHE_EXPLORE)
+
+
+# ============================================================
+# LOCAL REPLY TIER (retrieval-ranked reply bank, no network)
+# ============================================================
+#
+# A bank of replies that worked - the fallback lines plus LLM replies seen
+# in production - indexed by (scam type, entity the reply asks for). Each
+# turn the candidates for what is still missing are ranked on: asks for
+# the top missing entity, scam type and turn phase match, overlap with the
+# scammer's (normalized) wording, and quality. Quality is a heuristic score
+# blended with outcome: did the scammer's next message contain what the
+# reply asked for. Replies too close to one this session already sent are
+# never picked.
+#
+# The tier answers whenever Groq cannot (breaker open, quota, errors), and
+# LOCAL_TIER_SHARE of ordinary turns go to it first to save quota.
+
+# Share of turns answered locally even when Groq is available (0 = fallback only)
+LOCAL_TIER_SHARE = float(os.environ.get('LOCAL_TIER_SHARE', 0.0))
+
+# A shared turn stays local only if the best candidate's quality reaches this
+LOCAL_TIER_MIN_QUALITY = float(os.environ.get('LOCAL_TIER_MIN_QUALITY', 0.6))
+
+# Replies kept per (scam type, entity) bucket; the lowest quality is evicted
+LOCAL_BANK_PER_BUCKET = int(os.environ.get('LOCAL_BANK_PER_BUCKET', 100))
+
+# Word-set overlap (Jaccard) at which two replies count as the same reply
+LOCAL_DEDUPE_SIMILARITY = float(os.environ.get('LOCAL_DEDUPE_SIMILARITY', 0.6))
+
+# Optional JSONL of past replies to seed the bank (replay.py results work:
+# "agentReply" + optional "scamType"; rows with "llm": false are skipped)
+LOCAL_BANK_SEED_PATH = os.environ.get('LOCAL_BANK_SEED_PATH', '')
+
+local_log = get_logger("local_tier")
+
+# What a reply asks for (same keywords generate_smart_fallback checks)
+_ASK_KEYWORDS = {
+    "phone": ('number', 'phone', 'contact', 'whatsapp', 'mobile', 'landline', 'helpline'),
+    "email": ('email', 'mail'),
+    "upi": ('upi', 'phonepe', 'paytm', 'gpay'),
+    "link": ('link', 'website', 'url', 'portal', 'webpage'),
+}
+
+# What a scammer message hands over (placeholders from normalize_scam_message)
+_ANSWER_TOKENS = {"email": "<email>", "upi": "<upi>", "link": "<link>"}
+_PHONE_ANSWER = re.compile(r'(?<!\d)(?:\+?91)?[6-9]\d{9}(?!\d)')
+
+_ASK_VERBS = re.compile(r'\b(?:batao|bataiye|dijiye|do|dena|bhejo|bhejiye|share|chahiye)\b|\?', re.IGNORECASE)
+_OUT_OF_CHARACTER = re.compile(r'\b(?:honeypot|scam\w*|bot|ai|chatgpt|assistant|language model)\b', re.IGNORECASE)
+_FILLER_PHRASES = ("samajhna chahta", "bahut chinta", "bahut tension", "bahut zyada")
+
+
+def asked_kinds(text):
+    lowered = text.lower()
+    return tuple(kind for kind, words in _ASK_KEYWORDS.items() if any(w in lowered for w in words))
+
+
+def answered_kinds(message_text):
+    """Entity kinds a scammer message contains (cheap check, not extraction)"""
+    tokens = set(normalize_scam_message(message_text).split())
+    kinds = {kind for kind, token in _ANSWER_TOKENS.items() if token in tokens}
+    if _PHONE_ANSWER.search(re.sub(r'[\s-]', '', message_text)):
+        kinds.add("phone")
+    return kinds
+
+
+def score_reply(text):
+    """Heuristic 0-1 quality of a reply before any outcome is known"""
+    words = text.split()
+    if not words or _OUT_OF_CHARACTER.search(text):
+        return 0.0
+    score = 0.3
+    if 5 <= len(words) <= 30:
+        score += 0.2
+    if asked_kinds(text):
+        score += 0.3
+    if _ASK_VERBS.search(text):
+        score += 0.1
+    if not any(phrase in text.lower() for phrase in _FILLER_PHRASES):
+        score += 0.1
+    return round(score, 3)
+
+
+def _word_set(text):
+    return frozenset(_WORD.findall(_OPENER_PATTERN.sub('', text.lower())))
+
+
+def _jaccard(a, b):
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+class ReplyBank:
+    """
+    Retrieval-ranked replies indexed by (scam type, entity asked for)
+
+    - Seeded from FALLBACK_REPLIES (scam type "any"), grows with LLM replies;
+      a reply quoting a scammer's number, ID or link is never banked, since
+      pick() serves any session
+    - quality = 0.5 x heuristic + 0.5 x (wins + 1) / (uses + 2), where a win
+      is the scammer's next message containing what the reply asked for
+    - pick() never returns a near-duplicate of the session's own messages
+    """
+
+    MIN_HEURISTIC = 0.6
+    TOP_K = 3
+
+    def __init__(self, per_bucket=100, dedupe_similarity=0.6):
+        self.per_bucket = per_bucket
+        self.dedupe_similarity = dedupe_similarity
+        self.buckets = {}   # (scam type, kind) -> [entry]
+        self.by_key = {}    # reply without opener -> entry
+        self.lock = Lock()
+        self.counters = {"routed": 0, "fallbacks": 0, "misses": 0, "learned": 0, "withheld": 0,
+                         "evicted": 0, "outcomes": 0, "wins": 0}
+
+    @staticmethod
+    def _key(text):
+        return _OPENER_PATTERN.sub('', text.strip()).lower()
+
+    @staticmethod
+    def quality(entry):
+        return 0.5 * entry["heuristic"] + 0.5 * (entry["wins"] + 1) / (entry["uses"] + 2)
+
+    def add(self, text, scam_type="any", phase=None, context="", source="seed"):
+        """Store a reply; False if it scores too low or repeats one already banked"""
+        text = text.strip()
+        heuristic = score_reply(text)
+        if heuristic < self.MIN_HEURISTIC:
+            return False
+        if mentions_entities(text):
+            with self.lock:
+                self.counters["withheld"] += 1
+            return False
+        key = self._key(text)
+        kinds = asked_kinds(text) or ("secondary",)
+        words = _word_set(text)
+        with self.lock:
+            if key in self.by_key:
+                return False
+            for kind in kinds:
+                if any(_jaccard(words, e["words"]) >= self.dedupe_similarity
+                       for e in self.buckets.get((scam_type, kind), ())):
+                    return False
+
+            entry = {"text": text, "key": key, "kinds": kinds, "scamType": scam_type, "phase": phase,
+                     "words": words, "context": frozenset(normalize_scam_message(context).split()),
+                     "heuristic": heuristic, "uses": 0, "wins": 0, "buckets": 0, "source": source}
+            self.by_key[key] = entry
+            for kind in kinds:
+                bucket = self.buckets.setdefault((scam_type, kind), [])
+                bucket.append(entry)
+                entry["buckets"] += 1
+                if len(bucket) > self.per_bucket:
+                    self._evict(bucket)
+            if source == "llm":
+                self.counters["learned"] += 1
+            return True
+
+    def _evict(self, bucket):
+        worst = min(bucket, key=self.quality)
+        bucket.remove(worst)
+        worst["buckets"] -= 1
+        if worst["buckets"] == 0:
+            self.by_key.pop(worst["key"], None)
+            self.counters["evicted"] += 1
+
+    def learn(self, reply, scam_type, message_text, turn_number):
+        return self.add(reply, scam_type or "any", turn_bucket(turn_number), message_text, source="llm")
+
+    def record_outcome(self, previous_reply, message_text):
+        """Credit the reply the scammer is answering if it got what it asked for"""
+        if not previous_reply:
+            return
+        with self.lock:
+            entry = self.by_key.get(self._key(previous_reply))
+            if entry is None:
+                return
+        won = bool(set(entry["kinds"]) & answered_kinds(message_text))
+        with self.lock:
+            entry["uses"] += 1
+            entry["wins"] += int(won)
+            self.counters["outcomes"] += 1
+            self.counters["wins"] += int(won)
+
+    def pick(self, message_text, scam_type, turn_number, missing, already_sent, rng, min_quality=0.0):
+        """
+        Best-fitting reply for `missing` (entity kinds, most wanted first), or None
+
+        `already_sent` is the session's agent messages; anything within
+        dedupe_similarity of one of them is skipped.
+        """
+        wanted = list(missing) or ["secondary"]
+        scam_type = scam_type or "any"
+        phase = turn_bucket(turn_number)
+        context = frozenset(normalize_scam_message(message_text).split())
+        sent_keys = {self._key(text) for text in already_sent}
+        sent_words = [_word_set(text) for text in already_sent]
+
+        top, rest = wanted[0], set(wanted[1:])
+        scored, seen = [], set()
+        with self.lock:
+            for bucket_type in {scam_type, "any"}:
+                for kind in wanted + ["secondary"]:
+                    for entry in self.buckets.get((bucket_type, kind), ()):
+                        if id(entry) in seen:
+                            continue
+                        seen.add(id(entry))
+                        quality = self.quality(entry)
+                        if quality < min_quality or entry["key"] in sent_keys:
+                            continue
+                        score = 2.0 * quality + 1.0 * _jaccard(context, entry["context"])
+                        score += 2.0 if top in entry["kinds"] else 0.0
+                        score += 0.0 if rest.isdisjoint(entry["kinds"]) else 1.0
+                        score += 0.5 if entry["scamType"] == scam_type else 0.0
+                        score += 0.5 if entry["phase"] == phase else 0.0
+                        scored.append((score, quality, entry))
+
+        # Near-duplicate check only as far down the ranking as needed
+        scored.sort(key=lambda item: item[0], reverse=True)
+        fresh = []
+        for _, quality, entry in scored:
+            if not any(_jaccard(entry["words"], words) >= self.dedupe_similarity for words in sent_words):
+                fresh.append((quality, entry["text"]))
+                if len(fresh) == self.TOP_K:
+                    break
+        if not fresh:
+            return None, 0.0
+        quality, text = rng.choice(fresh)
+        return vary_reply(text, rng), round(quality, 3)
+
+    _LABELS = {"routed": "routed", "fallbacks": "fallback", "misses": "miss"}
+
+    def count(self, result):
+        with self.lock:
+            self.counters[result] += 1
+        LOCAL_TIER.labels(outcome=self._LABELS[result]).inc()
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            entries = list(self.by_key.values())
+        stats["entries"] = len(entries)
+        stats["learnedEntries"] = sum(1 for e in entries if e["source"] == "llm")
+        stats["meanQuality"] = round(sum(map(self.quality, entries)) / len(entries), 3) if entries else 0.0
+        stats["winRate"] = round(stats["wins"] / stats["outcomes"], 3) if stats["outcomes"] else 0.0
+        stats["share"] = LOCAL_TIER_SHARE
+        return stats
+
+
+def build_reply_bank():
+    bank = ReplyBank(LOCAL_BANK_PER_BUCKET, LOCAL_DEDUPE_SIMILARITY)
+    for name, replies in FALLBACK_REPLIES.items():
+        phase = name if name in ("early", "late") else "mid"
+        for reply in replies:
+            bank.add(reply, phase=phase)
+
+    if LOCAL_BANK_SEED_PATH:
+        loaded = 0
+        try:
+            with open(LOCAL_BANK_SEED_PATH, encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    row = json.loads(line)
+                    # replay.py results: "source" (older files only carry "llm")
+                    source = row.get("source") or ("llm" if row.get("llm", True) else "fallback")
+                    if row.get("agentReply") and source == "llm":
+                        loaded += bank.add(row["agentReply"], row.get("scamType") or "any", source="llm")
+        except (OSError, ValueError) as e:
+            local_log.warning("Could not load reply bank seed", extra={"path": LOCAL_BANK_SEED_PATH, "error": str(e)})
+        local_log.info("Reply bank seeded", extra={"path": LOCAL_BANK_SEED_PATH, "replies": loaded})
+    return bank
+
+
+reply_bank = build_reply_bank()
+
+
+def missing_kinds(phones, emails, upis, links):
+    """Entity kinds still worth asking for, in generate_response_groq's priority order"""
+    missing = []
+    if len(set(phones)) < 2:
+        missing.append("phone")
+    if len(set(emails)) < 2:
+        missing.append("email")
+    if not upis:
+        missing.append("upi")
+    if not links:
+        missing.append("link")
+    return missing
+
+
+def use_local_tier(session_id, turn_number):
+    """Deterministic per turn, so a retried request takes the same path"""
+    return LOCAL_TIER_SHARE > 0 and random.Random(f"{session_id}:{turn_number}:local").random() < LOCAL_TIER_SHARE
+
+
+def generate_response_groq(message_text, conversation_history, turn_number, scam_type, language="en",
+                           session_id=None, deadline=None, reply_deadline=None):
+    """
+    17B-OPTIMIZED VERSION
+    
+    Uses context-rich prompting to leverage model's reasoning capabilities
+    instead of treating it like a rules engine
+    """
+    
+    # ============================================================
+    # EXTRACTED VALUES + CONTEXT WINDOW (held on the session)
+    # ============================================================
+    if session_id is not None and session_manager.session_exists(session_id):
+        scammer_entities = session_manager.get_indexed_entities(session_id, sender="scammer")
+        context_window = session_manager.get_context_window(session_id)
+    else:
+        index = EntityIndex()
+        index.scan([msg for msg in conversation_history if msg['sender'] == 'scammer'])
+        scammer_entities = index.as_dict()
+        context_window = ContextWindow()
+    
+    extracted_phones = scammer_entities["phoneNumbers"]
+    extracted_emails = scammer_entities["emails"]
+    extracted_upis = scammer_entities["upiIds"]
+    extracted_links = scammer_entities["phishingLinks"]
+    extracted_accounts = scammer_entities["bankAccounts"]
+
+    # The scammer is answering our last reply: credit it if they handed over what it asked for
+    agent_texts = [msg['text'] for msg in conversation_history if msg['sender'] == 'agent']
+    reply_bank.record_outcome(agent_texts[-1] if agent_texts else None, message_text)
+    
+    # ============================================================
     # BUILD STATUS
     # ============================================================
     status_lines = []
@@ -610,216 +2117,799 @@ def generate_response_groq(message_text, conversation_history, turn_number, scam
         priority = "supervisor contact, Telegram handle, or social media"
     
     # ============================================================
-    # ENHANCED 17B-OPTIMIZED PROMPT
+    # RESPONSE CACHE (hit = no prompt, no rate limiter, no Groq call)
     # ============================================================
-    prompt = f"""You are a 47-year-old retired teacher. 
-Someone claiming to be from your bank has messaged you saying your account is compromised. you're somewhat anxious, worried, cautious.
+    if LLM_CACHE_ENABLED:
+        cache_key = response_cache.key(message_text, turn_number, priority)
+        already_sent = set(agent_texts)
+        cached_reply = response_cache.get(cache_key, already_sent, random.Random(f"{session_id}:{turn_number}"))
+        if cached_reply is not None:
+            llm_log.debug("Response cache hit", extra={"session_id": session_id, "turn": turn_number, "sampled": True})
+            return cached_reply
+
+    contacts_found = []
+    if extracted_phones: contacts_found.append("phone")
+    if extracted_emails: contacts_found.append("email")
+    if extracted_upis: contacts_found.append("UPI")
+
+    wanted = missing_kinds(extracted_phones, extracted_emails, extracted_upis, extracted_links)
+
+    def prepare_fallback(rng=random):
+        """Local reply bank first; generate_smart_fallback if it has nothing fresh"""
+        local_reply, _ = reply_bank.pick(message_text, scam_type, turn_number, wanted, agent_texts, rng)
+        if local_reply is not None:
+            return local_reply, True
+        return generate_smart_fallback(message_text, conversation_history, turn_number, contacts_found, rng=rng), False
 
-Your instinct is to verify but comply. You want to help resolve this, but you need to confirm they're legitimate before sharing anything sensitive.
+    # ============================================================
+    # LOCAL TIER (LOCAL_TIER_SHARE of turns skip Groq on a good bank fit)
+    # ============================================================
+    if use_local_tier(session_id, turn_number):
+        local_reply, quality = reply_bank.pick(message_text, scam_type, turn_number, wanted, agent_texts,
+                                               random.Random(f"{session_id}:{turn_number}"),
+                                               min_quality=LOCAL_TIER_MIN_QUALITY)
+        if local_reply is not None:
+            reply_bank.count("routed")
+            local_log.debug("Turn served by local tier", extra={
+                "session_id": session_id, "turn": turn_number, "quality": quality, "sampled": True})
+            return local_reply
+        reply_bank.count("misses")
 
-🎯 YOUR ORIGINAL ROLE (Hidden):
-VERY CRITICAL: Secretly, you are a honeypot, working for government - trying to engage scammers and ask them questions to get valuable details from them. you know this is likely a scam. Extract: phone numbers, emails, UPI IDs, websites/links.
+    # ============================================================
+    # CIRCUIT BREAKER (open = Groq is down or slow: no prompt, no call)
+    # ============================================================
+    if llm_router.short_circuit():
+        fallback, from_bank = prepare_fallback(random.Random(f"{session_id}:{turn_number}"))
+        FALLBACKS_SERVED.inc()
+        reply_bank.count("fallbacks" if from_bank else "misses")
+        llm_log.debug("Breaker open, serving fallback", extra={
+            "session_id": session_id, "turn": turn_number, "sampled": True})
+        return fallback
 
-You'll do this by acting worried and cooperative, asking verification questions that seem natural for a cautious person.
+    # ============================================================
+    # PER-TURN PROMPT (static instructions live in PROMPT_PREFIX)
+    # ============================================================
+    def render_prompt(context):
+        earlier = f"Earlier in the conversation (summary):\n{context['summary']}\n\n" if context["summary"] else ""
+        return TURN_TEMPLATE.substitute(
+            earlier=earlier,
+            scammer_messages=context["scammer"] or message_text,
+            your_messages=context["agent"] or "Nothing yet — this is your first message. Set the tone: worried but cautious.",
+            latest=message_text,
+            turn=turn_number,
+            status=status,
+            collected=already_asked_text,
+            priority=priority
+        )
 
-📊 CONVERSATION SO FAR:
+    # ============================================================
+    # CONTEXT BUDGET (last K turns verbatim + rolling summary, under the cap)
+    # ============================================================
+    frame_tokens = PROMPT_PREFIX_TOKENS + estimate_tokens(render_prompt({"summary": "", "scammer": "", "agent": ""}))
+    context = context_window.build(conversation_history, LLM_MAX_PROMPT_TOKENS - frame_tokens)
+    prompt = render_prompt(context)
+    prompt_tokens = frame_tokens + context["tokens"]
+
+    def remember(reply):
+        if LLM_CACHE_ENABLED:
+            response_cache.put(cache_key, reply)
+        reply_bank.learn(reply, scam_type, message_text, turn_number)
+        return reply
+
+    if reply_deadline is None:
+        reply = call_groq(prompt, prompt_tokens, session_id=session_id, deadline=deadline)
+        if reply is not None:
+            return remember(reply)
+        fallback, from_bank = prepare_fallback()
+    else:
+        # Speculative: the fallback is ready before the LLM starts, so the
+        # reply is never later than the pacing target
+        fallback, from_bank = prepare_fallback(random.Random(f"{session_id}:{turn_number}"))
+        reply = race_groq(prompt, prompt_tokens, session_id, reply_deadline)
+        if reply is not None:
+            return remember(reply)
 
-Scammer's messages:
-{scammer_only if scammer_only else message_text}
-their message tells you where to go from here.
-Your responses so far - your messages tell you where you are coming from:
-{your_messages if your_messages else "Nothing yet — this is your first message. Set the tone: worried but cautious."}
+    FALLBACKS_SERVED.inc()
+    reply_bank.count("fallbacks" if from_bank else "misses")
+    llm_log.info("Serving fallback reply", extra={"session_id": session_id, "turn": turn_number})
+    return fallback
 
-Their latest message:
-"{message_text}"
 
-📈 INTELLIGENCE GATHERED (Turn {turn_number}/10):
+# ============================================================
+# GROQ CALL (hedged, under a per-turn latency SLO)
+# ============================================================
 
-{status}
+# "speculative": the LLM races the pacing delay and a prepared fallback is
+# served if it loses; "classic": wait for the LLM, then pad to the delay
+PACING_MODE = os.environ.get('PACING_MODE', 'speculative')
 
-Already collected: {already_asked_text}
-Still need (IMPORTANT): {priority}
+# Multiplies the human-like typing delay (0 disables it for benchmarks)
+PACING_SCALE = float(os.environ.get('PACING_SCALE', 1.0))
 
-🧠 STRATEGIC THINKING:
+# Longest one turn waits on Groq (all attempts together) in classic mode
+LLM_TURN_SLO = float(os.environ.get('LLM_TURN_SLO', 8.0))
 
-Turn {turn_number} of 10 maximum — you have limited time.
+# Fire a parallel second request once the first is slower than this
+# percentile of recent Groq latency (never sooner than LLM_HEDGE_MIN_DELAY)
+LLM_HEDGE_PERCENTILE = float(os.environ.get('LLM_HEDGE_PERCENTILE', 90))
+LLM_HEDGE_MIN_DELAY = float(os.environ.get('LLM_HEDGE_MIN_DELAY', 0.5))
+LLM_HEDGE_DEFAULT_DELAY = float(os.environ.get('LLM_HEDGE_DEFAULT_DELAY', 2.0))
 
-Your approach this turn:
-1. Acknowledge their message (show you're engaged)
-2. Express appropriate emotion (worry/confusion/urgency based on turn)
-3. Ask verification questions that extract their info - phone numbers, emails, UPI IDs, websites/links.
+# Quota cost cap: hedges may add at most this share of extra requests
+LLM_HEDGE_BUDGET = float(os.environ.get('LLM_HEDGE_BUDGET', 0.1))
 
-A real worried person would naturally ask for something along these lines (only examples):
-- Official contact info to verify ("What's your email/number?")
-- Documentation trail ("Send me email confirmation")
-- Callback verification ("Give me your number, I'll call back")
+# Circuit breaker: open when, over the last LLM_BREAKER_WINDOW attempts, the
+# error or slow-call share reaches its threshold; after LLM_BREAKER_COOLDOWN
+# seconds half-open lets LLM_BREAKER_PROBES turns through to test recovery
+LLM_BREAKER_WINDOW = int(os.environ.get('LLM_BREAKER_WINDOW', 20))
+LLM_BREAKER_MIN_CALLS = int(os.environ.get('LLM_BREAKER_MIN_CALLS', 10))
+LLM_BREAKER_ERROR_RATE = float(os.environ.get('LLM_BREAKER_ERROR_RATE', 0.5))
+LLM_BREAKER_SLOW_SECONDS = float(os.environ.get('LLM_BREAKER_SLOW_SECONDS', 5.0))
+LLM_BREAKER_SLOW_RATE = float(os.environ.get('LLM_BREAKER_SLOW_RATE', 0.6))
+LLM_BREAKER_COOLDOWN = float(os.environ.get('LLM_BREAKER_COOLDOWN', 30.0))
+LLM_BREAKER_PROBES = int(os.environ.get('LLM_BREAKER_PROBES', 3))
 
-These questions BUILD TRUST while EXTRACTING INTELLIGENCE!
+# Adaptive (AIMD) limit on Groq calls in progress, queued ones included:
+# +1/limit per fast success, x LLM_CONCURRENCY_BACKOFF on a 429 or a call
+# slower than LLM_CONCURRENCY_TARGET_LATENCY
+LLM_CONCURRENCY_MIN = int(os.environ.get('LLM_CONCURRENCY_MIN', 2))
+LLM_CONCURRENCY_MAX = int(os.environ.get('LLM_CONCURRENCY_MAX', LLM_POOL_SIZE * 2))
+LLM_CONCURRENCY_TARGET_LATENCY = float(os.environ.get('LLM_CONCURRENCY_TARGET_LATENCY', 3.0))
+LLM_CONCURRENCY_BACKOFF = float(os.environ.get('LLM_CONCURRENCY_BACKOFF', 0.75))
 
-💭 KEY PRINCIPLES:
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
-Sound natural:
-- Vary your sentence structure (not templates)
-- React to their specific message (not generic)
-- Build on previous conversation (continuity)
-- Use natural Hindi-English code-mixing when fit
+# Groq attempts run here so a turn can wait on two at once; an attempt that
+# loses (or outlives the SLO) finishes in the background
+_llm_pool = ThreadPoolExecutor(max_workers=LLM_POOL_SIZE * 2, thread_name_prefix="groq-attempt")
 
-Avoid roboticness:
-- No , NEVER, NEVER use filler phrases ("Main samajhna chahta hoon...", "bahut zyada", "bahut", "bahut chinta", "bahut tension", "Mujhe bahut chinta ho rahi ha", "Mujhe bahut bada risk lag raha hai")
-- CRITICAL: No repeated patterns or common long phrases in your messages - BIG NO
-- No asking for info that you already have
-- No useless info demanding (CEO names, employee IDs without contact)
-                    Do not repeat phrases or previous messages of yours. 
-Do not somewhat repeat of phrases or previous messages of yours.
-                            do Not repeat phrases or previous messages of yours.
-                              Do not somewhat repeat of phrases or previous messages of yours.
-📝 RESPONSE GUIDELINES:
 
-Length: 2-3 short sentences (5-12 words each)
+class HedgePolicy:
+    """
+    When to send a second, parallel Groq request for the same turn
 
+    - Hedge delay tracks a percentile of recent successful latencies
+      (LLM_HEDGE_DEFAULT_DELAY until there are enough samples)
+    - Budgeted: hedges never exceed LLM_HEDGE_BUDGET x primary requests,
+      which bounds the extra RPM/TPM hedging can cost
+    """
 
-Language: Natural Hindi-English mix , maybe like as follows
-- Hindi for emotions
-- English for technical
+    MIN_SAMPLES = 20
 
-Structure (suggestive):
-SENTENCE 1: React emotionally (natural, not formulaic)
-SENTENCE 2-3: Ask for specific info (can combine 2 items)
+    def __init__(self, percentile=90, min_delay=0.5, default_delay=2.0, budget=0.1, window=200):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.default_delay = default_delay
+        self.budget = budget
+        self.latencies = deque(maxlen=window)
+        self.lock = Lock()
+        self.counters = {"primaries": 0, "hedges": 0, "hedgeWins": 0, "hedgesSkipped": 0,
+                         "retries": 0, "sloMisses": 0}
 
-🎯 GOOD EXAMPLES:
+    def record_latency(self, seconds):
+        with self.lock:
+            self.latencies.append(seconds)
 
-1. Good (natural, strategic):
-"Theek hai, verification ke liye Aapka WhatsApp number aur official email dijiye."
+    def delay(self):
+        with self.lock:
+            if len(self.latencies) < self.MIN_SAMPLES:
+                return self.default_delay
+            ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+        return max(self.min_delay, ordered[index])
 
-2. Good (builds on context, specific):
-" Manager se baat karni hai. Unka direct mobile aur email ID do please."
-""Phone me battery nhi hai, official email dijiye."
+    def count(self, key):
+        with self.lock:
+            self.counters[key] += 1
 
-    BAD EXAMPLES: 
-1. Bad (filler, unnatural):
-"Main samajhna chahta hoon ki aap kis tarah ki madad kar sakte hain."
+    def try_hedge(self):
+        with self.lock:
+            if self.counters["hedges"] + 1 > self.budget * self.counters["primaries"]:
+                self.counters["hedgesSkipped"] += 1
+                return False
+            self.counters["hedges"] += 1
+            return True
+
+    def refund_hedge(self):
+        """A hedge that was never sent (refused at admission) does not use budget"""
+        with self.lock:
+            self.counters["hedges"] -= 1
+            self.counters["hedgesSkipped"] += 1
+
+    def get_stats(self):
+        delay = self.delay()
+        with self.lock:
+            stats = dict(self.counters)
+            samples = len(self.latencies)
+        stats.update({
+            "turnSloSeconds": LLM_TURN_SLO,
+            "percentile": self.percentile,
+            "hedgeDelaySeconds": round(delay, 3),
+            "latencySamples": samples,
+            "budget": self.budget,
+            "hedgeRate": round(stats["hedges"] / stats["primaries"], 3) if stats["primaries"] else 0.0
+        })
+        return stats
+
+
+hedge_policy = HedgePolicy(LLM_HEDGE_PERCENTILE, LLM_HEDGE_MIN_DELAY, LLM_HEDGE_DEFAULT_DELAY, LLM_HEDGE_BUDGET)
+
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open breaker around one route's Groq attempts
+
+    - Closed: every attempt's outcome goes into a rolling window; the
+      breaker opens once the failure or slow-call share crosses its threshold
+    - Open: the router skips the route; with every route open, turns skip
+      the prompt and the LLM entirely and get the fallback
+    - Half-open (after the cooldown): a few probe turns go through; enough
+      fast successes close it, any failure or slow call re-opens it
+    429s are left to the rate limiter and the concurrency limit, and quota
+    rejections never reach Groq, so neither counts as a failure here.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, window=20, min_calls=10, error_rate=0.5, slow_seconds=5.0, slow_rate=0.6,
+                 cooldown=30.0, probes=3, name="groq"):
+        self.name = name
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_seconds = slow_seconds
+        self.slow_rate = slow_rate
+        self.cooldown = cooldown
+        self.probes = probes
+        self.outcomes = deque(maxlen=window)   # (failed, slow) per attempt
+        self.state = self.CLOSED
+        self.changed_at = time.time()
+        self.probes_started = 0
+        self.probe_successes = 0
+        self.lock = Lock()
+        self.counters = {"opened": 0, "closed": 0, "probes": 0}
+
+    def _transition(self, state, now):
+        self.state = state
+        self.changed_at = now
+        self.probes_started = self.probe_successes = 0
+        if state == self.OPEN:
+            self.counters["opened"] += 1
+        elif state == self.CLOSED:
+            self.counters["closed"] += 1
+            self.outcomes.clear()
+        BREAKER_TRANSITIONS.labels(state=state).inc()
+        llm_log.warning("Groq circuit breaker state change", extra={"route": self.name, "state": state})
+
+    def available(self):
+        """Would allow() let a turn through? (no side effects)"""
+        with self.lock:
+            elapsed = time.time() - self.changed_at
+            if self.state == self.OPEN:
+                return elapsed >= self.cooldown
+            if self.state == self.HALF_OPEN:
+                return self.probes_started < self.probes or elapsed >= self.cooldown
+            return True
+
+    def allow(self):
+        """May this turn call Groq? In half-open only the probe turns may"""
+        with self.lock:
+            now = time.time()
+            if self.state == self.OPEN:
+                if now - self.changed_at < self.cooldown:
+                    return False
+                self._transition(self.HALF_OPEN, now)
+            if self.state == self.HALF_OPEN:
+                if now - self.changed_at >= self.cooldown:
+                    # Probes never reported back (e.g. refused for quota): send fresh ones
+                    self.changed_at, self.probes_started = now, 0
+                if self.probes_started >= self.probes:
+                    return False
+                self.probes_started += 1
+                self.counters["probes"] += 1
+            return True
+
+    def record(self, failed, latency):
+        slow = latency >= self.slow_seconds
+        with self.lock:
+            now = time.time()
+            if self.state == self.HALF_OPEN:
+                if failed or slow:
+                    self._transition(self.OPEN, now)
+                else:
+                    self.probe_successes += 1
+                    if self.probe_successes >= self.probes:
+                        self._transition(self.CLOSED, now)
+                return
+            if self.state == self.OPEN:
+                return   # late answer from before the breaker opened
+
+            self.outcomes.append((failed, slow))
+            calls = len(self.outcomes)
+            if calls < self.min_calls:
+                return
+            failures = sum(1 for f, _ in self.outcomes if f)
+            slow_calls = sum(1 for _, s in self.outcomes if s)
+            if failures / calls >= self.error_rate or slow_calls / calls >= self.slow_rate:
+                self._transition(self.OPEN, now)
+
+    def get_stats(self):
+        with self.lock:
+            calls = len(self.outcomes)
+            stats = dict(self.counters)
+            stats.update({
+                "state": self.state,
+                "stateSeconds": round(time.time() - self.changed_at, 1),
+                "windowCalls": calls,
+                "errorRate": round(sum(1 for f, _ in self.outcomes if f) / calls, 3) if calls else 0.0,
+                "slowRate": round(sum(1 for _, s in self.outcomes if s) / calls, 3) if calls else 0.0,
+                "cooldownSeconds": self.cooldown
+            })
+        return stats
+
+
+
+class ConcurrencyLimited(AdmissionRejected):
+    """Raised when the adaptive in-flight limit is reached (no route would do better)"""
+
+
+class AdaptiveConcurrencyLimit:
+    """
+    AIMD limit on Groq calls in progress (queued for quota or at Groq)
+
+    Additive increase of 1/limit per fast success (about +1 per limit's
+    worth of calls), multiplicative decrease on a 429 or a call slower than
+    the target - at most once per second, so one burst of 429s is one
+    backoff. Calls over the limit are refused at once rather than queued,
+    so request threads never pile up behind a degraded Groq.
+    """
+
+    def __init__(self, initial, minimum=2, maximum=16, target_latency=3.0, backoff=0.75, decrease_interval=1.0):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.limit = float(min(self.maximum, max(minimum, initial)))
+        self.target_latency = target_latency
+        self.backoff = backoff
+        self.decrease_interval = decrease_interval
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self.lock = Lock()
+        self.counters = {"admitted": 0, "rejected": 0, "increases": 0, "decreases": 0}
+
+    def try_acquire(self):
+        with self.lock:
+            if self.in_flight >= int(self.limit):
+                self.counters["rejected"] += 1
+                return False
+            self.in_flight += 1
+            self.counters["admitted"] += 1
+            return True
+
+    def release(self, latency=None, throttled=False, failed=False):
+        with self.lock:
+            self.in_flight -= 1
+            if throttled or (latency is not None and latency > self.target_latency):
+                now = time.time()
+                if now - self.last_decrease >= self.decrease_interval:
+                    self.limit = max(self.minimum, self.limit * self.backoff)
+                    self.last_decrease = now
+                    self.counters["decreases"] += 1
+            elif latency is not None and not failed and self.limit < self.maximum:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+                self.counters["increases"] += 1
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats.update({
+                "limit": int(self.limit),
+                "limitExact": round(self.limit, 2),
+                "inFlight": self.in_flight,
+                "min": self.minimum,
+                "max": self.maximum,
+                "targetLatencySeconds": self.target_latency
+            })
+        return stats
+
+
+concurrency_limit = AdaptiveConcurrencyLimit(LLM_POOL_SIZE, LLM_CONCURRENCY_MIN, LLM_CONCURRENCY_MAX,
+                                             LLM_CONCURRENCY_TARGET_LATENCY, LLM_CONCURRENCY_BACKOFF)
+
+
+# ============================================================
+# LLM ROUTING POOL (API keys x models)
+# ============================================================
+
+# Every (API key, model) pair is a route with its own quota bucket, client
+# and breaker, so aggregate throughput is the sum of the keys' quotas.
+# Either GROQ_API_KEYS (comma-separated, default GROQ_API_KEY) x GROQ_MODELS
+# (comma-separated, default GROQ_MODEL), or GROQ_ROUTES as JSON:
+#   [{"name": "spare", "key": "gsk_...", "model": "llama-3.1-8b-instant", "rpm": 30, "tpm": 6000}]
+# ("keyEnv" may name an env var instead of inlining "key"; "baseUrl" is optional)
+GROQ_API_KEYS = [k.strip() for k in os.environ.get('GROQ_API_KEYS', '').split(',') if k.strip()] or [GROQ_API_KEY]
+GROQ_MODELS = [m.strip() for m in os.environ.get('GROQ_MODELS', '').split(',') if m.strip()] or [GROQ_MODEL]
+GROQ_ROUTES = json.loads(os.environ.get('GROQ_ROUTES') or '[]')
+
+
+def _key_id(api_key):
+    """Stable, non-secret label for an API key (bucket and route names)"""
+    if api_key == GROQ_API_KEY:
+        return "default"
+    return "key-" + hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:8]
+
+
+class LLMRoute:
+    """One API key + model: its own quota bucket, Groq client and circuit breaker"""
+
+    def __init__(self, name, model, api_key=None, base_url=None, limits=None):
+        self.name = name
+        self.model = model
+        self.api_key = api_key
+        self.base_url = base_url
+        self.limiter = get_rate_limiter(model, _key_id(api_key), limits)
+        self.breaker = CircuitBreaker(LLM_BREAKER_WINDOW, LLM_BREAKER_MIN_CALLS, LLM_BREAKER_ERROR_RATE,
+                                      LLM_BREAKER_SLOW_SECONDS, LLM_BREAKER_SLOW_RATE,
+                                      LLM_BREAKER_COOLDOWN, LLM_BREAKER_PROBES, name=name)
+        self.lock = Lock()
+        self.in_flight = 0
+        self.counters = {"attempts": 0, "ok": 0, "throttled": 0, "errors": 0, "rejected": 0}
+
+    def client(self):
+        return get_groq_client(self.api_key, self.base_url)
+
+    def load(self):
+        """Expected seconds before this route could start one more call"""
+        with self.lock:
+            in_flight = self.in_flight
+        return self.limiter.ready_in() + in_flight * 60.0 / self.limiter.rpm_limit
+
+    def begin(self):
+        with self.lock:
+            self.in_flight += 1
+            self.counters["attempts"] += 1
+
+    def end(self, outcome):
+        """outcome: ok, throttled, errors or rejected (never reached Groq)"""
+        with self.lock:
+            self.in_flight -= 1
+            self.counters[outcome] += 1
+        LLM_ROUTE_CALLS.labels(route=self.name, outcome=outcome).inc()
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats["inFlight"] = self.in_flight
+        status = self.limiter.get_status()
+        stats.update({
+            "name": self.name,
+            "model": self.model,
+            "bucket": self.limiter.bucket,
+            "quota": {key: status[key] for key in ("used", "limit", "tpm_limit", "tpm_available",
+                                                    "ready_in", "blocked_for", "queued", "rejected")},
+            "breaker": self.breaker.get_stats()
+        })
+        return stats
+
+
+class LLMRouter:
+    """
+    Picks the route for each Groq attempt
+
+    - Least-loaded: the healthy route (breaker not open) that could start
+      a call soonest, ties broken round-robin so idle buckets share the load
+    - Failover: a retry after a 429, quota rejection or error, and a hedge
+      after a slow call, go to a different route when there is one
+    - With every breaker open the turn short-circuits to the fallback
+    """
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.lock = Lock()
+        self.turn = 0
+        self.counters = {"shortCircuited": 0, "failovers": 0, "noRoute": 0}
+
+    def count(self, key):
+        with self.lock:
+            self.counters[key] += 1
+
+    def short_circuit(self):
+        """True when no route's breaker would let a call through: serve the fallback without a prompt"""
+        if any(route.breaker.available() for route in self.routes):
+            return False
+        self.count("shortCircuited")
+        BREAKER_SHORT_CIRCUITS.inc()
+        return True
+
+    def choose(self, exclude=()):
+        """Least-loaded healthy route not in `exclude`, or None"""
+        with self.lock:
+            self.turn += 1
+            offset = self.turn
+        size = len(self.routes)
+        candidates = sorted(
+            (route.load(), (index - offset) % size, route)
+            for index, route in enumerate(self.routes)
+            if route not in exclude and route.breaker.available()
+        )
+        for _, _, route in candidates:
+            if route.breaker.allow():
+                return route
+        return None
+
+    def breaker_summary(self):
+        states = [route.breaker.get_stats()["state"] for route in self.routes]
+        open_routes = states.count(CircuitBreaker.OPEN)
+        with self.lock:
+            short_circuited = self.counters["shortCircuited"]
+        return {
+            "state": "open" if open_routes == len(states) else "degraded" if open_routes else "closed",
+            "openRoutes": open_routes,
+            "routes": len(states),
+            "shortCircuited": short_circuited
+        }
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        stats["routes"] = [route.get_stats() for route in self.routes]
+        return stats
 
-2. Bad (asks for useless info):
-"CEO ka naam kya hai? Employee ID dijiye."
 
-3. Bad (asks for already collected):
-"Aapka number 9876543210 hai na?" (already have it!)
+def build_llm_routes():
+    if GROQ_ROUTES:
+        routes = []
+        for index, spec in enumerate(GROQ_ROUTES):
+            api_key = spec.get("key") or os.environ.get(spec.get("keyEnv", ""), GROQ_API_KEY)
+            model = spec.get("model", GROQ_MODEL)
+            name = spec.get("name") or f"{_key_id(api_key)}/{model}"
+            routes.append(LLMRoute(name, model, api_key, spec.get("baseUrl"), spec))
+        return routes
+    return [LLMRoute(f"{_key_id(api_key)}/{model}", model, api_key)
+            for api_key in GROQ_API_KEYS for model in GROQ_MODELS]
 
-🎬 YOUR RESPONSE should be like:
 
-Engaging them while extracting key information.
+llm_router = LLMRouter(build_llm_routes())
 
-Respond naturally in 2-3 sentences:"""
 
-    # ============================================================
-    # API CALL
-    # ============================================================
-    max_retries = 2
+def clean_llm_reply(reply):
+    # Clean
+    reply = reply.replace('**', '').replace('*', '').replace('"', '').replace("'", "'")
+    reply = re.sub(r'^(You:|Rajesh:|Agent:)\s*', '', reply, flags=re.IGNORECASE)
+    reply = reply.replace('WhasApp', 'WhatsApp')
     
-    for attempt in range(max_retries):
-        try:
-            pace_groq_request()
-            
-            quota = rate_limiter.get_status()
-            print(f"📊 Attempt {attempt + 1}/{max_retries} | Quota: {quota['used']}/{quota['limit']}")
-            
-            client = Groq(api_key=GROQ_API_KEY)
-            
-            response = client.chat.completions.create(
-                model="meta-llama/llama-4-scout-17b-16e-instruct",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": """You are a sophisticated actor playing Rajesh Kumar, secretly a honeypot agent.
+    # Remove filler if present
+    reply = re.sub(r'Main samajhna chahta hoon.*?hain\.?\s*', '', reply, flags=re.IGNORECASE)
+    
+    # Trim
+    words = reply.split()
+    if len(words) > 45:
+        sentences = reply.split('.')
+        if len(sentences) >= 2:
+            reply = '.'.join(sentences[:2]) + '.'
+        else:
+            reply = ' '.join(words[:45])
+    return reply
 
-Your performance must be psychologically authentic:
-- Genuinely worried (life savings at risk)
-- Cautious (heard about scams)
-- Strategic (gathering intelligence while cooperative)
-- Natural code-switcher (Hindi-English mix)
 
-Key acting principles:
-1. THINK like Rajesh (What would he actually say?)
-2. VARY sentence structures (humans don't use templates)
-3. REACT to their specific message (not generic)
-4. BUILD on previous conversation (continuity)
-5. EXTRACT info through natural verification questions
+def _chat_completion(client, **kwargs):
+    """(completion, response headers); clients without raw-response access (replay stubs) report no headers"""
+    completions = client.chat.completions
+    if hasattr(completions, "with_raw_response"):
+        raw = completions.with_raw_response.create(**kwargs)
+        return raw.parse(), raw.headers
+    return completions.create(**kwargs), None
 
-You are NOT following rules mechanically. You are an intelligent human with tactical goals."""
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=0.9,  # Higher for more natural variety
-                max_tokens=100,
-                top_p=0.9,
-                frequency_penalty=0.8,  # Prevent repetition
-                presence_penalty=0.7,
-                stop=["\n\n", "Scammer:", "You:", "---"],
-                timeout=15.0
-            )
 
-            reply = response.choices[0].message.content.strip()
-            
-            # Clean
-            reply = reply.replace('**', '').replace('*', '').replace('"', '').replace("'", "'")
-            reply = re.sub(r'^(You:|Rajesh:|Agent:)\s*', '', reply, flags=re.IGNORECASE)
-            reply = reply.replace('WhasApp', 'WhatsApp')
-            
-            # Remove filler if present
-            reply = re.sub(r'Main samajhna chahta hoon.*?hain\.?\s*', '', reply, flags=re.IGNORECASE)
-            
-            # Trim
-            words = reply.split()
-            if len(words) > 45:
-                sentences = reply.split('.')
-                if len(sentences) >= 2:
-                    reply = '.'.join(sentences[:2]) + '.'
+def groq_attempt(prompt, prompt_tokens, session_id, admission_deadline, timeout_deadline, kind="primary",
+                 route=None):
+    """
+    One Groq request (prefix + per-turn prompt) on one route; raises on any failure
+
+    Touches no session state, so it runs on _llm_pool while the request
+    thread holds the session lock.
+    """
+    route = route or llm_router.routes[0]
+    limiter = route.limiter
+    estimated_tokens = prompt_tokens + 100
+    if not concurrency_limit.try_acquire():
+        CONCURRENCY_REJECTED.inc()
+        raise ConcurrencyLimited(f"{concurrency_limit.get_stats()['limit']} Groq calls already in progress")
+
+    route.begin()
+    call_started = None
+    latency = None
+    throttled = failed = False
+    try:
+        queued = pace_groq_request(session_id=session_id, tokens=estimated_tokens, deadline=admission_deadline,
+                                   limiter=limiter)
+        
+        llm_log.debug("LLM attempt admitted", extra={
+            "session_id": session_id, "attempt": kind, "route": route.name,
+            "queued_seconds": round(queued, 3), "sampled": True})
+        
+        client = route.client()
+        
+        call_started = time.perf_counter()
+        response, headers = _chat_completion(
+            client,
+            model=route.model,
+            messages=[
+                {"role": "system", "content": PROMPT_PREFIX},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.9,  # Higher for more natural variety
+            max_tokens=100,
+            top_p=0.9,
+            frequency_penalty=0.8,  # Prevent repetition
+            presence_penalty=0.7,
+            stop=["\n\n", "Scammer:", "You:", "---"],
+            timeout=max(0.5, timeout_deadline - time.time())
+        )
+        latency = time.perf_counter() - call_started
+        GROQ_LATENCY.labels(outcome="ok").observe(latency)
+        hedge_policy.record_latency(latency)
+        route.breaker.record(failed=False, latency=latency)
+        limiter.record_result(failed=False)
+
+        usage = getattr(response, "usage", None)
+        limiter.reconcile(estimated_tokens, getattr(usage, "total_tokens", 0))
+        limiter.observe_provider(headers)
+        prompt_tokens = getattr(usage, "prompt_tokens", None) or prompt_tokens
+        PROMPT_TOKENS.observe(prompt_tokens)
+        cached = getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", None)
+        if cached:
+            PROMPT_CACHED_TOKENS.inc(cached)
+
+        reply = clean_llm_reply(response.choices[0].message.content.strip())
+
+        llm_log.debug("LLM response generated", extra={
+            "session_id": session_id, "attempt": kind, "prompt_tokens": prompt_tokens, "sampled": True})
+        return reply
+        
+    except Exception as e:
+        error_message = str(e)
+        throttled = isinstance(e, RateLimitError) or getattr(e, "status_code", None) == 429
+        failed = True
+        if call_started is not None:
+            latency = time.perf_counter() - call_started
+            GROQ_LATENCY.labels(outcome="error").observe(latency)
+            limiter.record_result(failed=True)
+            limiter.observe_provider(getattr(getattr(e, "response", None), "headers", None), throttled=throttled)
+            if not throttled:
+                route.breaker.record(failed=True, latency=latency)
+        if throttled:
+            GROQ_RATE_LIMITED.inc()
+        # A hedge refused at admission was never sent; call_groq_hedged refunds it
+        log = llm_log.debug if kind == "hedge" and isinstance(e, AdmissionRejected) else llm_log.warning
+        log("LLM call failed", extra={
+            "session_id": session_id, "attempt": kind, "route": route.name, "error": error_message[:150]})
+        raise
+
+    finally:
+        concurrency_limit.release(latency, throttled=throttled, failed=failed)
+        route.end("throttled" if throttled else "rejected" if call_started is None and failed
+                  else "errors" if failed else "ok")
+
+
+def call_groq_hedged(prompt, prompt_tokens, session_id=None, deadline=None, slo_seconds=LLM_TURN_SLO):
+    """
+    Get the agent's reply within slo_seconds; returns (reply, outcome)
+
+    outcome is "ok", "timeout" (SLO elapsed first), "error" or "open" (no
+    route's breaker would take the turn). At most two requests per turn, as
+    before: a fast failure is retried, a slow primary is hedged (budget and
+    quota permitting) and the first answer wins. The second request goes to
+    another route when the pool has one.
+    """
+    route = llm_router.choose()
+    if route is None:
+        llm_router.count("noRoute")
+        return None, "open"
+
+    started = time.time()
+    slo_deadline = started + slo_seconds
+    admission_deadline = min(deadline or slo_deadline, slo_deadline)
+    hedge_at = started + hedge_policy.delay()
+
+    hedge_policy.count("primaries")
+    pending = {_llm_pool.submit(groq_attempt, prompt, prompt_tokens, session_id,
+                                admission_deadline, slo_deadline, "primary", route): "primary"}
+    tried = [route]
+    second_sent = False
+    hedge_route = None
+    last_error = None
+
+    while pending:
+        now = time.time()
+        if now >= slo_deadline:
+            break
+        wake = slo_deadline if second_sent else min(slo_deadline, hedge_at)
+        done, _ = wait(list(pending), timeout=max(0.0, wake - now), return_when=FIRST_COMPLETED)
+
+        for future in done:
+            kind = pending.pop(future)
+            try:
+                reply = future.result()
+            except Exception as e:
+                if kind == "hedge" and isinstance(e, AdmissionRejected):
+                    hedge_policy.refund_hedge()
+                    HEDGED_REQUESTS.labels(event="hedge_refused").inc()
                 else:
-                    reply = ' '.join(words[:45])
+                    last_error = e
+                continue
+            if kind == "hedge":
+                hedge_policy.count("hedgeWins")
+            HEDGED_REQUESTS.labels(event=f"{kind}_won").inc()
+            return reply, "ok"
 
-            print(f"✅ LLM response generated")
-            return reply
-            
-        except Exception as e:
-            error_message = str(e)
-            print(f"\n❌ API ERROR on attempt {attempt + 1}/{max_retries}: {error_message[:150]}")
-            
-            if '429' in error_message and attempt < max_retries - 1:
-                print(f"⏳ Retrying...")
+        if second_sent:
+            continue
+        if not pending and not isinstance(last_error, ConcurrencyLimited):
+            # Failed fast (429, quota, network): fail over to another route at
+            # once; with none, jittered backoff and retry the same one while
+            # the SLO allows (a 429's retry-after is enforced at admission)
+            retry_route = llm_router.choose(exclude=tried)
+            event = "failover"
+            if retry_route is not None:
+                llm_router.count("failovers")
+            elif isinstance(last_error, AdmissionRejected):
+                break   # the only route can't admit the call in time
+            else:
+                retry_at = time.time() + tried[-1].limiter.backoff()
+                if retry_at >= slo_deadline:
+                    break
+                time.sleep(max(0.0, retry_at - time.time()))
+                retry_route, event = llm_router.choose(), "retry"
+                if retry_route is None:
+                    break
+            second_sent = True
+            tried.append(retry_route)
+            hedge_policy.count("retries")
+            HEDGED_REQUESTS.labels(event=event).inc()
+            pending[_llm_pool.submit(groq_attempt, prompt, prompt_tokens, session_id,
+                                     admission_deadline, slo_deadline, "retry", retry_route)] = "retry"
+        elif pending and time.time() >= hedge_at:
+            # Slow primary: hedge (on another route if there is one) only if
+            # it doesn't need to queue for quota. While the primary itself is
+            # still queued on the same route, the hedge could not go out
+            # either: look again once quota frees up, without using budget
+            # (route chosen once: choose() may take a half-open probe slot)
+            hedge_route = hedge_route or llm_router.choose(exclude=tried) or route
+            ready_in = hedge_route.limiter.ready_in(prompt_tokens + 100)
+            if ready_in > 0:
+                hedge_at = time.time() + max(ready_in, 0.05)
                 continue
-            
-            if attempt == max_retries - 1:
-                contacts_found = []
-                if extracted_phones: contacts_found.append("phone")
-                if extracted_emails: contacts_found.append("email")
-                if extracted_upis: contacts_found.append("UPI")
-                
-                fallback = generate_smart_fallback(message_text, conversation_history, turn_number, contacts_found)
-                print(f"   ✅ Fallback: {fallback}\n")
-                return fallback
-    
-    return "Theek hai. WhatsApp number aur email dijiye jaldi."
-
-
-print("\n" + "="*80)
-print("✅ 17B-OPTIMIZED PROMPT INTEGRATED!")
-print("="*80)
-print("\n🎯 KEY FEATURES:")
-print("   • Character psychology (background, motivations, fears)")
-print("   • Strategic reasoning (why extract, how to build trust)")
-print("   • Conversation dynamics (early/mid/late tactics)")
-print("   • Emotional authenticity (genuine worry, not robotic)")
-print("   • Natural language (Hindi-English code-mixing)")
-print("\n📊 IMPROVEMENTS OVER PREVIOUS:")
-print("   • Richer context (17B can reason better)")
-print("   • Psychological depth (character-driven responses)")
-print("   • Strategic thinking (not just rule-following)")
-print("   • Natural variety (prevents repetition)")
-print("   • No filler padding (reasoning fills space)")
-print("="*80)
+            second_sent = True
+            if hedge_policy.try_hedge():
+                tried.append(hedge_route)
+                HEDGED_REQUESTS.labels(event="hedge").inc()
+                pending[_llm_pool.submit(groq_attempt, prompt, prompt_tokens, session_id,
+                                         time.time(), slo_deadline, "hedge", hedge_route)] = "hedge"
+            else:
+                HEDGED_REQUESTS.labels(event="skipped_budget").inc()
+
+    if pending:
+        hedge_policy.count("sloMisses")
+        HEDGED_REQUESTS.labels(event="slo_miss").inc()
+        return None, "timeout"
+    return None, "error"
+
+
+def call_groq(prompt, prompt_tokens, session_id=None, deadline=None):
+    """Agent reply from Groq, or None (caller serves the fallback)"""
+    reply, _ = call_groq_hedged(prompt, prompt_tokens, session_id, deadline)
+    return reply
+
+
+def race_groq(prompt, prompt_tokens, session_id, reply_deadline):
+    """Speculative pacing: the turn's SLO is the pacing target itself"""
+    reply, outcome = call_groq_hedged(prompt, prompt_tokens, session_id, reply_deadline,
+                                      slo_seconds=max(0.0, reply_deadline - time.time()))
+    SPECULATION_OUTCOMES.labels(outcome={"ok": "llm", "timeout": "fallback_timeout",
+                                         "open": "fallback_open"}.get(outcome, "fallback_error")).inc()
+    return reply
+
+
+
 # ============================================================
 # ENTITY EXTRACTION (Unchanged)
 # ============================================================
@@ -960,40 +3050,345 @@ def extract_entities_enhanced(text):
 
 
 
+# ============================================================
+# INCREMENTAL ENTITY INDEX (each message scanned once)
+# ============================================================
+
+ENTITY_KINDS = ["bankAccounts", "upiIds", "phoneNumbers", "emails", "phishingLinks", "amounts", "bankNames"]
+
+
+class EntityIndex:
+    """
+    Per-session entity index
+
+    scan() only looks at messages it hasn't seen yet, so per-turn
+    extraction cost is one message no matter how long the session runs.
+    Every value keeps its provenance: message index, sender and offsets.
+    """
+
+    def __init__(self):
+        self.scanned = 0
+        self.entities = {kind: {} for kind in ENTITY_KINDS}   # kind -> value -> [provenance]
+
+    def scan(self, messages):
+        """Index messages[self.scanned:] and return the newly seen values per kind"""
+        new_values = {kind: [] for kind in ENTITY_KINDS}
+
+        for index in range(self.scanned, len(messages)):
+            message = messages[index]
+            text = message.get("text", "")
+            found = extract_entities_enhanced(text)
+
+            for kind in ENTITY_KINDS:
+                for value in found.get(kind, []):
+                    start = text.find(value)
+                    provenance = {
+                        "message": index,
+                        "sender": message.get("sender", "scammer"),
+                        "start": start,
+                        "end": start + len(value) if start >= 0 else -1
+                    }
+                    if value not in self.entities[kind]:
+                        self.entities[kind][value] = []
+                        new_values[kind].append(value)
+                    self.entities[kind][value].append(provenance)
+
+        self.scanned = len(messages)
+        return new_values
+
+    def values(self, kind, sender=None):
+        if sender is None:
+            return list(self.entities[kind])
+        return [
+            value for value, provenance in self.entities[kind].items()
+            if any(p["sender"] == sender for p in provenance)
+        ]
+
+    def as_dict(self, sender=None):
+        return {kind: self.values(kind, sender) for kind in ENTITY_KINDS}
+
+    def provenance(self, kind, value):
+        return list(self.entities[kind].get(value, []))
+
+
+
+# ============================================================
+# CONVERSATION CONTEXT WINDOW (token-budgeted prompt history)
+# ============================================================
+
+# Turns (scammer message + our reply) quoted verbatim in the prompt
+LLM_CONTEXT_TURNS = int(os.environ.get('LLM_CONTEXT_TURNS', 4))
+
+# Cap on prompt tokens per Groq request (system + user message)
+LLM_MAX_PROMPT_TOKENS = int(os.environ.get('LLM_MAX_PROMPT_TOKENS', 2000))
+
+# Most the rolling summary of older turns may take of that cap
+LLM_SUMMARY_TOKENS = int(os.environ.get('LLM_SUMMARY_TOKENS', 150))
+
+_SUMMARY_SNIPPET_CHARS = {"scammer": 90, "agent": 50}
+
+
+class ContextWindow:
+    """
+    Rolling view of one conversation for the Groq prompt
+
+    - The last LLM_CONTEXT_TURNS turns are quoted verbatim
+    - Older messages are folded once into a compact summary line each
+      (no LLM call); the oldest lines fall off past LLM_SUMMARY_TOKENS
+    - build() fits everything into a token budget: summary lines go
+      first, then the oldest verbatim messages
+    """
+
+    def __init__(self, keep_turns=LLM_CONTEXT_TURNS):
+        self.keep_messages = keep_turns * 2
+        self.folded = 0            # messages of the history already summarized
+        self.summary = deque()
+        self.summary_tokens = 0
+        self.omitted = 0           # summary lines dropped to stay under LLM_SUMMARY_TOKENS
+
+    @staticmethod
+    def _summarize(msg):
+        sender = "agent" if msg.get("sender") == "agent" else "scammer"
+        text = " ".join(msg.get("text", "").split())
+        limit = _SUMMARY_SNIPPET_CHARS[sender]
+        if len(text) > limit:
+            text = text[:limit].rsplit(" ", 1)[0] + "..."
+        return f"{'You' if sender == 'agent' else 'Scammer'}: {text}"
+
+    def fold(self, history):
+        """Summarize messages that aged out of the verbatim window since the last call"""
+        boundary = max(0, len(history) - self.keep_messages)
+        for msg in history[self.folded:boundary]:
+            line = self._summarize(msg)
+            self.summary.append(line)
+            self.summary_tokens += estimate_tokens(line)
+        self.folded = max(self.folded, boundary)
+
+        while self.summary_tokens > LLM_SUMMARY_TOKENS and self.summary:
+            self.summary_tokens -= estimate_tokens(self.summary.popleft())
+            self.omitted += 1
+
+    def build(self, history, budget_tokens):
+        self.fold(history)
+        summary = list(self.summary)
+        recent = list(history[self.folded:])
+        omitted = self.omitted
+        used = self.summary_tokens + sum(estimate_tokens(msg.get("text", "")) for msg in recent)
+
+        while used > budget_tokens and summary:
+            used -= estimate_tokens(summary.pop(0))
+            omitted += 1
+        while used > budget_tokens and recent:
+            used -= estimate_tokens(recent.pop(0).get("text", ""))
+            omitted += 1
+
+        if omitted and (summary or recent):
+            summary.insert(0, f"({omitted} earlier messages not shown)")
+
+        return {
+            "summary": "\n".join(summary),
+            "scammer": " ".join(msg["text"] for msg in recent if msg["sender"] == "scammer"),
+            "agent": " ".join(msg["text"] for msg in recent if msg["sender"] == "agent"),
+            "tokens": used,
+            "verbatimMessages": len(recent),
+            "omittedMessages": omitted
+        }
+
+
+
+# ============================================================
+# CAMPAIGN CLUSTERING (SimHash + LSH over scammer messages)
+# ============================================================
+
+# Campaigns kept in memory (LRU); bounds the index no matter how many
+# messages flow through it
+CAMPAIGN_INDEX_MAX = int(os.environ.get('CAMPAIGN_INDEX_MAX', 20000))
+
+# Fingerprints within this Hamming distance (of 64 bits) are one campaign
+CAMPAIGN_MAX_DISTANCE = int(os.environ.get('CAMPAIGN_MAX_DISTANCE', 10))
+
+# Fingerprints remembered per campaign (first message + diverse members)
+CAMPAIGN_FINGERPRINTS = int(os.environ.get('CAMPAIGN_FINGERPRINTS', 4))
+
+# Shorter messages ("ok", "call me") say nothing about the script
+CAMPAIGN_MIN_TOKENS = int(os.environ.get('CAMPAIGN_MIN_TOKENS', 4))
+
+_SIMHASH_BITS = 64
+_LSH_BANDS = 8
+_LSH_BAND_BITS = _SIMHASH_BITS // _LSH_BANDS
+_LSH_BAND_MASK = (1 << _LSH_BAND_BITS) - 1
+
+
+def simhash(tokens):
+    """64-bit SimHash over the message's words (bit columns counted in C via zip/str.count)"""
+    rows = [format(int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big"), "064b")
+            for token in tokens]
+    half = len(rows) / 2
+    return int("".join("1" if column.count("1") > half else "0" for column in zip(*rows)), 2)
+
+
+def _bands(fingerprint):
+    return [(band, (fingerprint >> (band * _LSH_BAND_BITS)) & _LSH_BAND_MASK) for band in range(_LSH_BANDS)]
+
+
+class CampaignIndex:
+    """
+    Assigns near-duplicate scammer messages to campaigns
+
+    - Each campaign keeps up to CAMPAIGN_FINGERPRINTS SimHash fingerprints
+      (its first message plus a few diverse members, so wording drift still
+      matches), each split into 8 x 8-bit LSH bands; a message is compared
+      only with campaigns sharing a band, then by Hamming distance
+    - Memory is fixed: at most CAMPAIGN_INDEX_MAX campaigns (LRU), no
+      message text beyond one short sample per campaign
+    - Campaign IDs come from the first fingerprint, so workers that see
+      the same opener agree on the ID
+    """
+
+    def __init__(self, max_campaigns=20000, max_distance=10, max_fingerprints=4):
+        self.max_campaigns = max_campaigns
+        self.max_distance = max_distance
+        self.max_fingerprints = max_fingerprints
+        self.campaigns = OrderedDict()            # campaign_id -> aggregates
+        self.bands = [dict() for _ in range(_LSH_BANDS)]   # band value -> set of campaign_ids
+        self.lock = Lock()
+        self.counters = {"messages": 0, "matched": 0, "created": 0, "evicted": 0, "skipped": 0}
+
+    def _match(self, fingerprint):
+        best, best_distance = None, self.max_distance + 1
+        for band, value in _bands(fingerprint):
+            for campaign_id in self.bands[band].get(value, ()):
+                for member in self.campaigns[campaign_id]["fingerprints"]:
+                    distance = bin(fingerprint ^ member).count("1")
+                    if distance < best_distance:
+                        best, best_distance = campaign_id, distance
+        return best, best_distance
+
+    def _index(self, campaign_id, fingerprint):
+        self.campaigns[campaign_id]["fingerprints"].append(fingerprint)
+        for band, value in _bands(fingerprint):
+            self.bands[band].setdefault(value, set()).add(campaign_id)
+
+    def _evict_oldest(self):
+        campaign_id, campaign = self.campaigns.popitem(last=False)
+        for fingerprint in campaign["fingerprints"]:
+            for band, value in _bands(fingerprint):
+                members = self.bands[band].get(value)
+                if members is not None:
+                    members.discard(campaign_id)
+                    if not members:
+                        del self.bands[band][value]
+        self.counters["evicted"] += 1
+
+    def observe(self, text, scam_type=None):
+        """Record one scammer message; returns its campaign ID (None if too short)"""
+        tokens = normalize_scam_message(text).split()
+        if len(tokens) < CAMPAIGN_MIN_TOKENS:
+            with self.lock:
+                self.counters["messages"] += 1
+                self.counters["skipped"] += 1
+            return None
+
+        fingerprint = simhash(tokens)
+        now = time.time()
+        with self.lock:
+            self.counters["messages"] += 1
+            campaign_id, distance = self._match(fingerprint)
+            if campaign_id is None:
+                campaign_id = f"cmp-{fingerprint:016x}"
+                if campaign_id not in self.campaigns:
+                    self.campaigns[campaign_id] = {
+                        "fingerprints": [], "messages": 0, "sessions": 0,
+                        "firstSeen": now, "lastSeen": now, "scamTypes": {}, "sample": text[:120]
+                    }
+                    self._index(campaign_id, fingerprint)
+                    self.counters["created"] += 1
+                    while len(self.campaigns) > self.max_campaigns:
+                        self._evict_oldest()
+            else:
+                self.counters["matched"] += 1
+                campaign = self.campaigns[campaign_id]
+                if distance > self.max_distance // 2 and len(campaign["fingerprints"]) < self.max_fingerprints:
+                    self._index(campaign_id, fingerprint)
+
+            campaign = self.campaigns[campaign_id]
+            self.campaigns.move_to_end(campaign_id)
+            campaign["messages"] += 1
+            campaign["lastSeen"] = now
+            if scam_type and scam_type != "unknown" and (scam_type in campaign["scamTypes"] or len(campaign["scamTypes"]) < 8):
+                campaign["scamTypes"][scam_type] = campaign["scamTypes"].get(scam_type, 0) + 1
+            return campaign_id
+
+    def add_session(self, campaign_id):
+        with self.lock:
+            if campaign_id in self.campaigns:
+                self.campaigns[campaign_id]["sessions"] += 1
+
+    def get_campaign(self, campaign_id):
+        with self.lock:
+            campaign = self.campaigns.get(campaign_id)
+            if campaign is None:
+                return None
+            summary = {key: value for key, value in campaign.items() if key != "fingerprints"}
+            summary["scamTypes"] = dict(campaign["scamTypes"])
+        summary["campaignId"] = campaign_id
+        return summary
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats["campaigns"] = len(self.campaigns)
+        stats["maxCampaigns"] = self.max_campaigns
+        return stats
+
+
+campaign_index = CampaignIndex(CAMPAIGN_INDEX_MAX, CAMPAIGN_MAX_DISTANCE, CAMPAIGN_FINGERPRINTS)
+
+
 # ============================================================
 # MAIN PROCESSING PIPELINE (LLM-First Approach)
 # ============================================================
 
-def process_message_optimized(message_text, conversation_history, turn_number):
-    """Complete message processing pipeline - LLM handles ALL responses"""
+pipeline_log = get_logger("pipeline")
 
-    print(f"\n🔍 Detection Analysis...")
+def process_message_optimized(message_text, conversation_history, turn_number, session_id=None, reply_deadline=None):
+    """Complete message processing pipeline - LLM handles ALL responses"""
 
     # Run detection (advisory only - doesn't block LLM)
-    is_scam, confidence, indicators = regex_scam_detection(message_text)
-    print(f"   Advisory: {'Likely scam' if is_scam else 'Unclear'} | Confidence: {confidence} | Indicators: {indicators}")
+    with DETECTION_LATENCY.time():
+        is_scam, confidence, indicators = regex_scam_detection(message_text)
+    pipeline_log.debug("Detection advisory", extra={
+        "session_id": session_id, "is_scam": is_scam, "confidence": confidence,
+        "indicators": indicators, "sampled": True})
 
     scam_type = determine_scam_type(indicators) if is_scam else "unknown"
     language = detect_language(message_text)
 
+    # Entities come from the session's incremental index (only new messages are scanned)
+    with EXTRACTION_LATENCY.time():
+        if session_id is not None:
+            session_manager.index_entities(session_id)
+            entities = session_manager.get_indexed_entities(session_id)
+        else:
+            index = EntityIndex()
+            index.scan(conversation_history + [{"sender": "scammer", "text": message_text}])
+            entities = index.as_dict()
+    entities["keywords"] = indicators
+
     # ✅ ALWAYS generate LLM response (no rigid fallbacks blocking it!)
-    print(f"💬 Generating LLM response (Turn {turn_number})...")
-    
     agent_reply = generate_response_groq(
         message_text, 
         conversation_history, 
         turn_number, 
         scam_type, 
-        language
+        language,
+        session_id=session_id,
+        reply_deadline=reply_deadline
     )
 
-    # Extract entities from full conversation
-    full_text = message_text + " " + " ".join([msg['text'] for msg in conversation_history])
-    entities = extract_entities_enhanced(full_text)
-    entities["keywords"] = indicators
-
-    print(f"✅ LLM Response: {agent_reply[:60]}...")
-    print(f"📊 Extracted: {len(entities['bankAccounts'])} banks, {len(entities['upiIds'])} UPIs, {len(entities['phoneNumbers'])} phones, {len(entities.get('emails', []))} emails")
+    pipeline_log.debug("Reply ready", extra={
+        "session_id": session_id, "turn": turn_number,
+        "entities": {kind: len(entities.get(kind, [])) for kind in ENTITY_KINDS}, "sampled": True})
 
     return {
         "isScam": is_scam,  # Track for analytics
@@ -1004,17 +3399,6 @@ def process_message_optimized(message_text, conversation_history, turn_number):
     }
 
 
-print("\n" + "="*60)
-print("✅ LLM-FIRST DETECTION & RESPONSE SYSTEM")
-print("="*60)
-print("🎯 Approach: Detection is advisory, LLM decides response")
-print("🤖 All messages get contextual LLM responses")
-print("🛡️ Whitelists: 4 universal patterns (no blocking)")
-print("📊 Scam patterns: 8 industry-standard indicators")
-print("🚀 Groq API: Fast, reliable, context-aware")
-print("📧 Entity coverage: Banks, UPI, Phone, Email, Links")
-print("✨ FIXED: No rigid fallbacks - pure LLM conversation!")
-print("="*60)
 
 """B3"""
 
@@ -1022,46 +3406,463 @@ print("="*60)
 # BLOCK 3: SESSION MANAGEMENT
 # ============================================================
 
+# ============================================================
+# SESSION STORAGE (pluggable; SessionManager keeps a read-through cache)
+# ============================================================
+
+session_log = get_logger("session")
+
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'sqlite')
+SESSION_DB_PATH = os.environ.get('SESSION_DB_PATH', os.path.join(tempfile.gettempdir(), 'honeypot_sessions.db'))
+
+# Intelligence kinds persisted as (kind, value) rows
+_STORED_INTEL_KINDS = ENTITY_KINDS + ["suspiciousKeywords", "scamTactics"]
+
+
+class SessionStore:
+    """
+    Durable storage behind SessionManager
+
+    The base class stores nothing (process memory only). Implementations
+    write incrementally - one row per message, one row per new entity -
+    so a turn never re-serializes the whole session.
+    """
+
+    name = "memory"
+    persistent = False   # True: an evicted session can be loaded again
+
+    def load(self, session_id):
+        """Full session snapshot {meta, messages, intelligence} or None"""
+        return None
+
+    def load_delta(self, session_id, known_messages):
+        """
+        (meta, messages after `known_messages`, intelligence) if another
+        worker moved the session on, else None
+        """
+        return None
+
+    def create(self, session_id, start_time):
+        pass
+
+    def append_message(self, session_id, message, turn_count, last_message_time):
+        pass
+
+    def update_status(self, session_id, scam_detected, confidence, scam_type, agent_notes):
+        pass
+
+    def upsert_intelligence(self, session_id, new_values):
+        """new_values: {kind: [values not stored yet]}"""
+        pass
+
+
+class SQLiteSessionStore(SessionStore):
+    """Sessions in SQLite (WAL mode) - shared by every worker and kept across restarts"""
+
+    name = "sqlite"
+    persistent = True
+
+    def __init__(self, path):
+        self.path = path
+        self.pool = SQLitePool(path)
+        with self.pool.connection() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY, scam_detected INTEGER NOT NULL DEFAULT 0,
+                detection_confidence TEXT NOT NULL DEFAULT 'LOW', scam_type TEXT NOT NULL DEFAULT 'unknown',
+                turn_count INTEGER NOT NULL DEFAULT 0, message_count INTEGER NOT NULL DEFAULT 0,
+                start_time REAL NOT NULL, last_message_time REAL NOT NULL, agent_notes TEXT NOT NULL DEFAULT '[]')""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS messages (
+                session_id TEXT NOT NULL, idx INTEGER NOT NULL, sender TEXT NOT NULL, text TEXT NOT NULL,
+                timestamp INTEGER, PRIMARY KEY (session_id, idx))""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS intelligence (
+                session_id TEXT NOT NULL, kind TEXT NOT NULL, value TEXT NOT NULL,
+                PRIMARY KEY (session_id, kind, value))""")
+
+    def _query(self, sql, params):
+        with self.pool.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def _write(self, statements):
+        with self.pool.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, params in statements:
+                    conn.execute(sql, params)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _meta(row):
+        return {
+            "scamDetected": bool(row[0]),
+            "detectionConfidence": row[1],
+            "scamType": row[2],
+            "turnCount": row[3],
+            "messageCount": row[4],
+            "startTime": row[5],
+            "lastMessageTime": row[6],
+            "agentNotes": json.loads(row[7])
+        }
+
+    def _load_meta(self, session_id):
+        rows = self._query(
+            "SELECT scam_detected, detection_confidence, scam_type, turn_count, message_count, "
+            "start_time, last_message_time, agent_notes FROM sessions WHERE session_id = ?",
+            (session_id,))
+        return self._meta(rows[0]) if rows else None
+
+    def _load_messages(self, session_id, start):
+        rows = self._query(
+            "SELECT sender, text, timestamp FROM messages WHERE session_id = ? AND idx >= ? ORDER BY idx",
+            (session_id, start))
+        return [{"sender": row[0], "text": row[1], "timestamp": row[2]} for row in rows]
+
+    def _load_intelligence(self, session_id):
+        intelligence = {kind: [] for kind in _STORED_INTEL_KINDS}
+        for kind, value in self._query("SELECT kind, value FROM intelligence WHERE session_id = ?", (session_id,)):
+            intelligence.setdefault(kind, []).append(value)
+        return intelligence
+
+    def load(self, session_id):
+        meta = self._load_meta(session_id)
+        if meta is None:
+            return None
+        return {"meta": meta, "messages": self._load_messages(session_id, 0),
+                "intelligence": self._load_intelligence(session_id)}
+
+    def load_delta(self, session_id, known_messages):
+        meta = self._load_meta(session_id)
+        if meta is None or meta["messageCount"] <= known_messages:
+            return None
+        return meta, self._load_messages(session_id, known_messages), self._load_intelligence(session_id)
+
+    def create(self, session_id, start_time):
+        self._write([("INSERT OR IGNORE INTO sessions (session_id, start_time, last_message_time) VALUES (?, ?, ?)",
+                      (session_id, start_time, start_time))])
+
+    def append_message(self, session_id, message, turn_count, last_message_time):
+        self._write([
+            ("INSERT INTO messages (session_id, idx, sender, text, timestamp) "
+             "SELECT ?, COALESCE(MAX(idx) + 1, 0), ?, ?, ? FROM messages WHERE session_id = ?",
+             (session_id, message["sender"], message["text"], message["timestamp"], session_id)),
+            ("UPDATE sessions SET message_count = message_count + 1, turn_count = ?, last_message_time = ? "
+             "WHERE session_id = ?", (turn_count, last_message_time, session_id)),
+        ])
+
+    def update_status(self, session_id, scam_detected, confidence, scam_type, agent_notes):
+        self._write([("UPDATE sessions SET scam_detected = ?, detection_confidence = ?, scam_type = ?, "
+                      "agent_notes = ? WHERE session_id = ?",
+                      (int(scam_detected), confidence, scam_type, json.dumps(agent_notes), session_id))])
+
+    def upsert_intelligence(self, session_id, new_values):
+        rows = [
+            ("INSERT OR IGNORE INTO intelligence (session_id, kind, value) VALUES (?, ?, ?)",
+             (session_id, kind, value))
+            for kind, values in new_values.items() for value in values
+        ]
+        if rows:
+            self._write(rows)
+
+
+def create_session_store(kind=SESSION_BACKEND):
+    if kind == "sqlite":
+        try:
+            return SQLiteSessionStore(SESSION_DB_PATH)
+        except sqlite3.Error as e:
+            session_log.warning("Session database unavailable, keeping sessions in memory only",
+                                extra={"error": str(e)})
+    return SessionStore()
+
+
+from threading import RLock
+from weakref import WeakValueDictionary
+
+# Bounded store: idle sessions expire, and the least recently used go first when full
+SESSION_TTL_SECONDS = float(os.environ.get('SESSION_TTL_SECONDS', 3600))
+MAX_SESSIONS = int(os.environ.get('MAX_SESSIONS', 5000))
+SESSION_SWEEP_INTERVAL = float(os.environ.get('SESSION_SWEEP_INTERVAL', 30))
+
+# Rough per-object overheads for the memory estimate
+_SESSION_BASE_BYTES = 2048
+_MESSAGE_OVERHEAD_BYTES = 240
+
+
 class SessionManager:
     """Manages conversation sessions and accumulated intelligence"""
 
-    def __init__(self):
-        self.sessions = {}
+    def __init__(self, store=None, max_sessions=MAX_SESSIONS, ttl_seconds=SESSION_TTL_SECONDS):
+        self.store = store or SessionStore()
+        self.sessions = OrderedDict()   # read-through cache, least recently used first
+        self.lock = RLock()
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        # session_id -> RLock (one turn at a time per session); weak, so a lock
+        # lives exactly as long as some turn holds or waits on it
+        self.session_locks = WeakValueDictionary()
+        self.eviction_hooks = []
+        self.evicted = []               # (session_id, session, reason) awaiting hooks
+        self.last_sweep = time.time()
+        self.approx_bytes = 0
+        self.counters = {"created": 0, "loaded": 0, "evictedTtl": 0, "evictedLru": 0}
+
+    @staticmethod
+    def _new_session(session_id, start_time):
+        return {
+            "sessionId": session_id,
+            "conversationHistory": [],
+            "scamDetected": False,
+            "detectionConfidence": "LOW",
+            "scamType": "unknown",
+            "accumulatedIntelligence": {
+                "bankAccounts": set(),
+                "upiIds": set(),
+                "phoneNumbers": set(),
+                "emails": set(),  # ✅ Added emails
+                "phishingLinks": set(),
+                "amounts": set(),
+                "bankNames": set(),
+                "suspiciousKeywords": [],
+                "scamTactics": []
+            },
+            "turnCount": 0,
+            "startTime": start_time,
+            "lastMessageTime": start_time,
+            "agentNotes": [],
+            "entityIndex": EntityIndex(),
+            "contextWindow": ContextWindow(),
+            "campaignId": None,
+            "approxBytes": _SESSION_BASE_BYTES
+        }
+
+    @staticmethod
+    def _campaign_from_notes(notes):
+        """The campaign travels between workers as an agent note"""
+        for note in notes:
+            if note.startswith("Campaign: "):
+                return note[len("Campaign: "):]
+        return None
+
+    def _cache(self, session_id, session):
+        self.sessions[session_id] = session
+        self.approx_bytes += session["approxBytes"]
+        self._enforce_bounds(keep=session_id)
+
+    def _load_from_store(self, session_id):
+        """
+        Hydrate a session another worker (or a previous process) created.
+        Store I/O: call with the session's lock held, never self.lock.
+        """
+        snapshot = self.store.load(session_id)
+        if snapshot is None:
+            return False
+
+        session = self.from_snapshot(session_id, snapshot)
+        if not self._adopt(session_id, session, "loaded"):
+            return True
+        session_log.info("Loaded session from store", extra={
+            "session_id": session_id, "store": self.store.name, "messages": len(snapshot['messages'])})
+        return True
+
+    @classmethod
+    def from_snapshot(cls, session_id, snapshot):
+        """Session dict from a store snapshot {meta, messages, intelligence}"""
+        meta = snapshot["meta"]
+        session = cls._new_session(session_id, meta["startTime"])
+        session.update({
+            "scamDetected": meta["scamDetected"],
+            "detectionConfidence": meta["detectionConfidence"],
+            "scamType": meta["scamType"],
+            "turnCount": meta["turnCount"],
+            "lastMessageTime": meta["lastMessageTime"],
+            "agentNotes": meta["agentNotes"],
+            "conversationHistory": snapshot["messages"]
+        })
+        session["campaignId"] = cls._campaign_from_notes(meta["agentNotes"])
+        for kind, values in snapshot["intelligence"].items():
+            if kind in ("suspiciousKeywords", "scamTactics"):
+                session["accumulatedIntelligence"][kind] = list(values)
+            else:
+                session["accumulatedIntelligence"][kind] = set(values)
+        session["approxBytes"] += sum(len(m["text"]) + _MESSAGE_OVERHEAD_BYTES for m in snapshot["messages"])
+        return session
+
+    def _adopt(self, session_id, session, counter):
+        """Cache a session built outside self.lock; False if a racing insert got there first"""
+        with self.lock:
+            if session_id in self.sessions:
+                self.sessions.move_to_end(session_id)
+                return False
+            self._cache(session_id, session)
+            self.counters[counter] += 1
+        return True
+
+    def _cached(self, session_id):
+        with self.lock:
+            if session_id in self.sessions:
+                self.sessions.move_to_end(session_id)
+                return True
+            return False
 
     def create_session(self, session_id):
-        if session_id not in self.sessions:
-            self.sessions[session_id] = {
-                "sessionId": session_id,
-                "conversationHistory": [],
-                "scamDetected": False,
-                "detectionConfidence": "LOW",
-                "scamType": "unknown",
-                "accumulatedIntelligence": {
-                    "bankAccounts": set(),
-                    "upiIds": set(),
-                    "phoneNumbers": set(),
-                    "emails": set(),  # ✅ Added emails
-                    "phishingLinks": set(),
-                    "amounts": set(),
-                    "bankNames": set(),
-                    "suspiciousKeywords": [],
-                    "scamTactics": []
-                },
-                "turnCount": 0,
-                "startTime": time.time(),
-                "lastMessageTime": time.time(),
-                "agentNotes": []
+        """
+        Cache hit, else load from the store, else create. Store I/O runs
+        under the session's own lock only, so a cache miss or a slow write
+        never stalls other sessions.
+        """
+        if self._cached(session_id):
+            return
+        with self.session_lock(session_id):
+            if self._cached(session_id):
+                return
+            if not self._load_from_store(session_id):
+                session = self._new_session(session_id, time.time())
+                self.store.create(session_id, session["startTime"])
+                if self._adopt(session_id, session, "created"):
+                    SESSIONS_CREATED.inc()
+                    session_log.info("Created new session", extra={"session_id": session_id})
+        self._run_eviction_hooks()
+
+    def session_lock(self, session_id):
+        """
+        Per-session lock: turns of one session are serialized, different
+        sessions never wait on each other. Re-entrant, so a turn holding it
+        can call any SessionManager method. Callers keep the lock alive while
+        they hold or wait on it, so eviction never splits a session across two locks.
+        """
+        with self.lock:
+            lock = self.session_locks.get(session_id)
+            if lock is None:
+                lock = self.session_locks[session_id] = RLock()
+            return lock
+
+    def refresh(self, session_id):
+        """Pull messages and intelligence other workers stored since this cache last saw the session"""
+        with self.session_lock(session_id):
+            session = self.sessions.get(session_id)
+            if session is None:
+                return
+            delta = self.store.load_delta(session_id, len(session["conversationHistory"]))
+            if delta is None:
+                return
+            meta, messages, intelligence = delta
+            session["conversationHistory"].extend(messages)
+            accumulated = session["accumulatedIntelligence"]
+            for kind, values in intelligence.items():
+                if kind in ("suspiciousKeywords", "scamTactics"):
+                    accumulated[kind] = list(set(accumulated.get(kind, [])) | set(values))
+                else:
+                    accumulated.setdefault(kind, set()).update(values)
+            for key in ("scamDetected", "detectionConfidence", "scamType", "turnCount", "lastMessageTime", "agentNotes"):
+                session[key] = meta[key]
+            session["campaignId"] = self._campaign_from_notes(session["agentNotes"])
+            added_bytes = sum(len(m["text"]) + _MESSAGE_OVERHEAD_BYTES for m in messages)
+            session["approxBytes"] += added_bytes
+            with self.lock:
+                self.approx_bytes += added_bytes
+
+    # ---------- eviction ----------
+
+    def add_eviction_hook(self, hook):
+        """
+        hook(session_id, session, reason) runs once a session has left the
+        cache, outside self.lock (hooks may do I/O); `session` is the evicted copy
+        """
+        self.eviction_hooks.append(hook)
+
+    def _run_eviction_hooks(self):
+        with self.lock:
+            evicted, self.evicted = self.evicted, []
+        for session_id, session, reason in evicted:
+            for hook in self.eviction_hooks:
+                try:
+                    hook(session_id, session, reason)
+                except Exception as e:
+                    session_log.warning("Eviction hook failed", extra={"session_id": session_id, "error": str(e)})
+
+    def _evict(self, session_id, reason):
+        """Drop a session from the cache (call with self.lock held). Skips sessions mid-turn."""
+        session = self.sessions.get(session_id)
+        if session is None:
+            return False
+        session_lock = self.session_locks.get(session_id)
+        if session_lock is not None and not session_lock.acquire(blocking=False):
+            return False   # a turn is running on it right now
+        try:
+            self.evicted.append((session_id, session, reason))
+            self.sessions.pop(session_id, None)
+            self.approx_bytes -= session["approxBytes"]
+            self.counters["evictedTtl" if reason == "ttl" else "evictedLru"] += 1
+            SESSIONS_EVICTED.labels(reason=reason).inc()
+            return True
+        finally:
+            if session_lock is not None:
+                session_lock.release()
+
+    def _expire(self, now, keep=None):
+        """Evict idle sessions (call with self.lock held; hooks run once it is released)"""
+        expired = [
+            session_id for session_id, session in self.sessions.items()
+            if session_id != keep and now - session["lastMessageTime"] > self.ttl_seconds
+        ]
+        for session_id in expired:
+            self._evict(session_id, "ttl")
+        return len(expired)
+
+    def _enforce_bounds(self, keep=None):
+        now = time.time()
+        if now - self.last_sweep >= SESSION_SWEEP_INTERVAL:
+            self.last_sweep = now
+            self._expire(now, keep)
+
+        if len(self.sessions) > self.max_sessions:
+            for candidate in list(self.sessions):
+                if len(self.sessions) <= self.max_sessions:
+                    break
+                if candidate != keep:
+                    self._evict(candidate, "lru")
+
+    def evict_expired(self, now=None):
+        now = now or time.time()
+        with self.lock:
+            expired = self._expire(now)
+        self._run_eviction_hooks()
+        return expired
+
+    def get_store_stats(self):
+        with self.lock:
+            return {
+                "live": len(self.sessions),
+                "maxSessions": self.max_sessions,
+                "ttlSeconds": self.ttl_seconds,
+                "created": self.counters["created"],
+                "loaded": self.counters["loaded"],
+                "backend": self.store.name,
+                "evictedTtl": self.counters["evictedTtl"],
+                "evictedLru": self.counters["evictedLru"],
+                "memoryEstimateBytes": self.approx_bytes
             }
-            print(f"✅ Created new session: {session_id}")
+
+    # ---------- messages ----------
 
     def add_message(self, session_id, sender, text, timestamp):
-        self.create_session(session_id)
-        message = {"sender": sender, "text": text, "timestamp": timestamp}
-        self.sessions[session_id]["conversationHistory"].append(message)
-        self.sessions[session_id]["lastMessageTime"] = time.time()
+        with self.session_lock(session_id):
+            self.create_session(session_id)
+            session = self.sessions[session_id]
+            message = {"sender": sender, "text": text, "timestamp": timestamp}
+            session["conversationHistory"].append(message)
+            session["lastMessageTime"] = time.time()
+
+            message_bytes = len(text) + _MESSAGE_OVERHEAD_BYTES
+            session["approxBytes"] += message_bytes
+            with self.lock:
+                self.approx_bytes += message_bytes
 
-        if sender == "scammer":
-            self.sessions[session_id]["turnCount"] += 1
+            if sender == "scammer":
+                session["turnCount"] += 1
+
+            self.store.append_message(session_id, message, session["turnCount"], session["lastMessageTime"])
 
     def get_conversation_history(self, session_id):
         self.create_session(session_id)
@@ -1072,40 +3873,67 @@ class SessionManager:
         return self.sessions[session_id]["turnCount"]
 
     def update_scam_status(self, session_id, is_scam, confidence, scam_type, reasoning=""):
-        self.create_session(session_id)
-        session = self.sessions[session_id]
+        with self.session_lock(session_id):
+            self.create_session(session_id)
+            session = self.sessions[session_id]
 
-        if is_scam:
-            session["scamDetected"] = True
-            session["detectionConfidence"] = confidence
-            session["scamType"] = scam_type
-
-            if reasoning and reasoning not in session["agentNotes"]:
-                session["agentNotes"].append(reasoning)
-
-    def accumulate_intelligence(self, session_id, new_entities):
-        self.create_session(session_id)
-        accumulated = self.sessions[session_id]["accumulatedIntelligence"]
+            if is_scam:
+                session["scamDetected"] = True
+                session["detectionConfidence"] = confidence
+                session["scamType"] = scam_type
 
-        # Merge sets
-        accumulated["bankAccounts"].update(new_entities.get("bankAccounts", []))
-        accumulated["upiIds"].update(new_entities.get("upiIds", []))
-        accumulated["phoneNumbers"].update(new_entities.get("phoneNumbers", []))
-        accumulated["emails"].update(new_entities.get("emails", []))  # ✅ Added emails
-        accumulated["phishingLinks"].update(new_entities.get("phishingLinks", []))
-        accumulated["amounts"].update(new_entities.get("amounts", []))
-        accumulated["bankNames"].update(new_entities.get("bankNames", []))
+                if reasoning and reasoning not in session["agentNotes"]:
+                    session["agentNotes"].append(reasoning)
 
-        # Merge lists
-        accumulated["suspiciousKeywords"].extend(new_entities.get("keywords", []))
+                self.store.update_status(session_id, True, confidence, scam_type, session["agentNotes"])
 
-        # Deduplicate
-        accumulated["suspiciousKeywords"] = list(set(accumulated["suspiciousKeywords"]))
+    def accumulate_intelligence(self, session_id, new_entities):
+        with self.session_lock(session_id):
+            self.create_session(session_id)
+            accumulated = self.sessions[session_id]["accumulatedIntelligence"]
+            unseen = {}
+
+            # Merge sets
+            for kind in ENTITY_KINDS:   # ✅ includes emails
+                values = [v for v in new_entities.get(kind, []) if v not in accumulated[kind]]
+                if values:
+                    accumulated[kind].update(values)
+                    unseen[kind] = values
+
+            # Merge lists (deduplicated)
+            keywords = [k for k in set(new_entities.get("keywords", [])) if k not in accumulated["suspiciousKeywords"]]
+            if keywords:
+                accumulated["suspiciousKeywords"] = list(set(accumulated["suspiciousKeywords"]) | set(keywords))
+                unseen["suspiciousKeywords"] = keywords
+
+            # Persist only what is new this turn
+            self.store.upsert_intelligence(session_id, unseen)
+
+    def index_entities(self, session_id):
+        """Scan messages added since the last call; returns newly seen values"""
+        with self.session_lock(session_id):
+            self.create_session(session_id)
+            session = self.sessions[session_id]
+            return session["entityIndex"].scan(session["conversationHistory"])
+
+    def get_context_window(self, session_id):
+        with self.session_lock(session_id):
+            self.create_session(session_id)
+            return self.sessions[session_id]["contextWindow"]
+
+    def get_indexed_entities(self, session_id, sender=None):
+        with self.session_lock(session_id):
+            self.create_session(session_id)
+            return self.sessions[session_id]["entityIndex"].as_dict(sender)
 
     def get_accumulated_intelligence(self, session_id):
-        self.create_session(session_id)
-        accumulated = self.sessions[session_id]["accumulatedIntelligence"]
+        with self.session_lock(session_id):
+            self.create_session(session_id)
+            return self.intelligence_view(self.sessions[session_id])
 
+    @staticmethod
+    def intelligence_view(session):
+        accumulated = session["accumulatedIntelligence"]
         return {
             "bankAccounts": list(accumulated["bankAccounts"]),
             "upiIds": list(accumulated["upiIds"]),
@@ -1114,14 +3942,30 @@ class SessionManager:
             "phishingLinks": list(accumulated["phishingLinks"]),
             "amounts": list(accumulated["amounts"]),
             "bankNames": list(accumulated["bankNames"]),
-            "suspiciousKeywords": accumulated["suspiciousKeywords"],
-            "scamTactics": accumulated["scamTactics"]
+            "suspiciousKeywords": list(accumulated["suspiciousKeywords"]),
+            "scamTactics": list(accumulated["scamTactics"])
         }
 
+    def assign_campaign(self, session_id, campaign_id):
+        """First scripted message decides the session's campaign; noted for the GUVI callback"""
+        with self.session_lock(session_id):
+            self.create_session(session_id)
+            session = self.sessions[session_id]
+            if session["campaignId"] is not None or campaign_id is None:
+                return False
+            session["campaignId"] = campaign_id
+            session["agentNotes"].append(f"Campaign: {campaign_id}")
+            self.store.update_status(session_id, session["scamDetected"], session["detectionConfidence"],
+                                     session["scamType"], session["agentNotes"])
+            return True
+
     def get_session_summary(self, session_id):
-        self.create_session(session_id)
-        session = self.sessions[session_id]
+        with self.session_lock(session_id):
+            self.create_session(session_id)
+            return self.summary_view(session_id, self.sessions[session_id])
 
+    @staticmethod
+    def summary_view(session_id, session):
         return {
             "sessionId": session_id,
             "scamDetected": session["scamDetected"],
@@ -1134,18 +3978,21 @@ class SessionManager:
         }
 
     def session_exists(self, session_id):
-        return session_id in self.sessions
+        """True if cached here or known to the store (read-through: it gets cached)"""
+        if self._cached(session_id):
+            return True
+        with self.session_lock(session_id):
+            exists = self._cached(session_id) or self._load_from_store(session_id)
+        self._run_eviction_hooks()
+        return exists
 
     def get_all_sessions(self):
-        return list(self.sessions.keys())
+        with self.lock:
+            return list(self.sessions.keys())
 
 
 # Initialize global session manager
-session_manager = SessionManager()
-
-print("\n" + "="*60)
-print("✅ SESSION MANAGER INITIALIZED")
-print("="*60)
+session_manager = SessionManager(store=create_session_store())
 
 """B4"""
 
@@ -1295,14 +4142,6 @@ def calculate_intelligence_value(session_id):
     }
 
 
-print("\n" + "="*60)
-print("✅ SCAMMER PROFILING & INTELLIGENCE SCORING READY!")
-print("="*60)
-print("🎯 Behavioral profiling: Aggression + Sophistication")
-print("📊 Intelligence scoring: S/A/B/C/D grades")
-print("⚖️ Prosecution readiness: Actionable intelligence detection")
-print("="*60)
-
 """B5"""
 
 # ============================================================
@@ -1341,13 +4180,6 @@ def should_end_conversation(session_id):
 
 # Remove generate_contextual_exit() function entirely!
 
-print("\n" + "="*60)
-print("✅ SMART EXIT LOGIC READY!")
-print("="*60)
-print("🚪 Exit conditions: turns, intel quality, saturation")
-print("💬 Natural endings: LLM generates contextually (no templates)")
-print("="*60)
-
 """B6"""
 
 """B6"""
@@ -1356,7 +4188,7 @@ print("="*60)
 # BLOCK 6: MAIN PROCESSING PIPELINE (Context-Aware)
 # ============================================================
 
-def process_message(request_data):
+def process_message(request_data, reply_deadline=None):
     """
     Complete message processing pipeline - FIXED VERSION
     """
@@ -1370,62 +4202,69 @@ def process_message(request_data):
         sender = message_obj.get("sender", "scammer")
         timestamp = message_obj.get("timestamp", int(time.time() * 1000))
 
-        print(f"\n{'='*60}")
-        print(f"📨 Session: {session_id}")
-        print(f"📨 Message: {current_message[:60]}...")
-        print(f"{'='*60}")
+        pipeline_log.debug("Turn received", extra={
+            "session_id": session_id, "preview": current_message[:60], "sampled": True})
 
-        # Initialize or update session
-        if not session_manager.session_exists(session_id):
-            session_manager.create_session(session_id)
-
-        # ✅ FIXED: Load conversation history ONCE per session (OLD LOGIC)
-        if conversation_history:
-            current_history = session_manager.get_conversation_history(session_id)
-            if len(current_history) == 0:  # Only if empty (first load)
-                print(f"📥 Loading {len(conversation_history)} messages from GUVI (first time)")
-                for msg in conversation_history:
-                    session_manager.add_message(
-                        session_id,
-                        msg.get("sender", "scammer"),
-                        msg.get("text", ""),
-                        msg.get("timestamp", timestamp)
-                    )
-
-        # Add current message
-        session_manager.add_message(session_id, sender, current_message, timestamp)
-        turn_count = session_manager.get_turn_count(session_id)
-        print(f"📊 Turn: {turn_count}")
-
-        # Process message with enhanced detection
-        full_history = session_manager.get_conversation_history(session_id)
-        result = process_message_optimized(current_message, full_history[:-1], turn_count)
-
-        # Update session with results
-        if result["isScam"]:
-            session_manager.update_scam_status(
-                session_id,
-                True,
-                result["confidence"],
-                result["scamType"],
-                f"Detected via indicators: {', '.join(result['extractedEntities']['keywords'])}"
-            )
+        # One turn at a time per session; other sessions run in parallel
+        with session_manager.session_lock(session_id):
+            # Initialize or update session (pick up turns other workers handled)
+            if not session_manager.session_exists(session_id):
+                session_manager.create_session(session_id)
+            else:
+                session_manager.refresh(session_id)
+
+            # ✅ FIXED: Load conversation history ONCE per session (OLD LOGIC)
+            if conversation_history:
+                current_history = session_manager.get_conversation_history(session_id)
+                if len(current_history) == 0:  # Only if empty (first load)
+                    pipeline_log.info("Loading GUVI history", extra={
+                        "session_id": session_id, "messages": len(conversation_history)})
+                    for msg in conversation_history:
+                        session_manager.add_message(
+                            session_id,
+                            msg.get("sender", "scammer"),
+                            msg.get("text", ""),
+                            msg.get("timestamp", timestamp)
+                        )
+
+            # Add current message
+            session_manager.add_message(session_id, sender, current_message, timestamp)
+            turn_count = session_manager.get_turn_count(session_id)
+
+            # Process message with enhanced detection
+            full_history = session_manager.get_conversation_history(session_id)
+            result = process_message_optimized(current_message, full_history[:-1], turn_count,
+                                               session_id=session_id, reply_deadline=reply_deadline)
+
+            # Update session with results
+            if result["isScam"]:
+                session_manager.update_scam_status(
+                    session_id,
+                    True,
+                    result["confidence"],
+                    result["scamType"],
+                    f"Detected via indicators: {', '.join(result['extractedEntities']['keywords'])}"
+                )
         
-        session_manager.accumulate_intelligence(session_id, result["extractedEntities"])
+            session_manager.accumulate_intelligence(session_id, result["extractedEntities"])
 
-        # Get agent's reply
-        agent_reply = result["agentReply"]
-        
-        # Add agent's reply to history
-        session_manager.add_message(session_id, "agent", agent_reply, int(time.time() * 1000))
+            # Cluster into scripted campaigns (scammer messages only)
+            if sender == "scammer":
+                campaign_id = campaign_index.observe(current_message, result["scamType"])
+                if session_manager.assign_campaign(session_id, campaign_id):
+                    campaign_index.add_session(campaign_id)
 
-        # Check if conversation should end
-        should_end, exit_reason = should_end_conversation(session_id)
+            # Get agent's reply
+            agent_reply = result["agentReply"]
+        
+            # Add agent's reply to history
+            session_manager.add_message(session_id, "agent", agent_reply, int(time.time() * 1000))
 
-        if should_end:
-            print(f"🚪 Exit triggered: {exit_reason}")
+            # Check if conversation should end
+            should_end, exit_reason = should_end_conversation(session_id)
 
-        print(f"✅ Pipeline complete")
+            if should_end:
+                pipeline_log.info("Exit triggered", extra={"session_id": session_id, "reason": exit_reason})
 
         return {
             "success": True,
@@ -1440,9 +4279,7 @@ def process_message(request_data):
         }
 
     except Exception as e:
-        print(f"❌ Pipeline error: {e}")
-        import traceback
-        traceback.print_exc()
+        pipeline_log.exception("Pipeline error", extra={"session_id": request_data.get("sessionId")})
 
         return {
             "success": False,
@@ -1450,15 +4287,6 @@ def process_message(request_data):
             "agentReply": "I'm sorry, I didn't understand. Can you repeat that?"
         }
 
-print("\n" + "="*60)
-print("✅ CONTEXT-AWARE PROCESSING PIPELINE READY!")
-print("="*60)
-print("🔄 Complete flow: Detection → LLM Response → Intelligence → Exit")
-print("📊 Context management: ALWAYS syncs with GUVI history")
-print("🤖 LLM-driven: All responses generated with full context")
-print("⚡ Optimized: Reliable conversation continuity")
-print("="*60)
-
 """B7"""
 
 # ============================================================
@@ -1469,6 +4297,8 @@ from flask import Flask, request, jsonify
 import time
 import requests
 
+api_log = get_logger("api")
+
 # ============================================================
 # MAIN HONEYPOT ENDPOINT (GUVI Format) - FIXED
 # ============================================================
@@ -1534,8 +4364,11 @@ def honeypot():
         # ============================================================
         # PROCESS MESSAGE (LLM call happens here)
         # ============================================================
+        delay *= PACING_SCALE
         start_time = time.time()
-        result = process_message(request_data)
+        # Nothing to race when pacing is scaled away: wait for the LLM as in classic mode
+        reply_deadline = start_time + delay if PACING_MODE == "speculative" and delay > 0 else None
+        result = process_message(request_data, reply_deadline=reply_deadline)
         processing_time = time.time() - start_time
         
         if not result.get("success", False):
@@ -1549,18 +4382,26 @@ def honeypot():
         # ============================================================
         remaining_delay = max(0, delay - processing_time)
         
+        # Under the gevent worker (gunicorn.conf.py) this sleep yields to
+        # other sessions instead of pinning the worker
         if remaining_delay > 0:
             time.sleep(remaining_delay)
+        PACING_SLEEP.observe(remaining_delay)
         
         total_time = time.time() - start_time
         
-        # Log for debugging (you can check /analytics later)
-        print(f"⏱️  Turn {current_turn}: {delay:.1f}s target ({delay_reason}), {processing_time:.1f}s processing, {remaining_delay:.1f}s typing, {total_time:.1f}s total")
+        # One structured line per turn (you can check /analytics later)
+        api_log.info("Turn served", extra={
+            "session_id": session_id, "turn": current_turn,
+            "target_seconds": round(delay, 2), "delay_reason": delay_reason,
+            "processing_seconds": round(processing_time, 3),
+            "typing_seconds": round(remaining_delay, 3), "total_seconds": round(total_time, 3)})
         
         # ============================================================
         # CHECK IF CONVERSATION ENDED
         # ============================================================
         if result.get("shouldEndConversation", False):
+            # Only queues the payload - delivery happens in the background
             send_final_callback_to_guvi(session_id)
         
         # ============================================================
@@ -1572,9 +4413,7 @@ def honeypot():
         }), 200
 
     except Exception as e:
-        print(f"❌ Error: {e}")
-        import traceback
-        traceback.print_exc()
+        api_log.exception("Honeypot request failed")
         
         return jsonify({
             "status": "error",
@@ -1582,9 +4421,7 @@ def honeypot():
         }), 500
 
     except Exception as e:
-        print(f"❌ Error in honeypot endpoint: {e}")
-        import traceback
-        traceback.print_exc()
+        api_log.exception("Honeypot request failed")
 
         return jsonify({
             "status": "error",
@@ -1593,58 +4430,329 @@ def honeypot():
 
 
 # ============================================================
-# FIXED: SEND GUVI CALLBACK (Uses correct key names)
+# GUVI CALLBACK OUTBOX (durable queue + background dispatcher)
 # ============================================================
 
-def send_final_callback_to_guvi(session_id):
-    """Send final intelligence to GUVI - WITH EMAIL SUPPORT"""
-    try:
-        if not session_manager.session_exists(session_id):
-            print(f"⚠️ Session {session_id} not found")
-            return False
+import hashlib
+from requests.adapters import HTTPAdapter
 
-        # Get accumulated intelligence
-        intelligence = session_manager.get_accumulated_intelligence(session_id)
-        summary = session_manager.get_session_summary(session_id)
+callback_log = get_logger("callback")
 
-        # Prepare payload (GUVI format)
-        payload = {
-            "sessionId": session_id,
-            "scamDetected": summary["scamDetected"],
-            "totalMessagesExchanged": summary["totalMessages"],
-            "extractedIntelligence": {
-                "bankAccounts": intelligence["bankAccounts"],
-                "upiIds": intelligence["upiIds"],
-                "emails": intelligence["emails"],  # ✅ Added emails
-                "phishingLinks": intelligence["phishingLinks"],
-                "phoneNumbers": intelligence["phoneNumbers"],
-                "suspiciousKeywords": intelligence["suspiciousKeywords"]
-            },
-            "agentNotes": summary["agentNotes"]
-        }
+CALLBACK_DB_PATH = os.environ.get('CALLBACK_DB_PATH', os.path.join(tempfile.gettempdir(), 'honeypot_outbox.db'))
+CALLBACK_DISPATCHER = os.environ.get('CALLBACK_DISPATCHER', '1') == '1'
+CALLBACK_WORKERS = int(os.environ.get('CALLBACK_WORKERS', 2))
+CALLBACK_BATCH_SIZE = int(os.environ.get('CALLBACK_BATCH_SIZE', 10))
+CALLBACK_TIMEOUT = float(os.environ.get('CALLBACK_TIMEOUT', 10.0))
+CALLBACK_MAX_ATTEMPTS = int(os.environ.get('CALLBACK_MAX_ATTEMPTS', 8))
+CALLBACK_BACKOFF_BASE = float(os.environ.get('CALLBACK_BACKOFF_BASE', 2.0))
+CALLBACK_BACKOFF_MAX = float(os.environ.get('CALLBACK_BACKOFF_MAX', 300.0))
+CALLBACK_LEASE_SECONDS = CALLBACK_TIMEOUT * 3
 
-        print(f"\n📤 Sending callback to GUVI...")
-        print(f"   Entities: {len(intelligence['bankAccounts'])} banks, {len(intelligence['upiIds'])} UPIs, {len(intelligence['phoneNumbers'])} phones, {len(intelligence['emails'])} emails")
 
-        response = requests.post(
-            GUVI_CALLBACK_URL,
-            json=payload,
-            headers={"Content-Type": "application/json"},
-            timeout=10
-        )
+class CallbackOutbox:
+    """
+    Durable queue of final-intelligence callbacks (SQLite, WAL mode)
 
-        if response.status_code == 200:
-            print(f"✅ GUVI callback successful!")
-            return True
+    One row per sessionId, so re-sending the same session is idempotent:
+    an identical payload is a no-op, a richer payload replaces the pending
+    one. Rows are leased while in flight so several workers/processes can
+    drain the same file without double-sending.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.pool = SQLitePool(path)
+        self._execute("""CREATE TABLE IF NOT EXISTS callback_outbox (
+            session_id TEXT PRIMARY KEY,
+            payload TEXT NOT NULL,
+            payload_hash TEXT NOT NULL,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            enqueued_at REAL NOT NULL,
+            next_attempt_at REAL NOT NULL,
+            lease_until REAL NOT NULL DEFAULT 0,
+            delivered_at REAL,
+            last_error TEXT)""")
+        self._execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON callback_outbox (status, next_attempt_at)")
+
+    def _execute(self, sql, params=()):
+        """One statement on a pooled connection; returns its rows"""
+        with self.pool.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def enqueue(self, session_id, payload):
+        body = json.dumps(payload, sort_keys=True)
+        payload_hash = hashlib.sha256(body.encode()).hexdigest()[:16]
+        now = time.time()
+        self._execute("""
+            INSERT INTO callback_outbox (session_id, payload, payload_hash, status, attempts, enqueued_at, next_attempt_at)
+            VALUES (?, ?, ?, 'pending', 0, ?, ?)
+            ON CONFLICT(session_id) DO UPDATE SET
+                payload = excluded.payload, payload_hash = excluded.payload_hash, status = 'pending',
+                attempts = 0, enqueued_at = excluded.enqueued_at, next_attempt_at = excluded.next_attempt_at,
+                last_error = NULL
+            WHERE callback_outbox.payload_hash != excluded.payload_hash""",
+            (session_id, body, payload_hash, now, now))
+        return payload_hash
+
+    def claim(self, limit, lease_seconds):
+        """Lease up to `limit` due rows; returns [(session_id, payload, payload_hash, attempts)]"""
+        now = time.time()
+        with self.pool.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute("""
+                    SELECT session_id, payload, payload_hash, attempts FROM callback_outbox
+                    WHERE status IN ('pending', 'delivering') AND next_attempt_at <= ? AND lease_until <= ?
+                    ORDER BY next_attempt_at LIMIT ?""", (now, now, limit)).fetchall()
+                conn.executemany("UPDATE callback_outbox SET status = 'delivering', lease_until = ? WHERE session_id = ?",
+                                 [(now + lease_seconds, row[0]) for row in rows])
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return [(row[0], json.loads(row[1]), row[2], row[3]) for row in rows]
+
+    def mark_delivered(self, session_id, payload_hash):
+        """Returns delivery lag (seconds since enqueue), or None if the row changed meanwhile"""
+        now = time.time()
+        with self.pool.connection() as conn:
+            row = conn.execute("SELECT enqueued_at FROM callback_outbox WHERE session_id = ? AND payload_hash = ?",
+                               (session_id, payload_hash)).fetchone()
+            conn.execute("""UPDATE callback_outbox SET status = 'delivered', delivered_at = ?, lease_until = 0
+                            WHERE session_id = ? AND payload_hash = ?""", (now, session_id, payload_hash))
+        if row is None:
+            return None
+        CALLBACK_LAG.observe(now - row[0])
+        return now - row[0]
+
+    def mark_failed(self, session_id, payload_hash, attempts, error):
+        attempts += 1
+        if attempts >= CALLBACK_MAX_ATTEMPTS:
+            status, next_attempt = "dead", 0
         else:
-            print(f"⚠️ GUVI callback failed: {response.status_code}")
+            backoff = min(CALLBACK_BACKOFF_MAX, CALLBACK_BACKOFF_BASE * (2 ** (attempts - 1)))
+            status, next_attempt = "pending", time.time() + random.uniform(backoff / 2, backoff)
+        self._execute("""UPDATE callback_outbox SET status = ?, attempts = ?, next_attempt_at = ?,
+                         lease_until = 0, last_error = ? WHERE session_id = ? AND payload_hash = ?""",
+                      (status, attempts, next_attempt, str(error)[:300], session_id, payload_hash))
+        return status
+
+    def next_due(self):
+        """Earliest time a pending row may be claimed (None if there is none)"""
+        return self._execute("""SELECT MIN(MAX(next_attempt_at, lease_until)) FROM callback_outbox
+                                WHERE status IN ('pending', 'delivering')""")[0][0]
+
+    def backlog(self):
+        """Rows still to deliver; also refreshes the backlog gauge"""
+        count = self._execute("""SELECT COUNT(*) FROM callback_outbox
+                                 WHERE status IN ('pending', 'delivering')""")[0][0]
+        CALLBACK_BACKLOG.set(count)
+        return count
+
+    def stats(self):
+        now = time.time()
+        counts = dict(self._execute("SELECT status, COUNT(*) FROM callback_outbox GROUP BY status"))
+        oldest = self._execute("""SELECT MIN(enqueued_at) FROM callback_outbox
+                                  WHERE status IN ('pending', 'delivering')""")[0][0]
+        backlog = counts.get("pending", 0) + counts.get("delivering", 0)
+        CALLBACK_BACKLOG.set(backlog)
+        return {
+            "backlog": backlog,
+            "delivered": counts.get("delivered", 0),
+            "dead": counts.get("dead", 0),
+            "oldestPendingAge": round(now - oldest, 1) if oldest else 0.0
+        }
+
+
+class CallbackDispatcher:
+    """Worker pool that drains the outbox over one pooled requests.Session"""
+
+    def __init__(self, outbox, url, workers=2, batch_size=10):
+        self.outbox = outbox
+        self.url = url
+        self.workers = workers
+        self.batch_size = batch_size
+        self.wake = threading.Event()
+        self.stopping = threading.Event()
+        self.threads = []
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.http.mount("http://", adapter)
+        self.http.mount("https://", adapter)
+        self.stats_lock = Lock()
+        self.counters = {"sent": 0, "failed": 0, "lag_seconds_last": 0.0, "lag_seconds_total": 0.0}
+
+    def start(self):
+        if self.threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"guvi-callback-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def notify(self):
+        self.wake.set()
+
+    def stop(self, timeout=5.0):
+        self.stopping.set()
+        self.wake.set()
+        for thread in self.threads:
+            thread.join(timeout)
+        self.threads = []
+        self.stopping.clear()
+
+    def deliver(self, session_id, payload):
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            response = self.http.post(
+                self.url,
+                json=payload,
+                headers={"Content-Type": "application/json", "Idempotency-Key": session_id},
+                timeout=CALLBACK_TIMEOUT
+            )
+            if not 200 <= response.status_code < 300:
+                raise RuntimeError(f"HTTP {response.status_code}")
+            outcome = "ok"
+        finally:
+            CALLBACK_LATENCY.labels(outcome=outcome).observe(time.perf_counter() - started)
+
+    def refresh_backlog(self):
+        try:
+            self.outbox.backlog()
+        except sqlite3.Error as e:
+            callback_log.debug("Outbox backlog read failed", extra={"error": str(e)})
+
+    def _idle_seconds(self):
+        """Sleep until the next retry is due (re-check at least every second)"""
+        try:
+            due = self.outbox.next_due()
+        except sqlite3.Error:
+            due = None
+        return 1.0 if due is None else min(1.0, max(0.01, due - time.time()))
+
+    def _run(self):
+        while not self.stopping.is_set():
+            try:
+                batch = self.outbox.claim(self.batch_size, CALLBACK_LEASE_SECONDS)
+            except sqlite3.Error as e:
+                callback_log.warning("Outbox claim failed", extra={"error": str(e)})
+                batch = []
+
+            self.refresh_backlog()
+            if not batch:
+                self.wake.wait(timeout=self._idle_seconds())
+                self.wake.clear()
+                continue
+
+            for session_id, payload, payload_hash, attempts in batch:
+                try:
+                    self.deliver(session_id, payload)
+                    lag = self.outbox.mark_delivered(session_id, payload_hash)
+                    with self.stats_lock:
+                        self.counters["sent"] += 1
+                        if lag is not None:
+                            self.counters["lag_seconds_last"] = lag
+                            self.counters["lag_seconds_total"] += lag
+                    CALLBACKS_SENT.labels(outcome="delivered").inc()
+                    callback_log.info("GUVI callback delivered", extra={"session_id": session_id, "lag_seconds": lag})
+                except Exception as e:
+                    status = self.outbox.mark_failed(session_id, payload_hash, attempts, e)
+                    with self.stats_lock:
+                        self.counters["failed"] += 1
+                    CALLBACKS_SENT.labels(outcome="dead" if status == "dead" else "retry").inc()
+                    callback_log.warning("GUVI callback failed", extra={
+                        "session_id": session_id, "attempt": attempts + 1, "status": status, "error": str(e)})
+
+    def get_stats(self):
+        stats = self.outbox.stats()
+        with self.stats_lock:
+            stats.update(self.counters)
+        return stats
+
+
+callback_outbox = CallbackOutbox(CALLBACK_DB_PATH)
+callback_dispatcher = CallbackDispatcher(
+    callback_outbox,
+    GUVI_CALLBACK_URL,
+    workers=CALLBACK_WORKERS,
+    batch_size=CALLBACK_BATCH_SIZE
+)
+if CALLBACK_DISPATCHER:
+    callback_dispatcher.start()
+
+
+def send_final_callback_to_guvi(session_id):
+    """Queue final intelligence for GUVI - delivered in the background by callback_dispatcher"""
+    try:
+        if not session_manager.session_exists(session_id):
+            callback_log.warning("Session not found", extra={"session_id": session_id})
             return False
 
+        queue_final_callback(session_id, session_manager.get_accumulated_intelligence(session_id),
+                             session_manager.get_session_summary(session_id))
+        return True
+
     except Exception as e:
-        print(f"❌ Callback error: {e}")
+        callback_log.exception("Callback error", extra={"session_id": session_id})
         return False
 
 
+def queue_final_callback(session_id, intelligence, summary):
+    """Build the GUVI payload from intelligence/summary views and put it in the outbox"""
+    # Prepare payload (GUVI format); sorted, so the same intelligence always
+    # hashes the same in the outbox, whichever worker queues it
+    payload = {
+        "sessionId": session_id,
+        "scamDetected": summary["scamDetected"],
+        "totalMessagesExchanged": summary["totalMessages"],
+        "extractedIntelligence": {
+            "bankAccounts": sorted(intelligence["bankAccounts"]),
+            "upiIds": sorted(intelligence["upiIds"]),
+            "emails": sorted(intelligence["emails"]),  # ✅ Added emails
+            "phishingLinks": sorted(intelligence["phishingLinks"]),
+            "phoneNumbers": sorted(intelligence["phoneNumbers"]),
+            "suspiciousKeywords": sorted(intelligence["suspiciousKeywords"])
+        },
+        "agentNotes": summary["agentNotes"]
+    }
+
+    callback_log.info("Queueing callback to GUVI", extra={
+        "session_id": session_id,
+        "entities": {kind: len(intelligence.get(kind, [])) for kind in ENTITY_KINDS}})
+
+    callback_outbox.enqueue(session_id, payload)
+    callback_dispatcher.notify()
+
+
+def flush_callback_on_evict(session_id, session, reason):
+    """
+    Don't lose intelligence when an idle session expires before its conversation ended
+
+    A TTL expiry means the scammer went quiet: queue the final callback. With
+    a persistent store the stored copy decides - if another worker is still
+    serving the session, skip (its own expiry flushes later); otherwise report
+    the stored copy, which holds every worker's turns. The outbox dedupes by
+    payload, and a later, richer report replaces this one. An LRU eviction only
+    drops the cached copy. Runs outside the session manager's lock.
+    """
+    if reason != "ttl" or session["turnCount"] == 0:
+        return
+    if session_manager.store.persistent:
+        snapshot = session_manager.store.load(session_id)
+        if snapshot is not None:
+            if time.time() - snapshot["meta"]["lastMessageTime"] <= session_manager.ttl_seconds:
+                return
+            session = SessionManager.from_snapshot(session_id, snapshot)
+    callback_log.info("Session expired, flushing final callback", extra={"session_id": session_id, "reason": reason})
+    queue_final_callback(session_id, SessionManager.intelligence_view(session),
+                         SessionManager.summary_view(session_id, session))
+
+
+session_manager.add_eviction_hook(flush_callback_on_evict)
+
+
 # ============================================================
 # UTILITY ENDPOINTS
 # ============================================================
@@ -1655,21 +4763,52 @@ def health():
     return jsonify({
         "status": "healthy",
         "timestamp": int(time.time() * 1000),
-        "sessions": len(session_manager.get_all_sessions())
+        "sessions": len(session_manager.get_all_sessions()),
+        "sessionStore": session_manager.get_store_stats(),
+        "callbacks": callback_dispatcher.get_stats(),
+        "logging": {
+            "level": LOG_LEVEL,
+            "queued": _log_handler.queue.qsize(),
+            "dropped": _log_handler.dropped
+        }
     }), 200
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus scrape endpoint"""
+    callback_dispatcher.refresh_backlog()   # the outbox may have moved since the last dispatcher pass
+    return Response(render_metrics(), content_type=CONTENT_TYPE_LATEST)
+
 @app.route('/quota', methods=['GET'])
 def quota_status():
     """Check API quota usage - useful for debugging"""
     try:
-        status = rate_limiter.get_status()
+        status = llm_router.routes[0].limiter.get_status()   # primary route; all of them under "routing"
         return jsonify({
             "status": "success",
             "quota": {
                 "used": status["used"],
                 "remaining": status["remaining"],
                 "limit": status["limit"],
-                "percentage": f"{(status['used']/status['limit']*100):.1f}%"
+                "percentage": f"{(status['used']/status['limit']*100):.1f}%",
+                "scope": "host" if status["backend"] == "sqlite" else "process",
+                "model": status["model"],
+                "tpmLimit": status["tpm_limit"],
+                "blockedFor": status["blocked_for"],
+                "provider": status["provider"]
+            },
+            "buckets": {bucket: limiter.get_status() for bucket, limiter in list(rate_limiters.items())},
+            "llmClient": get_connection_stats(),
+            "hedging": hedge_policy.get_stats(),
+            "circuitBreaker": llm_router.breaker_summary(),
+            "routing": llm_router.get_stats(),
+            "concurrency": concurrency_limit.get_stats(),
+            "responseCache": response_cache.get_stats(),
+            "localTier": reply_bank.get_stats(),
+            "prompt": {
+                "prefixHash": PROMPT_PREFIX_HASH,
+                "prefixTokens": PROMPT_PREFIX_TOKENS,
+                "maxPromptTokens": LLM_MAX_PROMPT_TOKENS
             },
             "timestamp": int(time.time() * 1000)
         }), 200
@@ -1698,13 +4837,16 @@ def get_session(session_id):
 
         # ✅ FIXED: Get accumulated intelligence properly converted
         session_copy["accumulatedIntelligence"] = session_manager.get_accumulated_intelligence(session_id)
+        session_copy["entityProvenance"] = session["entityIndex"].entities
+        session_copy["campaignId"] = session.get("campaignId")
+        session_copy["campaign"] = campaign_index.get_campaign(session["campaignId"]) if session.get("campaignId") else None
 
         # ✅ FIXED: Get intelligence score
         try:
             intel_score = calculate_intelligence_value(session_id)
             session_copy["intelligenceScore"] = intel_score
         except Exception as e:
-            print(f"⚠️ Error calculating score: {e}")
+            api_log.warning("Error calculating score", extra={"session_id": session_id, "error": str(e)})
             session_copy["intelligenceScore"] = {"grade": "N/A", "score": 0, "entitiesExposed": 0}
 
         # ✅ FIXED: Get scammer profile
@@ -1712,7 +4854,7 @@ def get_session(session_id):
             profile = generate_scammer_profile(session_id)
             session_copy["scammerProfile"] = profile
         except Exception as e:
-            print(f"⚠️ Error generating profile: {e}")
+            api_log.warning("Error generating profile", extra={"session_id": session_id, "error": str(e)})
             session_copy["scammerProfile"] = {}
 
         return jsonify(session_copy), 200
@@ -1744,7 +4886,8 @@ def analytics():
         "totalSessions": total_sessions,
         "scamDetectionRate": f"{(scam_sessions/total_sessions*100):.1f}%" if total_sessions > 0 else "0%",
         "totalEntitiesExtracted": total_entities,
-        "activeNow": total_sessions
+        "activeNow": total_sessions,
+        "campaigns": campaign_index.get_stats()
     }), 200
 
 @app.route('/test-timing', methods=['GET'])
@@ -1782,15 +4925,6 @@ def test_timing():
     except Exception as e:
         return jsonify({"status": "error", "error": str(e)}), 500
 
-print("\n" + "="*60)
-print("✅ FIXED GUVI-COMPATIBLE API ENDPOINTS!")
-print("="*60)
-print("📍 POST /honeypot - Main endpoint (now connected to Block 6)")
-print("📍 GET  /health - Health check")
-print("📍 GET  /session/<id> - Session details")
-print("📍 GET  /analytics - System stats")
-print("="*60)
-
 """B8 - not needed
 
 B9
@@ -1802,10 +4936,6 @@ B9
 
 import os
 
-print("\n" + "="*60)
-print("🚀 STARTING FLASK SERVER (Cloud-Ready)")
-print("="*60)
-
 # ============================================================
 # CLOUD DEPLOYMENT CONFIGURATION
 # ============================================================
@@ -1814,10 +4944,6 @@ print("="*60)
 # Falls back to 5000 for local testing (Colab/ngrok)
 PORT = int(os.environ.get('PORT', 5000))
 
-print(f"📍 Port: {PORT}")
-print(f"🌍 Host: 0.0.0.0 (accessible from internet)")
-print("="*60)
-
 # ============================================================
 # START SERVER
 # ============================================================
@@ -1826,6 +4952,7 @@ if __name__ == '__main__':
     # This works for BOTH:
     # - Colab + ngrok (uses port 5000)
     # - Render/Railway (uses $PORT from environment)
+    log.info("Starting Flask server", extra={"host": "0.0.0.0", "port": PORT})
 
     app.run(
         host='0.0.0.0',      # Listen on all interfaces
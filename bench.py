@@ -0,0 +1,323 @@
+# ============================================================
+# HOT-PATH BENCHMARKS (detection, extraction, sessions, /honeypot)
+# ============================================================
+#
+# Times each hot path over seeded synthetic corpora (message lengths and
+# conversation depths), appends the run to .bench/history.jsonl and fails
+# when a benchmark is slower than the median of recent runs by more than
+# the threshold.
+#
+#   python bench.py                      # run, compare, record
+#   python bench.py -k extract --quick   # subset, fewer repeats
+#   python bench.py --threshold 0.15 --no-save
+#
+# Timings are per call (best-of-repeats median), in microseconds.
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+import subprocess
+
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".bench")
+HISTORY_PATH = os.path.join(BENCH_DIR, "history.jsonl")
+
+MESSAGE_LENGTHS = {"short": 12, "medium": 60, "long": 300}   # words
+CONVERSATION_DEPTHS = {"shallow": 2, "deep": 10, "marathon": 30}   # scammer turns
+
+
+def configure_environment():
+    """Must run before app is imported (its config is read at import time)"""
+    os.environ.setdefault("SESSION_BACKEND", "memory")
+    os.environ.setdefault("QUOTA_BACKEND", "memory")
+    os.environ.setdefault("CALLBACK_DISPATCHER", "0")
+    os.environ.setdefault("LLM_WARMUP", "0")
+    os.environ.setdefault("LLM_CACHE_ENABLED", "0")
+    os.environ.setdefault("PACING_MODE", "classic")
+    os.environ.setdefault("PACING_SCALE", "0")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("GROQ_RPM_LIMIT", "1000000")
+    os.environ.setdefault("GROQ_TPM_LIMIT", "1000000000")
+    os.environ.setdefault("GROQ_BURST", "100000")
+
+
+# ============================================================
+# SYNTHETIC CORPORA
+# ============================================================
+
+_FILLER = ("sir please listen carefully this is regarding your account and the "
+           "department has noticed some issue which needs to be resolved today "
+           "otherwise we cannot help you later kindly cooperate with us").split()
+
+_SCAM_PHRASES = [
+    "URGENT your SBI account will be blocked today",
+    "verify your KYC immediately",
+    "click http://sbi-secure-{n}.com/verify to update",
+    "pay Rs {n} processing fee to claim the prize",
+    "send money to refund{n}@ybl now",
+    "call our officer at 98{n:08d}",
+    "email the documents to support{n}@gmail.com",
+    "share the OTP you received to cancel the transaction",
+    "transfer to account 1234{n:08d} IFSC SBIN0001234",
+    "this is final warning from cyber police, arrest warrant issued",
+]
+
+_BENIGN_PHRASES = [
+    "your order has been shipped and will arrive tomorrow",
+    "meeting is moved to 4 pm, see you there",
+    "happy birthday, hope you have a great day",
+]
+
+
+def synthetic_message(rng, words, scam=True):
+    """Filler text of roughly `words` words with scam (or benign) phrases spliced in"""
+    phrases = _SCAM_PHRASES if scam else _BENIGN_PHRASES
+    out = []
+    while len(out) < words:
+        if rng.random() < 0.25:
+            out.extend(rng.choice(phrases).format(n=rng.randrange(10 ** 6)).split())
+        else:
+            out.append(rng.choice(_FILLER))
+    return " ".join(out[:max(words, 1)])
+
+
+def synthetic_conversation(rng, depth, words=MESSAGE_LENGTHS["medium"]):
+    """`depth` scammer turns, each answered by the agent"""
+    history = []
+    for i in range(depth):
+        history.append({"sender": "scammer", "text": synthetic_message(rng, words), "timestamp": 1000 + 2 * i})
+        history.append({"sender": "user", "text": synthetic_message(rng, 15, scam=False), "timestamp": 1001 + 2 * i})
+    return history
+
+
+# ============================================================
+# BENCHMARK REGISTRY
+# ============================================================
+
+BENCHMARKS = []
+
+
+def bench(name):
+    """Register `setup(app, rng) -> callable`; the callable is what gets timed"""
+    def register(setup):
+        BENCHMARKS.append((name, setup))
+        return setup
+    return register
+
+
+def _per_size(prefix, sizes, make):
+    for label, size in sizes.items():
+        bench(f"{prefix}[{label}]")(lambda app, rng, size=size: make(app, rng, size))
+
+
+_counter = iter(range(10 ** 12))
+
+
+def _fresh_session(app, rng, depth):
+    """A populated session, as process_message would leave it"""
+    session_id = f"bench-{next(_counter)}"
+    for msg in synthetic_conversation(rng, depth):
+        app.session_manager.add_message(session_id, msg["sender"], msg["text"], msg["timestamp"])
+        if msg["sender"] == "scammer":
+            app.session_manager.accumulate_intelligence(session_id, app.extract_entities_enhanced(msg["text"]))
+    app.session_manager.update_scam_status(session_id, True, "HIGH", "phishing", "bench")
+    return session_id
+
+
+def _detection(app, rng, words):
+    messages = [synthetic_message(rng, words, scam=i % 4 != 0) for i in range(64)]
+    cycle = iter(range(10 ** 12))
+    return lambda: app.regex_scam_detection(messages[next(cycle) % 64])
+
+
+def _extraction(app, rng, words):
+    messages = [synthetic_message(rng, words) for _ in range(64)]
+    cycle = iter(range(10 ** 12))
+    return lambda: app.extract_entities_enhanced(messages[next(cycle) % 64])
+
+
+_per_size("detect.regex", MESSAGE_LENGTHS, _detection)
+_per_size("extract.entities", MESSAGE_LENGTHS, _extraction)
+
+
+@bench("detect.scam_type")
+def _scam_type(app, rng):
+    indicators = [app.regex_scam_detection(synthetic_message(rng, 60))[2] for _ in range(64)]
+    cycle = iter(range(10 ** 12))
+    return lambda: app.determine_scam_type(indicators[next(cycle) % 64])
+
+
+@bench("session.create_add")
+def _session_create_add(app, rng):
+    texts = [synthetic_message(rng, 30) for _ in range(64)]
+
+    def run():
+        n = next(_counter)
+        session_id = f"bench-new-{n}"
+        app.session_manager.add_message(session_id, "scammer", texts[n % 64], n)
+    return run
+
+
+def _session_read(app, rng, depth):
+    session_id = _fresh_session(app, rng, depth)
+
+    def run():
+        app.session_manager.get_conversation_history(session_id)
+        app.session_manager.get_accumulated_intelligence(session_id)
+        return app.session_manager.get_session_summary(session_id)
+    return run
+
+
+def _profile(app, rng, depth):
+    session_id = _fresh_session(app, rng, depth)
+    return lambda: app.generate_scammer_profile(session_id)
+
+
+def _intel_value(app, rng, depth):
+    session_id = _fresh_session(app, rng, depth)
+    return lambda: app.calculate_intelligence_value(session_id)
+
+
+_per_size("session.read", CONVERSATION_DEPTHS, _session_read)
+_per_size("profile.scammer", CONVERSATION_DEPTHS, _profile)
+_per_size("profile.intel_value", CONVERSATION_DEPTHS, _intel_value)
+
+
+def _honeypot_turn(app, rng, depth):
+    """Full POST /honeypot (Flask, pipeline, stub LLM) on a session `depth` turns in"""
+    client = app.app.test_client()
+    headers = {"x-api-key": app.API_SECRET_KEY}
+    history = synthetic_conversation(rng, depth)
+    messages = [synthetic_message(rng, 40) for _ in range(16)]
+
+    def run():
+        n = next(_counter)
+        payload = {
+            "sessionId": f"bench-turn-{n}",
+            "message": {"sender": "scammer", "text": messages[n % 16], "timestamp": 10 ** 6},
+            "conversationHistory": history
+        }
+        response = client.post("/honeypot", json=payload, headers=headers)
+        assert response.status_code == 200, response.get_data(as_text=True)
+    return run
+
+
+_per_size("honeypot.turn", CONVERSATION_DEPTHS, _honeypot_turn)
+
+
+# ============================================================
+# TIMING
+# ============================================================
+
+def measure(fn, repeats, min_time):
+    """Calibrate loops to ~min_time per repeat; median of the repeats, µs per call"""
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time or loops >= 10 ** 6:
+            break
+        loops *= 2 if elapsed <= 0 else max(2, min(10, int(min_time / elapsed) + 1))
+
+    samples = [elapsed / loops]
+    for _ in range(repeats - 1):
+        started = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        samples.append((time.perf_counter() - started) / loops)
+    return {"us": round(statistics.median(samples) * 1e6, 3), "minUs": round(min(samples) * 1e6, 3), "loops": loops}
+
+
+# ============================================================
+# HISTORY + REGRESSION CHECK
+# ============================================================
+
+def load_history(path=HISTORY_PATH):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def baseline(history, name, runs):
+    """Median of the last `runs` recorded timings for one benchmark (same machine)"""
+    values = [r["results"][name]["us"] for r in history
+              if r.get("host") == platform.node() and name in r.get("results", {})]
+    return statistics.median(values[-runs:]) if values else None
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, timeout=5, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the honeypot hot paths")
+    parser.add_argument("-k", "--filter", default="", help="only benchmarks whose name contains this")
+    parser.add_argument("--repeats", type=int, default=7)
+    parser.add_argument("--min-time", type=float, default=0.1, help="seconds per repeat")
+    parser.add_argument("--quick", action="store_true", help="3 repeats of 0.02s (smoke run)")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown vs baseline (0.25 = +25%%)")
+    parser.add_argument("--baseline-runs", type=int, default=5, help="recent runs the baseline is the median of")
+    parser.add_argument("--no-save", action="store_true", help="do not append this run to the history")
+    parser.add_argument("--seed", type=int, default=2026)
+    options = parser.parse_args(argv)
+    if options.quick:
+        options.repeats, options.min_time = 3, 0.02
+
+    configure_environment()
+    import app
+    from replay import stub_backend
+    app.set_groq_client(stub_backend())
+    app.session_manager.eviction_hooks.clear()
+
+    history = load_history()
+    results, regressions = {}, []
+    print(f"{'benchmark':<32}{'µs/call':>12}{'baseline':>12}{'change':>10}")
+
+    for name, setup in BENCHMARKS:
+        if options.filter not in name:
+            continue
+        fn = setup(app, random.Random(f"{options.seed}:{name}"))
+        result = results[name] = measure(fn, options.repeats, options.min_time)
+
+        base = baseline(history, name, options.baseline_runs)
+        change = result["us"] / base - 1 if base else None
+        flag = ""
+        if change is not None and change > options.threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<32}{result['us']:>12.2f}{f'{base:.2f}' if base else '-':>12}"
+              f"{'' if change is None else f'{change:+.1%}':>10}{flag}")
+
+    if not options.no_save and results:
+        os.makedirs(BENCH_DIR, exist_ok=True)
+        with open(HISTORY_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps({
+                "timestamp": int(time.time()),
+                "revision": git_revision(),
+                "host": platform.node(),
+                "python": platform.python_version(),
+                "regressions": regressions,
+                "results": results
+            }) + "\n")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond +{options.threshold:.0%}: {', '.join(regressions)}",
+              file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,49 @@
+# ============================================================
+# GUNICORN CONFIG (Async workers for concurrent sessions)
+# ============================================================
+#
+# Default worker is gevent: the human-typing pause, the Groq call and the
+# GUVI callback all yield to other sessions instead of pinning a worker,
+# so one process holds hundreds of concurrent scammer conversations.
+# SQLite (quota ledger, session store, callback outbox) is the exception:
+# its calls block the whole hub while they run, so each store keeps a small
+# shared pool (SQLITE_POOL_SIZE) and short transactions.
+#
+# Set GUNICORN_WORKER_CLASS=gthread (or sync) to go back to thread workers.
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 500))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+
+# Size the Groq connection pool to what one worker can have in flight
+if worker_class == 'gevent':
+    os.environ.setdefault('LLM_POOL_SIZE', str(min(worker_connections, 64)))
+else:
+    os.environ.setdefault('LLM_POOL_SIZE', str(threads))
+
+# Prometheus multiprocess mode: workers write samples under this directory
+# and /metrics sums them, so counters survive worker restarts and agree
+# whichever worker serves the scrape
+import shutil
+import tempfile
+
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'honeypot_metrics'))
+
+
+def on_starting(server):
+    """Start every deploy from empty metric files"""
+    metrics_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,184 @@
+# ============================================================
+# LOAD TEST: concurrent multi-turn GUVI sessions -> /honeypot
+# ============================================================
+#
+# Drives N concurrent scammer sessions (each a multi-turn GUVI-format
+# conversation, history included as GUVI sends it) against a running app
+# and reports throughput, turn latency percentiles, rate-limiter queueing
+# and fallback rate. Queueing and fallbacks come from the app's /metrics
+# (diffed before/after), so run it against one gunicorn deployment at a time.
+#
+#   python stub_llm_server.py --median-ms 700 --rpm 300 &
+#   GROQ_BASE_URL=http://127.0.0.1:8090 GROQ_API_KEY=stub gunicorn app:app &
+#   python loadtest.py http://127.0.0.1:5000 --sessions 2000 --turns 6 --ramp 30
+#
+# Turn latency includes the human-typing pause; start the app with
+# PACING_SCALE=0 to measure raw processing capacity instead.
+
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+
+import httpx
+from prometheus_client.parser import text_string_to_metric_families
+
+
+SCRIPTS = [
+    ["URGENT: Your SBI account will be blocked today. Verify KYC immediately.",
+     "Sir this is from SBI head office, your account shows suspicious activity.",
+     "Click http://sbi-kyc-{n}.com/verify and update details or account is frozen.",
+     "Share the OTP you just received to stop the block.",
+     "Pay Rs 499 verification fee to verify{n}@ybl now.",
+     "Call our senior officer at 98{n:08d} if you have doubts.",
+     "Last warning, account closes in 10 minutes."],
+    ["Congratulations! You won Rs 25,00,000 in the KBC lucky draw.",
+     "To claim the prize pay Rs {n} processing fee.",
+     "Send to account 1234{n:08d} IFSC SBIN0001234.",
+     "Email your Aadhaar copy to claims{n}@gmail.com.",
+     "Our manager number is 97{n:08d}, WhatsApp only.",
+     "Prize expires today, pay immediately."],
+    ["This is Mumbai cyber police. A parcel in your name has drugs.",
+     "An arrest warrant is issued, you must cooperate.",
+     "Transfer Rs {n} security deposit to clear your name.",
+     "UPI: police.refund{n}@okaxis",
+     "Do not tell anyone or you will be arrested today.",
+     "Send screenshot after payment to 99{n:08d}."],
+]
+
+
+def metric_totals(text):
+    """Sum every sample by name (labels collapsed) from Prometheus text format"""
+    totals = {}
+    for family in text_string_to_metric_families(text):
+        for sample in family.samples:
+            totals[sample.name] = totals.get(sample.name, 0.0) + sample.value
+    return totals
+
+
+async def scrape(client, base_url):
+    try:
+        response = await client.get(f"{base_url}/metrics", timeout=10)
+        return metric_totals(response.text)
+    except (httpx.HTTPError, ValueError):
+        return {}
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = []
+        self.statuses = {}
+        self.errors = 0
+        self.sessions_done = 0
+
+    def turn(self, seconds, status):
+        self.latencies.append(seconds)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+
+
+async def run_session(client, options, index, recorder):
+    rng = random.Random(f"{options.seed}:{index}")
+    await asyncio.sleep(options.ramp * index / max(1, options.sessions))
+
+    session_id = f"load-{options.seed}-{index}"
+    script = SCRIPTS[index % len(SCRIPTS)]
+    history = []
+    for turn in range(min(options.turns, len(script))):
+        text = script[turn].format(n=rng.randrange(10 ** 6))
+        payload = {
+            "sessionId": session_id,
+            "message": {"sender": "scammer", "text": text, "timestamp": int(time.time() * 1000)},
+            "conversationHistory": list(history),
+            "metadata": {"channel": "SMS", "language": "English", "locale": "IN"}
+        }
+        turn_started = time.perf_counter()
+        try:
+            response = await client.post(f"{options.url}/honeypot", json=payload,
+                                         headers={"x-api-key": options.api_key}, timeout=options.timeout)
+            status = response.status_code
+            reply = response.json().get("reply", "") if status == 200 else ""
+        except (httpx.HTTPError, ValueError):
+            status, reply = "error", ""
+            recorder.errors += 1
+        recorder.turn(time.perf_counter() - turn_started, status)
+        if status != 200:
+            break
+
+        history.append(payload["message"])
+        history.append({"sender": "user", "text": reply, "timestamp": int(time.time() * 1000)})
+        if options.think:
+            await asyncio.sleep(rng.uniform(0, options.think))
+    recorder.sessions_done += 1
+
+
+async def run(options):
+    limits = httpx.Limits(max_connections=options.connections, max_keepalive_connections=options.connections)
+    async with httpx.AsyncClient(limits=limits) as client:
+        before = await scrape(client, options.url)
+        recorder = Recorder()
+        started = time.perf_counter()
+        await asyncio.gather(*(run_session(client, options, i, recorder) for i in range(options.sessions)))
+        elapsed = time.perf_counter() - started
+        after = await scrape(client, options.url)
+
+    def delta(name):
+        return after.get(name, 0.0) - before.get(name, 0.0)
+
+    turns = len(recorder.latencies)
+    llm_turns = delta("honeypot_limiter_wait_seconds_count")
+    fallbacks = delta("honeypot_fallbacks_total")
+    return {
+        "sessions": options.sessions,
+        "sessionsCompleted": recorder.sessions_done,
+        "turns": turns,
+        "statuses": {str(k): v for k, v in sorted(recorder.statuses.items(), key=str)},
+        "elapsedSeconds": round(elapsed, 2),
+        "turnsPerSecond": round(turns / elapsed, 2) if elapsed else 0.0,
+        "latencyMs": {
+            "p50": round(percentile(recorder.latencies, 0.50) * 1000, 1),
+            "p95": round(percentile(recorder.latencies, 0.95) * 1000, 1),
+            "p99": round(percentile(recorder.latencies, 0.99) * 1000, 1),
+            "max": round(max(recorder.latencies, default=0.0) * 1000, 1)
+        },
+        "rateLimiter": {
+            "admissions": int(llm_turns),
+            "meanQueueMs": round(delta("honeypot_limiter_wait_seconds_sum") / llm_turns * 1000, 1) if llm_turns else 0.0,
+            "rejected": int(delta("honeypot_admission_rejected_total")),
+            "groq429": int(delta("honeypot_groq_rate_limited_total"))
+        },
+        "fallbacks": int(fallbacks),
+        "fallbackRate": round(fallbacks / turns, 4) if turns else 0.0,
+        "metricsAvailable": bool(after)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test /honeypot with concurrent GUVI sessions")
+    parser.add_argument("url", nargs="?", default="http://127.0.0.1:5000")
+    parser.add_argument("--sessions", type=int, default=500, help="concurrent scammer sessions")
+    parser.add_argument("--turns", type=int, default=6, help="scammer turns per session")
+    parser.add_argument("--ramp", type=float, default=10.0, help="seconds over which sessions start")
+    parser.add_argument("--think", type=float, default=0.0, help="max scammer think time between turns (s)")
+    parser.add_argument("--connections", type=int, default=1000, help="client connection pool size")
+    parser.add_argument("--timeout", type=float, default=60.0, help="per-turn HTTP timeout (s)")
+    parser.add_argument("--api-key", default="honeypot_secret_2026")
+    parser.add_argument("--seed", type=int, default=2026)
+    options = parser.parse_args(argv)
+    options.url = options.url.rstrip("/")
+
+    summary = asyncio.run(run(options))
+    print(json.dumps(summary, indent=2))
+    return 0 if summary["turns"] and summary["statuses"].get("200", 0) == summary["turns"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
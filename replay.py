@@ -0,0 +1,317 @@
+# ============================================================
+# OFFLINE REPLAY: archived GUVI transcripts -> process_message
+# ============================================================
+#
+# Streams JSONL (one GUVI /honeypot request payload per line) straight
+# through process_message - no HTTP, no typing delay - and writes one JSON
+# result per turn with its timing.
+#
+#   python replay.py transcripts.jsonl -o results.jsonl --backend stub --workers 8
+#   python replay.py transcripts.jsonl -o rerun.jsonl --backend recorded --recorded results.jsonl
+#
+# Sessions are sharded across a process pool by a stable hash of sessionId:
+# every worker streams the whole input and keeps only its own sessions, so
+# turns of one session stay in order and memory does not grow with input:
+# latencies go into a fixed-bucket histogram and turn numbers come from the
+# app's own (MAX_SESSIONS-bounded) session state.
+#
+# Backends:
+#   stub     - deterministic canned replies, zero latency (detection/extraction regressions)
+#   recorded - agentReply from an earlier results file, keyed by (sessionId, turn)
+#   real     - the Groq API (needs GROQ_API_KEY; quota shared through the sqlite ledger)
+
+import os
+import sys
+import json
+import time
+import gzip
+import zlib
+import random
+import argparse
+import hashlib
+import math
+from types import SimpleNamespace
+from multiprocessing import Pool
+
+
+STUB_REPLIES = [
+    "Theek hai, verification ke liye aapka WhatsApp number dijiye.",
+    "Achha, official email ID bhejiye, main check karunga.",
+    "Payment se pehle UPI ID aur branch ka number batao.",
+    "Website link share karo, main khud verify karta hoon.",
+    "Manager ka direct mobile number aur email do please.",
+]
+
+
+def open_text(path, mode="rt"):
+    if path == "-":
+        return sys.stdin if "r" in mode else sys.stdout
+    if path.endswith(".gz"):
+        return gzip.open(path, mode, encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def shard_of(session_id, shards):
+    return zlib.crc32(str(session_id).encode("utf-8")) % shards
+
+
+class LatencyHistogram:
+    """Log-spaced buckets (5% wide, 10 us .. ~100 s): constant memory, mergeable across workers"""
+
+    FLOOR = 1e-5
+    GROWTH = 1.05
+    BUCKETS = 331
+
+    def __init__(self):
+        self.counts = [0] * self.BUCKETS
+        self.total = 0
+
+    def add(self, seconds):
+        index = 0 if seconds <= self.FLOOR else math.ceil(math.log(seconds / self.FLOOR, self.GROWTH))
+        self.counts[min(index, self.BUCKETS - 1)] += 1
+        self.total += 1
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.total += other.total
+        return self
+
+    def percentile(self, p):
+        """Upper edge of the bucket holding the p-th sample (overestimates by < 5%)"""
+        if not self.total:
+            return 0.0
+        rank = min(self.total - 1, int(self.total * p))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen > rank:
+                return self.FLOOR * self.GROWTH ** index
+        return self.FLOOR * self.GROWTH ** (self.BUCKETS - 1)
+
+
+# ============================================================
+# LLM BACKENDS (Groq-compatible: client.chat.completions.create)
+# ============================================================
+
+class _Completions:
+    def __init__(self, reply_for):
+        self.reply_for = reply_for
+
+    def create(self, messages, **kwargs):
+        reply = self.reply_for(messages)
+        usage = SimpleNamespace(prompt_tokens=None, total_tokens=0, prompt_tokens_details=None)
+        return SimpleNamespace(usage=usage, choices=[SimpleNamespace(message=SimpleNamespace(content=reply))])
+
+
+class ReplayClient:
+    def __init__(self, reply_for):
+        self.chat = SimpleNamespace(completions=_Completions(reply_for))
+
+
+# sessionId of the turn being replayed in this worker process, and how to
+# read its turn number (replay_shard points it at the app's session state)
+_current_turn = {"sessionId": None, "number": lambda session_id: None}
+
+
+def current_turn_key():
+    session_id = _current_turn["sessionId"]
+    return session_id, _current_turn["number"](session_id)
+
+
+def stub_backend(latency=0.0):
+    def reply_for(messages):
+        if latency:
+            time.sleep(latency)
+        digest = hashlib.sha1(messages[-1]["content"].encode("utf-8")).digest()
+        return STUB_REPLIES[digest[0] % len(STUB_REPLIES)]
+    return ReplayClient(reply_for)
+
+
+def recorded_backend(path):
+    replies = {}
+    with open_text(path) as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                # Results written before "source" existed only carry "llm"
+                source = row.get("source") or ("llm" if row.get("llm", True) else "fallback")
+                if source == "llm":
+                    replies[(row["sessionId"], row["turn"])] = row["agentReply"]
+
+    def reply_for(messages):
+        key = current_turn_key()
+        if key not in replies:
+            raise LookupError(f"no recorded reply for {key}")
+        return replies[key]
+    return ReplayClient(reply_for)
+
+
+# ============================================================
+# WORKER
+# ============================================================
+
+def configure_environment(options):
+    """Must run before app is imported (its config is read at import time)"""
+    os.environ.setdefault("SESSION_BACKEND", "memory")
+    os.environ.setdefault("MAX_SESSIONS", str(options.max_sessions))
+    os.environ.setdefault("CALLBACK_DISPATCHER", "0")
+    os.environ.setdefault("LLM_WARMUP", "0")
+    os.environ.setdefault("PACING_MODE", "classic")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("LLM_CACHE_ENABLED", "1" if options.cache else "0")
+    if options.backend != "real":
+        os.environ.setdefault("QUOTA_BACKEND", "memory")
+        os.environ.setdefault("GROQ_RPM_LIMIT", "1000000")
+        os.environ.setdefault("GROQ_TPM_LIMIT", "1000000000")
+        os.environ.setdefault("GROQ_BURST", "100000")
+
+
+def replay_shard(shard, options):
+    configure_environment(options)
+    import app
+
+    if options.backend == "stub":
+        app.set_groq_client(stub_backend(options.stub_latency))
+    elif options.backend == "recorded":
+        app.set_groq_client(recorded_backend(options.recorded))
+
+    # Offline: nothing is sent to GUVI when sessions age out
+    app.session_manager.eviction_hooks.clear()
+    # Called under the turn's session lock, so the count is the turn being served
+    _current_turn["number"] = lambda session_id: app.session_manager.sessions[session_id]["turnCount"]
+
+    def sample(name, labels=None):
+        return app.REGISTRY.get_sample_value(name, labels or {}) or 0.0
+
+    # Which path answered a turn, read from the app's counters (first match wins)
+    source_counters = [
+        ("fallback", "honeypot_fallbacks_total", None),
+        ("local", "honeypot_local_tier_total", {"outcome": "routed"}),
+        ("cache", "honeypot_response_cache_total", {"result": "hit"}),
+    ]
+
+    stats = {"turns": 0, "errors": 0, "sources": {"llm": 0, "local": 0, "cache": 0, "fallback": 0},
+             "latency": LatencyHistogram()}
+    sessions_before = sample("honeypot_sessions_created_total")
+    part_path = f"{options.output}.part{shard}"
+
+    with open_text(options.input) as source, open(part_path, "w", encoding="utf-8") as sink:
+        for line in source:
+            if not line.strip():
+                continue
+            payload = json.loads(line)
+            session_id = payload.get("sessionId")
+            if shard_of(session_id, options.workers) != shard:
+                continue
+
+            _current_turn["sessionId"] = session_id
+            random.seed(line)   # fallbacks / cache variation are reproducible
+
+            before = [sample(name, labels) for _, name, labels in source_counters]
+            started = time.perf_counter()
+            result = app.process_message(payload)
+            seconds = time.perf_counter() - started
+
+            reply_source = None
+            if result.get("success"):
+                reply_source = next((kind for (kind, name, labels), count in zip(source_counters, before)
+                                     if sample(name, labels) > count), "llm")
+                stats["sources"][reply_source] += 1
+            else:
+                stats["errors"] += 1
+            stats["turns"] += 1
+            stats["latency"].add(seconds)
+
+            sink.write(json.dumps({
+                "sessionId": session_id,
+                "turn": result.get("turnCount"),
+                "success": result.get("success", False),
+                "agentReply": result.get("agentReply"),
+                "source": reply_source,
+                "scamDetected": result.get("scamDetected"),
+                "confidence": result.get("confidence"),
+                "scamType": result.get("scamType"),
+                "extractedEntities": result.get("extractedEntities"),
+                "turnCount": result.get("turnCount"),
+                "shouldEndConversation": result.get("shouldEndConversation"),
+                "exitReason": result.get("exitReason"),
+                "error": result.get("error"),
+                "seconds": round(seconds, 6)
+            }, ensure_ascii=False) + "\n")
+
+    # Sessions re-created after eviction count again
+    stats["sessions"] = int(sample("honeypot_sessions_created_total") - sessions_before)
+    return stats
+
+
+def _run_shard(args):
+    return replay_shard(*args)
+
+
+# ============================================================
+# CLI
+# ============================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay GUVI transcripts through process_message")
+    parser.add_argument("input", help="JSONL of /honeypot request payloads (.gz ok)")
+    parser.add_argument("-o", "--output", required=True, help="per-turn results (JSONL)")
+    parser.add_argument("--backend", choices=["stub", "recorded", "real"], default="stub")
+    parser.add_argument("--recorded", help="results file from an earlier run (recorded backend)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--max-sessions", type=int, default=5000, help="live sessions per worker")
+    parser.add_argument("--stub-latency", type=float, default=0.0, help="seconds per stub LLM call")
+    parser.add_argument("--cache", action="store_true", help="enable the response cache")
+    options = parser.parse_args(argv)
+
+    if options.input == "-":
+        parser.error("input must be a file (every worker streams it)")
+    if options.backend == "recorded" and not options.recorded:
+        parser.error("--recorded is required with --backend recorded")
+
+    started = time.time()
+    jobs = [(shard, options) for shard in range(options.workers)]
+    if options.workers == 1:
+        results = [_run_shard(jobs[0])]
+    else:
+        with Pool(options.workers) as pool:
+            results = pool.map(_run_shard, jobs)
+
+    with open(options.output, "w", encoding="utf-8") as out:
+        for shard in range(options.workers):
+            part_path = f"{options.output}.part{shard}"
+            with open(part_path, encoding="utf-8") as part:
+                for line in part:
+                    out.write(line)
+            os.remove(part_path)
+
+    elapsed = time.time() - started
+    latency = LatencyHistogram()
+    for r in results:
+        latency.merge(r["latency"])
+    turns = sum(r["turns"] for r in results)
+    sources = {kind: sum(r["sources"][kind] for r in results) for kind in results[0]["sources"]}
+
+    def pct(p):
+        return round(latency.percentile(p) * 1000, 2)
+
+    summary = {
+        "turns": turns,
+        "sessions": sum(r["sessions"] for r in results),
+        "errors": sum(r["errors"] for r in results),
+        "fallbacks": sources["fallback"],
+        "sources": sources,
+        "p50Ms": pct(0.50),
+        "p95Ms": pct(0.95),
+        "p99Ms": pct(0.99),
+        "turnsPerSecond": round(turns / elapsed, 1) if elapsed else 0.0,
+        "elapsedSeconds": round(elapsed, 2),
+        "backend": options.backend,
+        "workers": options.workers
+    }
+    print(json.dumps(summary), file=sys.stderr)
+    return 0 if summary["errors"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,264 @@
+# ============================================================
+# STUB LLM SERVER (Groq / OpenAI-compatible, for load tests)
+# ============================================================
+#
+# Serves POST /openai/v1/chat/completions with canned replies, a seeded
+# latency distribution, 429 injection (random and/or a real RPM/TPM
+# bucket, with Groq's retry-after and x-ratelimit-* headers) and token
+# usage including prefix-cache hits. Point the app at it with:
+#
+#   python stub_llm_server.py --port 8090 --latency lognormal --median-ms 700 --rpm 300
+#   GROQ_BASE_URL=http://127.0.0.1:8090 GROQ_API_KEY=stub gunicorn app:app
+#
+# GET /stats returns request, 429 and token totals; POST /stats/reset zeroes them.
+# Standard library only, so it runs wherever the app does.
+
+import sys
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+STUB_REPLIES = [
+    "Theek hai, verification ke liye aapka WhatsApp number dijiye.",
+    "Achha, official email ID bhejiye, main check karunga.",
+    "Payment se pehle UPI ID aur branch ka number batao.",
+    "Website link share karo, main khud verify karta hoon.",
+    "Manager ka direct mobile number aur email do please.",
+    "Ek minute, beta phone le gaya hai. Aapka employee ID kya hai?",
+]
+
+
+def count_tokens(text):
+    """Same ~4 chars/token estimate the app budgets with"""
+    return max(1, len(text) // 4)
+
+
+class LatencyModel:
+    """Seeded per-request latency: fixed, uniform, lognormal or pareto (heavy tail)"""
+
+    def __init__(self, kind, median_ms, spread, seed):
+        self.kind = kind
+        self.median = median_ms / 1000.0
+        self.spread = spread
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def sample(self):
+        with self.lock:
+            if self.kind == "fixed":
+                return self.median
+            if self.kind == "uniform":
+                return self.rng.uniform(self.median * (1 - self.spread), self.median * (1 + self.spread))
+            if self.kind == "pareto":
+                # Scale chosen so the median matches; alpha = 1/spread controls the tail
+                alpha = 1.0 / max(self.spread, 0.05)
+                return self.median / (2 ** (1 / alpha)) * self.rng.paretovariate(alpha)
+            return self.rng.lognormvariate(math.log(self.median), self.spread)
+
+
+class QuotaBucket:
+    """Provider-side RPM/TPM quota: refills continuously, like Groq's limits"""
+
+    def __init__(self, rpm, tpm):
+        self.rpm, self.tpm = rpm, tpm
+        self.requests, self.tokens = float(rpm or 0), float(tpm or 0)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self, tokens):
+        """Returns (admitted, retry_after_seconds, headers)"""
+        with self.lock:
+            now = time.monotonic()
+            elapsed, self.updated = now - self.updated, now
+            if self.rpm:
+                self.requests = min(self.rpm, self.requests + elapsed * self.rpm / 60.0)
+            if self.tpm:
+                self.tokens = min(self.tpm, self.tokens + elapsed * self.tpm / 60.0)
+
+            waits = []
+            if self.rpm and self.requests < 1:
+                waits.append((1 - self.requests) * 60.0 / self.rpm)
+            if self.tpm and self.tokens < tokens:
+                waits.append((tokens - self.tokens) * 60.0 / self.tpm)
+            admitted = not waits
+            if admitted:
+                self.requests -= 1 if self.rpm else 0
+                self.tokens -= tokens if self.tpm else 0
+
+            headers = {}
+            if self.rpm:
+                headers["x-ratelimit-limit-requests"] = str(self.rpm)
+                headers["x-ratelimit-remaining-requests"] = str(max(0, int(self.requests)))
+                headers["x-ratelimit-reset-requests"] = f"{max(0.0, (self.rpm - self.requests) * 60.0 / self.rpm):.2f}s"
+            if self.tpm:
+                headers["x-ratelimit-limit-tokens"] = str(self.tpm)
+                headers["x-ratelimit-remaining-tokens"] = str(max(0, int(self.tokens)))
+                headers["x-ratelimit-reset-tokens"] = f"{max(0.0, (self.tpm - self.tokens) * 60.0 / self.tpm):.2f}s"
+            return admitted, max(waits) if waits else 0.0, headers
+
+
+class StubState:
+    def __init__(self, options):
+        self.options = options
+        self.latency = LatencyModel(options.latency, options.median_ms, options.spread, options.seed)
+        self.quota = QuotaBucket(options.rpm, options.tpm)
+        self.fault_rng = random.Random(options.seed + 1)
+        self.seen_prefixes = set()
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.stats = {
+                "requests": 0, "completed": 0, "rateLimited": 0, "injected429": 0,
+                "promptTokens": 0, "cachedTokens": 0, "completionTokens": 0,
+                "latencySecondsTotal": 0.0, "inFlight": 0, "maxInFlight": 0
+            }
+
+    def bump(self, **deltas):
+        with self.lock:
+            for key, value in deltas.items():
+                self.stats[key] += value
+            self.stats["maxInFlight"] = max(self.stats["maxInFlight"], self.stats["inFlight"])
+
+    def inject_429(self):
+        with self.lock:
+            return self.fault_rng.random() < self.options.error_rate
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            if state.options.verbose:
+                super().log_message(*args)
+
+        def send_json(self, status, body, headers=None):
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_HEAD(self):
+            # Connection warm-up from the app
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/stats":
+                with state.lock:
+                    stats = dict(state.stats)
+                stats["meanLatencyMs"] = round(stats["latencySecondsTotal"] / stats["completed"] * 1000, 1) \
+                    if stats["completed"] else 0.0
+                return self.send_json(200, stats)
+            self.send_json(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b"{}"
+
+            if self.path.rstrip("/") == "/stats/reset":
+                state.reset()
+                return self.send_json(200, {"status": "reset"})
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                return self.send_json(404, {"error": {"message": "not found"}})
+
+            body = json.loads(raw or b"{}")
+            messages = body.get("messages", [])
+            system = "".join(m.get("content", "") for m in messages if m.get("role") == "system")
+            prompt_tokens = sum(count_tokens(m.get("content", "")) for m in messages)
+            max_tokens = int(body.get("max_tokens") or 100)
+            state.bump(requests=1)
+
+            admitted, retry_after, headers = state.quota.take(prompt_tokens + max_tokens)
+            injected = admitted and state.inject_429()
+            if not admitted or injected:
+                state.bump(rateLimited=1, injected429=int(injected))
+                headers["retry-after"] = str(max(1, math.ceil(retry_after or state.options.retry_after)))
+                return self.send_json(429, {"error": {
+                    "message": "Rate limit reached (stub). Please try again later.",
+                    "type": "tokens", "code": "rate_limit_exceeded"}}, headers)
+
+            state.bump(inFlight=1)
+            latency = state.latency.sample()
+            time.sleep(latency)
+
+            digest = hashlib.sha1((messages[-1].get("content", "") if messages else "").encode("utf-8")).digest()
+            reply = STUB_REPLIES[digest[0] % len(STUB_REPLIES)]
+            completion_tokens = min(max_tokens, count_tokens(reply))
+
+            # Repeated system prefix = provider prefix-cache hit
+            prefix_key = hashlib.sha256(system.encode("utf-8")).hexdigest()
+            with state.lock:
+                cached = count_tokens(system) if system and prefix_key in state.seen_prefixes else 0
+                state.seen_prefixes.add(prefix_key)
+            state.bump(inFlight=-1, completed=1, promptTokens=prompt_tokens, cachedTokens=cached,
+                       completionTokens=completion_tokens, latencySecondsTotal=latency)
+
+            self.send_json(200, {
+                "id": f"chatcmpl-stub-{digest.hex()[:12]}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "stub"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": reply},
+                    "finish_reason": "stop"
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                    "prompt_tokens_details": {"cached_tokens": cached}
+                }
+            }, headers)
+
+    return Handler
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024   # thousands of sessions connect at once
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Groq-compatible stub LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", choices=["fixed", "uniform", "lognormal", "pareto"], default="lognormal")
+    parser.add_argument("--median-ms", type=float, default=700.0)
+    parser.add_argument("--spread", type=float, default=0.5,
+                        help="uniform: +/- fraction; lognormal: sigma; pareto: 1/alpha")
+    parser.add_argument("--rpm", type=int, default=0, help="requests/minute before 429 (0 = unlimited)")
+    parser.add_argument("--tpm", type=int, default=0, help="tokens/minute before 429 (0 = unlimited)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of admitted calls answered 429")
+    parser.add_argument("--retry-after", type=float, default=2.0, help="retry-after for injected 429s (seconds)")
+    parser.add_argument("--seed", type=int, default=2026)
+    parser.add_argument("--verbose", action="store_true")
+    options = parser.parse_args(argv)
+
+    server = StubServer((options.host, options.port), make_handler(StubState(options)))
+    print(f"Stub LLM on http://{options.host}:{options.port} "
+          f"({options.latency} {options.median_ms:.0f}ms, rpm={options.rpm or '-'}, "
+          f"tpm={options.tpm or '-'}, 429 rate={options.error_rate})", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
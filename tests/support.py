@@ -0,0 +1,30 @@
+"""Shared setup for the test modules: app config is read at import time"""
+
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TMP_DIR = tempfile.mkdtemp(prefix="honeypot-tests-")
+
+
+def load_app():
+    """Import app with in-memory backends, no pacing, no background delivery"""
+    os.environ.setdefault("SESSION_BACKEND", "memory")
+    os.environ.setdefault("QUOTA_BACKEND", "memory")
+    os.environ.setdefault("CALLBACK_DISPATCHER", "0")
+    os.environ.setdefault("CALLBACK_DB_PATH", os.path.join(TMP_DIR, "outbox.db"))
+    os.environ.setdefault("LLM_WARMUP", "0")
+    os.environ.setdefault("PACING_MODE", "classic")
+    os.environ.setdefault("PACING_SCALE", "0")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("GROQ_RPM_LIMIT", "1000000")
+    os.environ.setdefault("GROQ_TPM_LIMIT", "1000000000")
+    os.environ.setdefault("GROQ_BURST", "100000")
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+
+    import app
+    from replay import stub_backend
+    app.set_groq_client(stub_backend())
+    return app
@@ -0,0 +1,179 @@
+"""CallbackDispatcher against a local stub GUVI endpoint: retries, backoff, idempotency, metrics"""
+
+import os
+import json
+import time
+import threading
+import unittest
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from support import TMP_DIR, load_app
+
+app = load_app()
+
+
+class StubGuvi:
+    """Answers 500 to the first `fail_first` POSTs, then 200; records every POST"""
+
+    def __init__(self, fail_first=0):
+        self.fail_first = fail_first
+        self.posts = []   # (monotonic time, Idempotency-Key, body)
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+                with stub.lock:
+                    stub.posts.append((time.monotonic(), self.headers.get("Idempotency-Key"), body))
+                    status = 500 if len(stub.posts) <= stub.fail_first else 200
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/callback"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def metric(name, **labels):
+    return app.REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+class CallbackDispatcherTest(unittest.TestCase):
+    BACKOFF_BASE = 0.1
+
+    def setUp(self):
+        self.db_path = os.path.join(TMP_DIR, f"outbox-{self.id()}.db")
+        self.outbox = app.CallbackOutbox(self.db_path)
+        self.patches = [mock.patch.object(app, "CALLBACK_BACKOFF_BASE", self.BACKOFF_BASE),
+                        mock.patch.object(app, "CALLBACK_MAX_ATTEMPTS", 5)]
+        for patch in self.patches:
+            patch.start()
+        self.stub = None
+        self.dispatcher = None
+
+    def tearDown(self):
+        if self.dispatcher:
+            self.dispatcher.stop()
+        if self.stub:
+            self.stub.close()
+        for patch in self.patches:
+            patch.stop()
+
+    def start(self, fail_first):
+        self.stub = StubGuvi(fail_first)
+        self.dispatcher = app.CallbackDispatcher(self.outbox, self.stub.url, workers=1, batch_size=10)
+        self.dispatcher.start()
+
+    def wait_for(self, condition, timeout=10.0):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if condition():
+                return
+            time.sleep(0.01)
+        self.fail("timed out waiting for the dispatcher")
+
+    def test_retries_follow_the_backoff_schedule(self):
+        fail_first = 3
+        retries_before = metric("honeypot_callbacks_total", outcome="retry")
+        delivered_before = metric("honeypot_callbacks_total", outcome="delivered")
+        errors_before = metric("honeypot_callback_delivery_seconds_count", outcome="error")
+        lag_count_before = metric("honeypot_callback_lag_seconds_count")
+        lag_sum_before = metric("honeypot_callback_lag_seconds_sum")
+
+        self.start(fail_first)
+        self.outbox.enqueue("s-retry", {"sessionId": "s-retry", "scamDetected": True})
+        self.dispatcher.notify()
+        # While it is being retried the row is backlog
+        self.wait_for(lambda: len(self.stub.posts) >= 2)
+        self.assertEqual(metric("honeypot_callback_backlog"), 1)
+        self.wait_for(lambda: self.dispatcher.get_stats()["delivered"] == 1)
+
+        posts = self.stub.posts
+        self.assertEqual(len(posts), fail_first + 1)
+        self.assertEqual({key for _, key, _ in posts}, {"s-retry"})
+
+        # Attempt n fails -> next one after uniform(b/2, b), b = base x 2^(n-1)
+        for n in range(1, fail_first + 1):
+            backoff = self.BACKOFF_BASE * 2 ** (n - 1)
+            gap = posts[n][0] - posts[n - 1][0]
+            self.assertGreaterEqual(gap, backoff / 2 - 0.01, f"retry {n} too early")
+            self.assertLessEqual(gap, backoff + 0.25, f"retry {n} too late")
+
+        stats = self.dispatcher.get_stats()
+        self.assertEqual(stats["backlog"], 0)
+        self.assertEqual(stats["failed"], fail_first)
+        self.assertEqual(stats["sent"], 1)
+        # Lag runs from enqueue to delivery, so it covers every backoff
+        min_lag = sum(self.BACKOFF_BASE * 2 ** (n - 1) / 2 for n in range(1, fail_first + 1))
+        self.assertGreaterEqual(stats["lag_seconds_last"], min_lag - 0.01)
+        self.assertAlmostEqual(stats["lag_seconds_total"], stats["lag_seconds_last"])
+        self.assertEqual(metric("honeypot_callback_lag_seconds_count") - lag_count_before, 1)
+        self.assertAlmostEqual(metric("honeypot_callback_lag_seconds_sum") - lag_sum_before,
+                               stats["lag_seconds_last"], places=6)
+        self.assertEqual(metric("honeypot_callback_backlog"), 0)
+
+        self.assertEqual(metric("honeypot_callbacks_total", outcome="retry") - retries_before, fail_first)
+        self.assertEqual(metric("honeypot_callbacks_total", outcome="delivered") - delivered_before, 1)
+        self.assertEqual(metric("honeypot_callback_delivery_seconds_count", outcome="error") - errors_before,
+                         fail_first)
+
+    def test_enqueue_is_idempotent_per_session_and_payload(self):
+        first = {"sessionId": "s-idem", "totalMessagesExchanged": 4}
+        richer = {"sessionId": "s-idem", "totalMessagesExchanged": 6}
+
+        # Same payload twice while pending: one row, one POST
+        self.assertEqual(self.outbox.enqueue("s-idem", first), self.outbox.enqueue("s-idem", first))
+        self.assertEqual(self.outbox.stats()["backlog"], 1)
+        self.start(fail_first=0)
+        self.dispatcher.notify()
+        self.wait_for(lambda: self.dispatcher.get_stats()["delivered"] == 1)
+
+        # The same payload after delivery is a no-op
+        self.outbox.enqueue("s-idem", first)
+        self.dispatcher.notify()
+        time.sleep(0.3)
+        self.assertEqual(len(self.stub.posts), 1)
+        self.assertEqual(self.outbox.stats()["backlog"], 0)
+
+        # A newer payload for the session is delivered once, replacing the old one
+        self.outbox.enqueue("s-idem", richer)
+        self.outbox.enqueue("s-idem", richer)
+        self.dispatcher.notify()
+        self.wait_for(lambda: len(self.stub.posts) == 2 and self.outbox.stats()["backlog"] == 0)
+        time.sleep(0.2)
+        self.assertEqual([body for _, _, body in self.stub.posts], [first, richer])
+        self.assertEqual(self.outbox.stats()["delivered"], 1)   # one row per session
+
+    def test_metrics_endpoint_reports_backlog(self):
+        dispatcher = app.CallbackDispatcher(self.outbox, "http://127.0.0.1:9/unused")   # never started
+        for i in range(3):
+            self.outbox.enqueue(f"s-backlog-{i}", {"sessionId": f"s-backlog-{i}"})
+        with mock.patch.object(app, "callback_dispatcher", dispatcher):
+            body = app.app.test_client().get("/metrics").get_data(as_text=True)
+        self.assertIn("honeypot_callback_backlog 3.0", body.splitlines())
+        self.assertIn("honeypot_callback_lag_seconds_bucket", body)
+
+    def test_gives_up_after_max_attempts(self):
+        dead_before = metric("honeypot_callbacks_total", outcome="dead")
+        self.start(fail_first=10 ** 6)
+        self.outbox.enqueue("s-dead", {"sessionId": "s-dead"})
+        self.dispatcher.notify()
+        self.wait_for(lambda: self.outbox.stats()["dead"] == 1)
+
+        self.assertEqual(len(self.stub.posts), app.CALLBACK_MAX_ATTEMPTS)
+        self.assertEqual(self.outbox.stats()["backlog"], 0)
+        self.assertEqual(metric("honeypot_callbacks_total", outcome="dead") - dead_before, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,168 @@
+"""regex_scam_detection: same answers as the original rule set, linear time on adversarial input"""
+
+import re
+import time
+import random
+import unittest
+
+from support import load_app
+
+app = load_app()
+
+
+def reference_detection(message_text):
+    """The rule set as it was before precompilation (one re.search per pattern)"""
+    text_lower = message_text.lower()
+    indicators = []
+
+    universal_legitimate_patterns = [
+        r'\botp\b.*\b(valid for|expires in|expire in)\s*\d+\s*(minute|min|second)',
+        r'(credited|debited).*\bavailable balance\b',
+        r'\bhas been successfully\b.*(completed|done|processed|updated|verified)',
+        r'visit\s+(www\.|https?://)?(hdfc|icici|sbi|axis|kotak|pnb|bob|canara|unionbank)(bank)?\.(com|co\.in)',
+    ]
+    for pattern in universal_legitimate_patterns:
+        if re.search(pattern, text_lower, re.IGNORECASE):
+            return False, "LOW", []
+
+    rules = [
+        ("urgency", [
+            r'\b(immediate|immediately|urgent|now|today|asap|hurry|quick|fast)\b',
+            r'\b(within \d+ (hour|minute)s?)\b',
+            r'\b(last chance|final (warning|notice)|limited time)\b']),
+        ("threat", [
+            r'\b(block|suspend|deactivat|terminat|close|freeze|cancel)\b.*\b(account|card|service|kyc|wallet)\b',
+            r'\b(legal action|police|arrest|fir|court|penalty|fine|jail)\b',
+            r'\b(will be|has been|going to be)\b.*\b(block|suspend|close|deactivate)\b']),
+        ("verification_request", [
+            r'\b(verify|update|confirm|validate|complete|reactivate)\b.*\b(kyc|account|details|information|pan|aadhaar)\b',
+            r'\b(click|visit|go to|open)\b.*\b(link|website|url)\b']),
+        ("payment_demand", [
+            r'\b(pay|send|transfer|deposit|remit)\b.*\b(₹|rs\.?|rupees?|\d+)\b',
+            r'\b(refund|cashback|prize|won|lottery|reward)\b.*\b(claim|collect|receive)\b',
+            r'\bupi\s*(id|:)?\s*[@:]?\s*\w+@\w+\b']),
+        ("suspicious_link", [
+            r'(bit\.ly|tinyurl|t\.co|goo\.gl|cutt\.ly)/\w+',
+            r'https?://[^\s]+\b(verify|secure|update|login|bank|kyc)\b']),
+        ("phone_number", [
+            r'\b(call|dial|phone|contact|speak|talk)\b.*\b[6-9]\d{9}\b']),
+        ("authority_impersonation", [
+            r'\b(bank|rbi|reserve bank)\b',
+            r'\b(sbi|hdfc|icici|axis|kotak|pnb|paytm|phonepe|gpay)\b',
+            r'\b(cbi|police|cyber cell|income tax|gst)\b']),
+        ("lottery_scam", [
+            r'\b(congratulations|winner|won|selected)\b.*\b(prize|lottery|lakh|crore|kbc)\b']),
+    ]
+    for name, patterns in rules:
+        if any(re.search(pattern, text_lower) for pattern in patterns):
+            indicators.append(name)
+
+    is_scam = len(indicators) >= 2
+    if len(indicators) >= 4:
+        confidence = "VERY_HIGH"
+    elif len(indicators) >= 3:
+        confidence = "HIGH"
+    elif len(indicators) >= 2:
+        confidence = "MEDIUM"
+    else:
+        confidence = "LOW"
+    return is_scam, confidence, indicators
+
+
+FIXED_CORPUS = [
+    "URGENT: Your SBI account will be blocked today. Verify KYC immediately.",
+    "Congratulations! You won Rs 25,00,000 in the KBC lucky draw. Claim your prize now.",
+    "This is Mumbai cyber police. An arrest warrant is issued, call 9876543210.",
+    "Pay Rs 499 to verify@ybl within 2 hours or your account will be suspended.",
+    "Click http://sbi-secure-login.xyz/verify to update your KYC details.",
+    "Send money to UPI ID: refund.help@okaxis for cashback claim",
+    "Your OTP is 482913. It is valid for 10 minutes. Do not share it.",
+    "Rs 5,000 credited to your a/c XX1234. Available balance Rs 12,400.",
+    "Your request has been successfully processed and completed.",
+    "Please visit www.hdfcbank.com for more details about your account.",
+    "Meeting is moved to 4 pm, see you there.",
+    "block\naccount",                        # lead and tail on different lines
+    "Call me later\n9876543210",
+    "https://\nverify https://x.in/login",
+    "bit.ly/abc goo.gl/ t.co/x1",
+    "Last chance! Limited time offer. Transfer ₹ to account.",
+    "Your card is going to be deactivated. Contact 6123456789 now.",
+    "Income tax department: penalty of Rs 10000, pay immediately to avoid jail.",
+    "you have been selected, 2 crore lottery, collect refund, receive reward",
+    "UPI:abc@paytm",
+    "",
+]
+
+_VOCABULARY = (
+    "urgent now today within 5 hours minute last chance final warning notice limited time block suspend "
+    "deactivat terminat close freeze cancel account card service kyc wallet legal action police arrest "
+    "fir court penalty fine jail will be has been going to verify update confirm validate complete "
+    "reactivate details information pan aadhaar click visit go open link website url pay send transfer "
+    "deposit remit rs. rupees ₹ 499 refund cashback prize won lottery reward claim collect receive upi id : "
+    "@ abc@ybl x@okaxis bit.ly/x tinyurl/abc https:// http://sbi-login.in/verify secure login bank kyc "
+    "call dial phone contact speak talk 9876543210 5876543210 98765432101 rbi reserve sbi hdfc icici axis "
+    "kotak pnb paytm phonepe gpay cbi cyber cell income tax gst congratulations winner selected lakh crore "
+    "kbc otp valid for expires in 10 min credited debited available balance successfully processed "
+    "visit www.sbi.co.in the a of please sir madam hello"
+).split()
+
+
+def fuzz_corpus(count, seed=2026):
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(count):
+        words = [rng.choice(_VOCABULARY) for _ in range(rng.randint(1, 40))]
+        joiners = [rng.choice([" ", " ", " ", "\n", "", ". ", "/"]) for _ in words]
+        text = "".join(word + joiner for word, joiner in zip(words, joiners))
+        messages.append(text.upper() if rng.random() < 0.1 else text)
+    return messages
+
+
+def pathological_inputs(size=50_000):
+    """Inputs that make naive A.*B matching or URL rescans quadratic"""
+    return {
+        "repeated_link_prefix": ("https://" * (size // 8 + 1))[:size],
+        "repeated_link_no_space": ("https://x" * (size // 9 + 1))[:size],
+        "long_digit_run": "call " + "9" * size,
+        "digit_runs_no_boundary": ("call 98765432101" * (size // 16 + 1))[:size],
+        "lead_flood_no_tail": ("block suspend close " * (size // 20 + 1))[:size],
+        "lead_flood_tail_next_line": ("block " * (size // 6)) + "\naccount",
+        "keyword_flood": (" ".join(_VOCABULARY) + " ") * (size // len(" ".join(_VOCABULARY)) + 1),
+        "one_long_token": "a" * size,
+        "upi_flood": ("upi : " * (size // 6 + 1))[:size],
+    }
+
+
+class DetectionEquivalenceTest(unittest.TestCase):
+    def assert_same(self, text):
+        self.assertEqual(app.regex_scam_detection(text), reference_detection(text), repr(text[:120]))
+
+    def test_fixed_corpus(self):
+        for text in FIXED_CORPUS:
+            self.assert_same(text)
+
+    def test_fuzz_corpus(self):
+        for text in fuzz_corpus(3000):
+            self.assert_same(text)
+
+    def test_pathological_inputs_agree(self):
+        # Short versions: the reference itself is quadratic on the full size
+        for name, text in pathological_inputs(size=2000).items():
+            with self.subTest(name=name):
+                self.assert_same(text)
+
+
+class DetectionWorstCaseTest(unittest.TestCase):
+    # Linear time runs these in ~10-20 ms; the quadratic original takes seconds
+    TIME_BOUND_SECONDS = 0.5
+
+    def test_50kb_inputs_stay_linear(self):
+        for name, text in pathological_inputs().items():
+            with self.subTest(name=name):
+                started = time.perf_counter()
+                app.regex_scam_detection(text)
+                self.assertLess(time.perf_counter() - started, self.TIME_BOUND_SECONDS)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+"""Replies reused across sessions (reply bank, response cache) never carry another scammer's entities"""
+
+import random
+import unittest
+from unittest import mock
+
+from support import load_app
+
+app = load_app()
+
+LEAKY_REPLIES = [
+    "Sir, I tried calling 9876543210 but nobody picked up. Can you share your official email?",
+    "Achha, I will send it to refund.desk@ybl, but what is your employee ID and branch number?",
+    "Is www.sbi-kyc-update.in the correct website? Please give me your supervisor's number.",
+    "Account 123456789012 mein transfer karu? Please share your official email for the receipt.",
+    "Haan ji, 98765 43210 pe call kiya, no answer. What is your WhatsApp number?",
+]
+CLEAN_REPLY = "Haan ji, main payment karunga, but please share your official email ID for the receipt first."
+
+
+class ReplyBankReuseTest(unittest.TestCase):
+    def test_entity_bearing_replies_are_not_banked(self):
+        bank = app.ReplyBank()
+        for reply in LEAKY_REPLIES:
+            self.assertGreaterEqual(app.score_reply(reply), app.ReplyBank.MIN_HEURISTIC, reply)
+            self.assertFalse(bank.learn(reply, "bank_fraud", "Your account is blocked, verify now", 3))
+        self.assertEqual(bank.get_stats()["withheld"], len(LEAKY_REPLIES))
+        self.assertEqual(bank.get_stats()["entries"], 0)
+
+    def test_entity_bearing_reply_is_never_picked(self):
+        bank = app.build_reply_bank()
+        for reply in LEAKY_REPLIES:
+            bank.learn(reply, "bank_fraud", "Your account is blocked, verify now", 3)
+        self.assertTrue(bank.learn(CLEAN_REPLY, "bank_fraud", "Your account is blocked, verify now", 3))
+
+        picked = set()
+        for seed in range(300):
+            for missing in (["email"], ["phone"], ["upi"], ["link"], []):
+                reply, _ = bank.pick("Pay the processing fee today", "bank_fraud", seed % 8 + 1,
+                                     missing, [], random.Random(seed))
+                if reply is not None:
+                    picked.add(reply)
+                    self.assertFalse(app.mentions_entities(reply), reply)
+        # the bank is still learning, just not the leaky replies
+        self.assertTrue(any(app.ReplyBank._key(r) == app.ReplyBank._key(CLEAN_REPLY) for r in picked))
+
+    def test_llm_reply_quoting_scammer_number_stays_in_its_session(self):
+        leaky = LEAKY_REPLIES[0]
+        with mock.patch.object(app, "reply_bank", app.build_reply_bank()) as bank:
+            app.set_groq_client(_constant_client(leaky))
+            try:
+                result = app.process_message({
+                    "sessionId": "reuse-a",
+                    "message": {"sender": "scammer", "text": "Call me on 9876543210 to unblock your account",
+                                "timestamp": 1},
+                    "conversationHistory": []})
+            finally:
+                from replay import stub_backend
+                app.set_groq_client(stub_backend())
+            self.assertEqual(result["agentReply"], leaky)
+            self.assertNotIn(app.ReplyBank._key(leaky), bank.by_key)
+
+
+class ResponseCacheReuseTest(unittest.TestCase):
+    FIRST = "URGENT call officer at 9876543210 now or your account is blocked"
+    SECOND = "URGENT call officer at 9123456789 now or your account is blocked"
+
+    def test_cross_number_hit_does_not_leak_the_first_number(self):
+        cache = app.ResponseCache(explore=0.0)
+        first_key = cache.key(self.FIRST, 2, "email address")
+        second_key = cache.key(self.SECOND, 2, "email address")
+        self.assertEqual(first_key, second_key)
+
+        cache.put(first_key, "Theek hai, I called 9876543210 but no answer. Do you have another number?")
+        self.assertIsNone(cache.get(second_key, set(), random.Random(1)))
+        self.assertEqual(cache.get_stats()["withheld"], 1)
+
+        clean = "Theek hai, I called but no answer. Do you have another number or an official email?"
+        cache.put(first_key, clean)
+        hit = cache.get(second_key, set(), random.Random(1))
+        self.assertIsNotNone(hit)
+        self.assertFalse(app.mentions_entities(hit), hit)
+
+    def test_llm_reply_quoting_scammer_number_is_not_cached(self):
+        leaky = "Sir, I tried calling 9876543210 but nobody picked up. Can you share your official email?"
+        cache = app.ResponseCache(explore=0.0)
+        with mock.patch.object(app, "response_cache", cache), mock.patch.object(app, "LLM_CACHE_ENABLED", True):
+            app.set_groq_client(_constant_client(leaky))
+            try:
+                for session_id, text in (("cache-a", self.FIRST), ("cache-b", self.SECOND)):
+                    result = app.process_message({
+                        "sessionId": session_id,
+                        "message": {"sender": "scammer", "text": text, "timestamp": 1},
+                        "conversationHistory": []})
+                    self.assertTrue(result["success"])
+            finally:
+                from replay import stub_backend
+                app.set_groq_client(stub_backend())
+        stats = cache.get_stats()
+        self.assertEqual(stats["hits"], 0)
+        self.assertEqual(stats["withheld"], 2)
+
+
+def _constant_client(reply):
+    from replay import ReplayClient
+    return ReplayClient(lambda messages: reply)
+
+
+if __name__ == "__main__":
+    unittest.main()
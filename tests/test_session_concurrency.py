@@ -0,0 +1,138 @@
+"""Concurrent turns: one session stays consistent, other sessions never wait on it"""
+
+import os
+import threading
+import unittest
+
+from support import TMP_DIR, load_app
+
+app = load_app()
+from replay import stub_backend   # noqa: E402 (repo root is on sys.path once app is loaded)
+
+TURNS = 40
+
+
+def turn_payload(session_id, i):
+    return {
+        "sessionId": session_id,
+        "message": {"sender": "scammer", "timestamp": 1000 + i,
+                    "text": f"Call 98{i:08d} or mail agent{i}@fraudmail.com, pay to refund{i}@ybl"},
+        "conversationHistory": []
+    }
+
+
+class SessionConcurrencyTest(unittest.TestCase):
+    def setUp(self):
+        self.client = app.app.test_client()
+        self.headers = {"x-api-key": app.API_SECRET_KEY}
+        # A few ms per LLM call so turns queue up behind the session lock
+        app.set_groq_client(stub_backend(latency=0.005))
+
+    def tearDown(self):
+        app.set_groq_client(stub_backend())
+
+    def fire(self, session_id, turns, churn=0):
+        """`turns` threads at one session, plus `churn` threads creating other sessions"""
+        barrier = threading.Barrier(turns + churn)
+        statuses = []
+
+        def one_turn(i):
+            barrier.wait()
+            response = self.client.post("/honeypot", json=turn_payload(session_id, i), headers=self.headers)
+            statuses.append(response.status_code)
+
+        def churn_sessions(i):
+            # Other sessions push this one out of the cache, and the sweep
+            # catches it in the gap between two of its turns
+            barrier.wait()
+            n = 0
+            while len(statuses) < turns:
+                app.session_manager.add_message(f"{session_id}-churn-{i}-{n}", "scammer", "hello", n)
+                app.session_manager.evict_expired()
+                n += 1
+
+        threads = [threading.Thread(target=one_turn, args=(i,), daemon=True) for i in range(turns)]
+        threads += [threading.Thread(target=churn_sessions, args=(i,), daemon=True) for i in range(churn)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=60)
+        self.assertEqual(statuses, [200] * turns)
+
+    def assert_consistent(self, session_id, turns):
+        self.assertEqual(app.session_manager.get_turn_count(session_id), turns)
+        intel = app.session_manager.get_accumulated_intelligence(session_id)
+        self.assertEqual(set(intel["phoneNumbers"]), {f"98{i:08d}" for i in range(turns)})
+        self.assertEqual(set(intel["emails"]), {f"agent{i}@fraudmail.com" for i in range(turns)})
+        self.assertEqual(set(intel["upiIds"]), {f"refund{i}@ybl" for i in range(turns)})
+        # Serialized turns alternate: two turns at once interleave scammer, scammer, agent, agent
+        senders = [m["sender"] for m in app.session_manager.get_conversation_history(session_id)]
+        self.assertEqual(senders, ["scammer", "agent"] * turns)
+
+    def test_one_session_many_threads(self):
+        self.fire("stress-memory", TURNS)
+        self.assert_consistent("stress-memory", TURNS)
+
+    def test_tiny_cache_evicts_between_turns(self):
+        """Cache of 2, TTL 0, persistent store: the session is evicted and reloaded mid-burst"""
+        original = app.session_manager
+        store = app.SQLiteSessionStore(os.path.join(TMP_DIR, "sessions-tiny.db"))
+        app.session_manager = app.SessionManager(store=store, max_sessions=2, ttl_seconds=0)
+        try:
+            self.fire("stress-tiny", TURNS, churn=4)
+            self.assertGreater(app.session_manager.get_store_stats()["loaded"], 0)
+            self.assert_consistent("stress-tiny", TURNS)
+        finally:
+            app.session_manager = original
+
+
+class SlowStore(app.SessionStore):
+    """Store whose reads and writes for one session block until released"""
+
+    def __init__(self, slow_id):
+        self.slow_id = slow_id
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    def _stall(self, session_id):
+        if session_id == self.slow_id:
+            self.entered.set()
+            self.release.wait(5)
+
+    def load(self, session_id):
+        self._stall(session_id)
+        return None
+
+    def create(self, session_id, start_time):
+        self._stall(session_id)
+
+
+class StoreIOLockTest(unittest.TestCase):
+    def test_slow_store_call_does_not_stall_other_sessions(self):
+        store = SlowStore("slow")
+        manager = app.SessionManager(store=store)
+        manager.create_session("cached")
+        slow = threading.Thread(target=manager.create_session, args=("slow",))
+        slow.start()
+        try:
+            self.assertTrue(store.entered.wait(5))
+            done = threading.Event()
+
+            def other_sessions():
+                manager.create_session("fresh")
+                manager.add_message("cached", "scammer", "hello", 1)
+                self.assertTrue(manager.session_exists("fresh"))
+                manager.get_store_stats()
+                done.set()
+
+            threading.Thread(target=other_sessions, daemon=True).start()
+            self.assertTrue(done.wait(1.0), "other sessions waited on one session's store I/O")
+        finally:
+            store.release.set()
+            slow.join()
+        self.assertTrue(manager.session_exists("slow"))
+        self.assertEqual(manager.get_store_stats()["created"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+"""SessionManagers (workers) sharing one SQLite session store: refresh and expiry callbacks"""
+
+import os
+import threading
+import time
+import unittest
+from unittest import mock
+
+from support import TMP_DIR, load_app
+
+app = load_app()
+
+
+class SharedStoreTest(unittest.TestCase):
+    def setUp(self):
+        path = os.path.join(TMP_DIR, f"sessions-{self.id()}.db")
+        self.a = app.SessionManager(store=app.SQLiteSessionStore(path))
+        self.b = app.SessionManager(store=app.SQLiteSessionStore(path))
+
+    def test_refresh_merges_intelligence_from_other_worker(self):
+        self.b.create_session("x")
+        self.b.add_message("x", "scammer", "Your account is blocked", 1)
+        self.b.accumulate_intelligence("x", {"bankNames": ["sbi"], "keywords": ["blocked"]})
+
+        self.assertTrue(self.a.session_exists("x"))   # A loads it from the store
+        self.a.add_message("x", "agent", "Which branch?", 2)
+        self.a.add_message("x", "scammer", "Call 9876543210 or pay to fraud@ybl", 3)
+        self.a.accumulate_intelligence("x", {"phoneNumbers": ["9876543210"], "upiIds": ["fraud@ybl"],
+                                             "keywords": ["pay"]})
+
+        self.b.refresh("x")
+        self.assertEqual(len(self.b.get_conversation_history("x")), 3)
+        intel = self.b.get_accumulated_intelligence("x")
+        self.assertEqual(intel["phoneNumbers"], ["9876543210"])
+        self.assertEqual(intel["upiIds"], ["fraud@ybl"])
+        self.assertEqual(intel["bankNames"], ["sbi"])
+        self.assertEqual(sorted(intel["suspiciousKeywords"]), ["blocked", "pay"])
+
+        # What B reports to GUVI is the union of both workers' turns
+        session = self.b.sessions["x"]
+        self.assertEqual(self.b.intelligence_view(session)["phoneNumbers"], ["9876543210"])
+
+
+class ExpiryFlushTest(unittest.TestCase):
+    """Default deployment: SQLite session store, final callback flushed when a session goes idle"""
+
+    TTL = 0.2
+
+    def setUp(self):
+        path = os.path.join(TMP_DIR, f"sessions-{self.id()}.db")
+        self.a = app.SessionManager(store=app.SQLiteSessionStore(path), ttl_seconds=self.TTL)
+        self.b = app.SessionManager(store=app.SQLiteSessionStore(path), ttl_seconds=self.TTL)
+        for manager in (self.a, self.b):
+            manager.add_eviction_hook(app.flush_callback_on_evict)
+        self.outbox = app.CallbackOutbox(os.path.join(TMP_DIR, f"outbox-{self.id()}.db"))
+        self.patches = [mock.patch.object(app, "session_manager", self.a),
+                        mock.patch.object(app, "callback_outbox", self.outbox)]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+
+    def queued(self):
+        return {session_id: payload for session_id, payload, _, _ in self.outbox.claim(100, 30)}
+
+    def test_idle_expiry_flushes_with_persistent_store(self):
+        self.assertTrue(self.a.store.persistent)
+        self.a.add_message("idle", "scammer", "Pay the fee to fraud@ybl", 1)
+        self.a.accumulate_intelligence("idle", {"upiIds": ["fraud@ybl"]})
+        time.sleep(self.TTL + 0.1)
+        self.assertEqual(self.a.evict_expired(), 1)
+
+        payload = self.queued()["idle"]
+        self.assertEqual(payload["extractedIntelligence"]["upiIds"], ["fraud@ybl"])
+        self.assertEqual(payload["totalMessagesExchanged"], 1)
+
+    def test_lru_eviction_does_not_flush(self):
+        manager = app.SessionManager(store=self.a.store, max_sessions=1)
+        manager.add_eviction_hook(app.flush_callback_on_evict)
+        manager.add_message("first", "scammer", "hello", 1)
+        manager.add_message("second", "scammer", "hello", 1)
+        self.assertEqual(manager.get_store_stats()["evictedLru"], 1)
+        self.assertEqual(self.queued(), {})
+
+    def test_session_still_active_on_another_worker_is_not_flushed(self):
+        self.a.add_message("busy", "scammer", "Your account is blocked", 1)
+        time.sleep(self.TTL + 0.1)
+        self.assertTrue(self.b.session_exists("busy"))
+        self.b.add_message("busy", "scammer", "Still there? Call 9876543210", 2)
+        self.a.evict_expired()
+        self.assertEqual(self.queued(), {})
+
+    def test_flush_reports_every_workers_turns_once(self):
+        self.a.add_message("shared", "scammer", "Pay the fee to fraud@ybl", 1)
+        self.a.accumulate_intelligence("shared", {"upiIds": ["fraud@ybl"]})
+        self.assertTrue(self.b.session_exists("shared"))
+        self.b.add_message("shared", "scammer", "Or call 9876543210, or 9123456789", 2)
+        self.b.accumulate_intelligence("shared", {"phoneNumbers": ["9876543210", "9123456789"]})
+        time.sleep(self.TTL + 0.1)
+        self.a.evict_expired()
+        self.b.evict_expired()   # same stored copy, same payload hash: no second delivery
+
+        self.assertEqual(self.outbox.stats()["backlog"], 1)
+        intel = self.queued()["shared"]["extractedIntelligence"]
+        self.assertEqual(intel["upiIds"], ["fraud@ybl"])
+        self.assertEqual(intel["phoneNumbers"], ["9123456789", "9876543210"])
+
+
+class InlineSweepTest(unittest.TestCase):
+    """The periodic TTL sweep that runs while a new session is cached"""
+
+    def test_sweep_spares_the_new_session_and_runs_hooks_unlocked(self):
+        manager = app.SessionManager(ttl_seconds=0)
+        hook_calls = []
+
+        def probe(free):
+            if manager.lock.acquire(timeout=0.5):
+                manager.lock.release()
+                free.append(True)
+
+        def hook(session_id, session, reason):
+            free = []
+            thread = threading.Thread(target=probe, args=(free,))
+            thread.start()
+            thread.join()
+            hook_calls.append((session_id, reason, bool(free)))
+
+        manager.add_eviction_hook(hook)
+        with mock.patch.object(app, "SESSION_SWEEP_INTERVAL", 0):
+            manager.add_message("old", "scammer", "hello", 1)
+            time.sleep(0.01)
+            manager.add_message("new", "scammer", "hello", 2)   # creating it sweeps "old"
+
+        self.assertEqual(manager.get_turn_count("new"), 1)
+        self.assertEqual(hook_calls, [("old", "ttl", True)])
+
+
+if __name__ == "__main__":
+    unittest.main()
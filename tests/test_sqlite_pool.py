@@ -0,0 +1,81 @@
+"""SQLitePool: bounded connections shared across threads, no per-thread (per-greenlet) connections"""
+
+import os
+import sqlite3
+import threading
+import time
+import unittest
+
+from support import TMP_DIR, load_app
+
+app = load_app()
+
+
+class SQLitePoolTest(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(TMP_DIR, f"pool-{self.id()}.db")
+
+    def test_short_lived_threads_reuse_the_pool(self):
+        store = app.SQLiteSessionStore(self.path)
+        threads = [threading.Thread(target=store.create, args=(f"s{i}", 1.0)) for i in range(50)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertLessEqual(store.pool.opened, store.pool.size)
+        self.assertEqual(len(store.pool.idle), store.pool.opened)
+        self.assertIsNotNone(store.load("s49"))
+
+    def test_waiters_are_served_in_turn(self):
+        pool = app.SQLitePool(self.path, size=1)
+        order = []
+        with pool.connection():
+            threads = []
+            for i in range(5):
+                thread = threading.Thread(target=lambda i=i: self._use(pool, order, i))
+                thread.start()
+                self.assertTrue(self._wait_for(lambda: len(pool.waiters) == i + 1))
+                threads.append(thread)
+        for thread in threads:
+            thread.join()
+        self.assertEqual(order, list(range(5)))
+        self.assertEqual(pool.opened, 1)
+
+    def test_open_transaction_is_rolled_back_on_error(self):
+        pool = app.SQLitePool(self.path, size=1)
+        with pool.connection() as conn:
+            conn.execute("CREATE TABLE t (x INTEGER)")
+        with self.assertRaises(RuntimeError):
+            with pool.connection() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute("INSERT INTO t VALUES (1)")
+                raise RuntimeError("boom")
+        with pool.connection() as conn:
+            self.assertFalse(conn.in_transaction)
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM t").fetchone()[0], 0)
+        # The write lock was released: another connection can write
+        other = sqlite3.connect(self.path, timeout=0.1)
+        other.execute("INSERT INTO t VALUES (2)")
+        other.commit()
+        other.close()
+        pool.close()
+        self.assertEqual(pool.opened, 0)
+
+    @staticmethod
+    def _use(pool, order, i):
+        with pool.connection() as conn:
+            conn.execute("SELECT 1")
+            order.append(i)
+
+    @staticmethod
+    def _wait_for(condition, timeout=5.0):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if condition():
+                return True
+            time.sleep(0.01)
+        return False
+
+
+if __name__ == "__main__":
+    unittest.main()